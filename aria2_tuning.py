@@ -0,0 +1,261 @@
+import sqlite3
+import statistics
+import threading
+import time
+from urllib.parse import urlparse
+
+THROUGHPUT_DB = "throughput.db"
+MIB = 1024 * 1024
+# What every download used before tuning: the whole per-job connection budget
+# and aria2c's 1 MiB minimum piece.
+STATIC_MIN_SPLIT_SIZE = MIB
+# Roughly how much of a file one connection should get; smaller files use
+# fewer connections, since opening one costs more than it gains.
+BYTES_PER_CONNECTION = 8 * MIB
+# Largest -k given to aria2c. Each connection still gets several pieces, so a
+# slow connection's share can be taken over by the others.
+MAX_MIN_SPLIT_SIZE = 64 * MIB
+PIECES_PER_CONNECTION = 4
+# Measurements shorter than this say more about latency than about throughput.
+MIN_SAMPLE_BYTES = MIB
+MIN_SAMPLE_SECONDS = 2.0
+SAMPLES_PER_HOST = 50
+# A download slower than this fraction of the host's best known speed is
+# retuned, once it has run for RETUNE_AFTER seconds.
+SHORTFALL_RATIO = 0.5
+RETUNE_AFTER = 10
+
+
+def media_host(info):
+    """The site aria2c fetches info's media from, or None if info has no media URL.
+
+    CDNs spread downloads over numbered nodes (rr3---sn-abc.googlevideo.com),
+    so only the domain they belong to is kept: the last two labels, or three
+    under a short second-level label such as co.uk.
+    """
+    formats = info.get('requested_formats') or info.get('formats') or [info]
+    url = next((f.get('url') for f in formats if f.get('url')), None)
+    host = (urlparse(url).hostname or "").lower() if url else ""
+    if not host or host.replace(".", "").isdigit() or ":" in host:
+        # An IP address (or nothing) is kept as it is.
+        return host or None
+    labels = host.split(".")
+    if len(labels) < 2:
+        return host
+    keep = 3 if len(labels) > 2 and len(labels[-2]) <= 3 else 2
+    return ".".join(labels[-keep:])
+
+
+def aria2_args(plan):
+    """aria2c command line options for a plan."""
+    return ["-x", str(plan["connections"]), "-s", str(plan["connections"]),
+            "-k", f"{plan['min_split_size'] // MIB}M"]
+
+
+def aria2_options(plan):
+    """The same settings as aria2 RPC options."""
+    return {"max-connection-per-server": str(plan["connections"]), "split": str(plan["connections"]),
+            "min-split-size": f"{plan['min_split_size'] // MIB}M"}
+
+
+def static_plan(max_connections, reason="tuning disabled"):
+    return {"connections": max_connections, "min_split_size": STATIC_MIN_SPLIT_SIZE, "reason": reason,
+            "tuned": False}
+
+
+class ThroughputMeter:
+    """Turns a job's downloaded_bytes progress into bytes per second.
+
+    Counters that go back down are a new file (video, then audio) and are
+    picked up from their new value.
+    """
+
+    def __init__(self):
+        self.bytes = 0
+        self._last = None
+        self._started = None
+        self._updated = None
+
+    def update(self, downloaded_bytes):
+        now = time.monotonic()
+        if self._last is not None and downloaded_bytes >= self._last:
+            self.bytes += downloaded_bytes - self._last
+        if self._started is None:
+            self._started = now
+        self._last = downloaded_bytes
+        self._updated = now
+
+    @property
+    def seconds(self):
+        return self._updated - self._started if self._started is not None else 0.0
+
+    @property
+    def speed(self):
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def is_usable(self):
+        return self.bytes >= MIN_SAMPLE_BYTES and self.seconds >= MIN_SAMPLE_SECONDS
+
+
+class ThroughputHistory:
+    """Measured speed per host and aria2c setting, in a WAL-mode SQLite table.
+
+    Only the newest SAMPLES_PER_HOST samples of each host are kept, so old
+    measurements age out as a CDN changes its behaviour.
+    """
+
+    def __init__(self, path=THROUGHPUT_DB):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS samples (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                host TEXT NOT NULL,
+                connections INTEGER NOT NULL,
+                min_split_size INTEGER NOT NULL,
+                bytes INTEGER NOT NULL,
+                seconds REAL NOT NULL,
+                tuned INTEGER NOT NULL,
+                reason TEXT,
+                recorded_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_samples_host ON samples (host, id);
+        """)
+        self._conn.commit()
+
+    def add(self, host, plan, bytes_, seconds):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO samples (host, connections, min_split_size, bytes, seconds, tuned, reason, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (host, plan["connections"], plan["min_split_size"], int(bytes_), seconds, int(plan["tuned"]),
+                 plan.get("reason"), time.time()))
+            self._conn.execute(
+                "DELETE FROM samples WHERE host = ? AND id NOT IN "
+                "(SELECT id FROM samples WHERE host = ? ORDER BY id DESC LIMIT ?)",
+                (host, host, SAMPLES_PER_HOST))
+            self._conn.commit()
+
+    def samples(self, host=None):
+        """Samples as dicts with a speed field, newest first; all hosts when host is None."""
+        query = "SELECT * FROM samples" + (" WHERE host = ?" if host else "") + " ORDER BY id DESC"
+        with self._lock:
+            rows = self._conn.execute(query, (host,) if host else ()).fetchall()
+        return [dict(row, speed=row["bytes"] / row["seconds"]) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ConnectionTuner:
+    """Chooses aria2c's -x/-s/-k for a download from its size and the host's history.
+
+    Without history the connection count follows the expected file size. With
+    history it starts from the connection count that has been fastest on that
+    host and tries the neighbouring counts (half and double) once each, so it
+    settles on whatever the CDN rewards: a host that throttles per connection
+    climbs towards the per-job budget, one that penalises many connections
+    drops back. Every choice is printed with its reason and stored with the
+    measurement, and report() compares tuned speeds with the static setting.
+    """
+
+    def __init__(self, history):
+        self.history = history
+
+    def _speeds_by_connections(self, host):
+        speeds = {}
+        for sample in self.history.samples(host):
+            speeds.setdefault(sample["connections"], []).append(sample["speed"])
+        return {connections: statistics.median(values) for connections, values in speeds.items()}
+
+    def expected_speed(self, host):
+        """The host's best median speed so far, or None without history."""
+        speeds = self._speeds_by_connections(host)
+        return max(speeds.values()) if speeds else None
+
+    def choose(self, host, filesize, max_connections):
+        """The plan for the next download from host; filesize may be None."""
+        filesize = int(filesize) if filesize else None
+        size_cap = max(1, filesize // BYTES_PER_CONNECTION) if filesize else max_connections
+        cap = max(1, min(max_connections, size_cap))
+        speeds = {c: s for c, s in self._speeds_by_connections(host).items() if c <= cap}
+        if not speeds:
+            connections = cap
+            reason = f"no history, sized for {filesize // MIB} MiB" if filesize else "no history or size"
+        else:
+            # On a tie the fewer connections win; they are gentler on the host.
+            best = max(speeds, key=lambda c: (speeds[c], -c))
+            up, down = min(cap, best * 2), max(1, best // 2)
+            if best == max(speeds) and up not in speeds:
+                connections, reason = up, f"{best} connections fastest so far, trying {up}"
+            elif best == min(speeds) and down not in speeds:
+                connections, reason = down, f"{best} connections fastest so far, trying {down}"
+            else:
+                connections = best
+                reason = f"{best} connections fastest at {speeds[best] / MIB:.1f} MiB/s"
+        return self._plan(host, connections, filesize, reason)
+
+    def retune(self, host, plan, filesize, measured_speed, max_connections):
+        """A new plan for a download running at measured_speed, or None if it is fast enough.
+
+        When the host has a known better connection count that is used;
+        otherwise many connections are halved (the CDN may penalise them) and
+        few are doubled (it may throttle each one).
+        """
+        expected = self.expected_speed(host)
+        if not expected or measured_speed >= SHORTFALL_RATIO * expected:
+            return None
+        speeds = self._speeds_by_connections(host)
+        best = max(speeds, key=speeds.get)
+        if best != plan["connections"]:
+            connections = best
+        elif plan["connections"] >= max_connections // 2 and plan["connections"] > 1:
+            connections = plan["connections"] // 2
+        else:
+            connections = min(max_connections, plan["connections"] * 2)
+        if connections == plan["connections"]:
+            return None
+        reason = (f"running at {measured_speed / MIB:.1f} MiB/s, expected {expected / MIB:.1f} MiB/s "
+                  f"with {best} connections")
+        return self._plan(host, connections, filesize, reason)
+
+    def _plan(self, host, connections, filesize, reason):
+        if filesize:
+            piece = filesize // (connections * PIECES_PER_CONNECTION) // MIB * MIB
+            min_split_size = max(STATIC_MIN_SPLIT_SIZE, min(MAX_MIN_SPLIT_SIZE, piece))
+        else:
+            min_split_size = STATIC_MIN_SPLIT_SIZE
+        plan = {"connections": connections, "min_split_size": min_split_size, "reason": reason, "tuned": True}
+        print(f"aria2c tuning for {host}: -x {connections} -k {min_split_size // MIB}M ({reason})")
+        return plan
+
+    def record(self, host, plan, meter):
+        """Stores what a download achieved with plan, if it ran long enough to tell."""
+        if host and meter.is_usable():
+            self.history.add(host, plan, meter.bytes, meter.seconds)
+
+    def report(self, static_connections):
+        """Per host: median speed with the static setting and with tuning, and the gain."""
+        hosts = {}
+        for sample in self.history.samples():
+            static = (sample["connections"] == static_connections and
+                      sample["min_split_size"] == STATIC_MIN_SPLIT_SIZE)
+            group = hosts.setdefault(sample["host"], {"static": [], "tuned": []})
+            group["static" if static or not sample["tuned"] else "tuned"].append(sample["speed"])
+
+        report = {}
+        for host, group in hosts.items():
+            static = statistics.median(group["static"]) if group["static"] else None
+            tuned = statistics.median(group["tuned"]) if group["tuned"] else None
+            report[host] = {
+                "static_speed": static,
+                "tuned_speed": tuned,
+                "gain": tuned / static - 1 if static and tuned else None,
+                "samples": len(group["static"]) + len(group["tuned"]),
+                "best_connections": max(self._speeds_by_connections(host).items(), key=lambda kv: kv[1])[0],
+            }
+        return report
@@ -0,0 +1,201 @@
+import json
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+SESSION_FILE = "aria2.session"
+STATUS_KEYS = ["gid", "status", "totalLength", "completedLength", "downloadSpeed", "errorCode", "errorMessage",
+               "files"]
+
+
+class Aria2RPCError(Exception):
+    pass
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Aria2Daemon:
+    """A single long-lived aria2c controlled over JSON-RPC.
+
+    Unfinished downloads are written to the session file and reloaded on the
+    next start, so a restart picks up where the previous run stopped.
+    """
+
+    def __init__(self, aria2c_path, session_file=SESSION_FILE, max_connections=16, poll_interval=0.5):
+        self.aria2c_path = aria2c_path
+        self.session_file = os.path.abspath(session_file)
+        self.max_connections = max_connections
+        self.poll_interval = poll_interval
+        self.secret = secrets.token_hex(16)
+        self.port = None
+        self.process = None
+        self._lock = threading.Lock()
+        self._watchers = {}
+        self._poll_thread = None
+
+    @property
+    def rpc_url(self):
+        return f"http://127.0.0.1:{self.port}/jsonrpc"
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self, timeout=10):
+        with self._lock:
+            if self.is_running():
+                return
+            if not os.path.exists(self.session_file):
+                open(self.session_file, "a").close()
+
+            self.port = _free_port()
+            cmd = [
+                self.aria2c_path,
+                "--enable-rpc",
+                "--rpc-listen-all=false",
+                f"--rpc-listen-port={self.port}",
+                f"--rpc-secret={self.secret}",
+                f"--input-file={self.session_file}",
+                f"--save-session={self.session_file}",
+                "--save-session-interval=10",
+                f"--stop-with-process={os.getpid()}",
+                "--continue=true",
+                "--auto-file-renaming=false",
+                f"--max-connection-per-server={self.max_connections}",
+                "--min-split-size=1M",
+                "--console-log-level=warn",
+            ]
+            kwargs = {'stdout': subprocess.DEVNULL, 'stderr': subprocess.DEVNULL}
+            if sys.platform != "win32":
+                kwargs['start_new_session'] = True
+            self.process = subprocess.Popen(cmd, **kwargs)
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                self.call("aria2.getVersion")
+                return
+            except (Aria2RPCError, OSError):
+                if not self.is_running():
+                    break
+                time.sleep(0.1)
+        self.stop()
+        raise Aria2RPCError("aria2c RPC daemon did not start")
+
+    def stop(self):
+        process, self.process = self.process, None
+        if process is None or process.poll() is not None:
+            return
+        try:
+            self._call(process, "aria2.shutdown")
+            process.wait(timeout=5)
+        except (Aria2RPCError, OSError, subprocess.TimeoutExpired):
+            process.terminate()
+
+    def call(self, method, *params):
+        return self._call(self.process, method, *params)
+
+    def _call(self, process, method, *params):
+        if process is None:
+            raise Aria2RPCError("aria2c RPC daemon is not running")
+        payload = json.dumps({
+            "jsonrpc": "2.0",
+            "id": secrets.token_hex(4),
+            "method": method,
+            "params": [f"token:{self.secret}", *params],
+        }).encode("utf-8")
+        request = urllib.request.Request(self.rpc_url, data=payload, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                reply = json.load(response)
+        except urllib.error.HTTPError as e:
+            # aria2 reports RPC errors with a 4xx status and a JSON body.
+            reply = json.load(e)
+        if "error" in reply:
+            raise Aria2RPCError(reply["error"].get("message", "unknown aria2 error"))
+        return reply["result"]
+
+    def add_uri(self, url, directory, filename, headers=None, options=None):
+        opts = {"dir": directory, "out": filename}
+        if headers:
+            opts["header"] = [f"{key}: {value}" for key, value in headers.items()]
+        if options:
+            opts.update(options)
+        return self.call("aria2.addUri", [url], opts)
+
+    def find_by_path(self, path):
+        """Returns the gid of an unfinished download writing to path, e.g. one restored from the session."""
+        path = os.path.abspath(path)
+        candidates = self.call("aria2.tellActive", ["gid", "files"])
+        candidates += self.call("aria2.tellWaiting", 0, 1000, ["gid", "files"])
+        for status in candidates:
+            for file in status.get("files", []):
+                if file.get("path") and os.path.abspath(file["path"]) == path:
+                    return status["gid"]
+        return None
+
+    def remove(self, gid):
+        try:
+            self.call("aria2.remove", gid)
+        except Aria2RPCError:
+            pass
+
+    def change_options(self, gid, options):
+        """Changes options of a queued or running download.
+
+        aria2c restarts a running download for most options, picking up from
+        its control file. Downloads that already finished are left alone.
+        """
+        try:
+            self.call("aria2.changeOption", gid, options)
+        except Aria2RPCError:
+            pass
+
+    def set_limit(self, gid, rate):
+        """Changes the download limit of gid in bytes/s while it runs; None removes it."""
+        self.change_options(gid, {"max-download-limit": str(rate or 0)})
+
+    def watch(self, gid, callback):
+        """Calls callback(status) from the poller until the download stops.
+
+        All watched downloads share one aria2.tellActive call per tick; only
+        downloads that are no longer active are looked up individually.
+        """
+        with self._lock:
+            self._watchers[gid] = callback
+            if self._poll_thread is None or not self._poll_thread.is_alive():
+                self._poll_thread = threading.Thread(target=self._poll_loop, daemon=True)
+                self._poll_thread.start()
+
+    def unwatch(self, gid):
+        with self._lock:
+            self._watchers.pop(gid, None)
+
+    def _poll_loop(self):
+        while True:
+            with self._lock:
+                watchers = dict(self._watchers)
+                if not watchers:
+                    self._poll_thread = None
+                    return
+            try:
+                active = {status["gid"]: status for status in self.call("aria2.tellActive", STATUS_KEYS)}
+                for gid, callback in watchers.items():
+                    status = active.get(gid) or self.call("aria2.tellStatus", gid, STATUS_KEYS)
+                    if status["status"] not in ("active", "waiting", "paused"):
+                        self.unwatch(gid)
+                    callback(status)
+            except (Aria2RPCError, OSError) as e:
+                for gid, callback in watchers.items():
+                    self.unwatch(gid)
+                    callback({"gid": gid, "status": "error", "errorMessage": str(e)})
+            time.sleep(self.poll_interval)
@@ -0,0 +1,147 @@
+import threading
+import time
+from datetime import datetime
+
+
+def fair_shares(total, caps):
+    """Splits total bytes/s between jobs, never giving a job more than its cap.
+
+    caps maps each job to its own limit or None. Jobs capped below an even
+    share keep their cap and the rest is split again between the others.
+    With total None (unlimited) every job simply gets its cap.
+    """
+    if total is None:
+        return dict(caps)
+    shares = {}
+    remaining = dict(caps)
+    while remaining:
+        share = total / len(remaining)
+        capped = {key: cap for key, cap in remaining.items() if cap is not None and cap <= share}
+        if not capped:
+            shares.update({key: share for key in remaining})
+            break
+        for key, cap in capped.items():
+            shares[key] = cap
+            total -= cap
+            del remaining[key]
+    return {key: int(share) for key, share in shares.items()}
+
+
+def _minutes(hhmm):
+    hours, minutes = hhmm.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def scheduled_limit(schedule, now):
+    """The rate_limit (KiB/s) of the first schedule rule covering now, or None.
+
+    A rule is {"from": "09:00", "to": "18:00", "rate_limit": 2048}; a rule
+    whose "from" is later than its "to" runs across midnight. A rate_limit
+    of 0 means unlimited for that period.
+    """
+    minute = now.hour * 60 + now.minute
+    for rule in schedule or []:
+        start, end = _minutes(rule["from"]), _minutes(rule["to"])
+        if start <= minute < end or (start > end and (minute >= start or minute < end)):
+            return rule.get("rate_limit", 0)
+    return None
+
+
+class BandwidthManager:
+    """Keeps the combined download rate under the configured ceiling.
+
+    The ceiling comes from the "rate_schedule" rules in settings, falling back
+    to "rate_limit" (both KiB/s, 0 = unlimited), and is re-evaluated every
+    interval seconds, so schedule changes reach jobs that are already running.
+    It is split fairly between running jobs, respecting each job's own cap.
+
+    A job registered with apply(rate) has its limit changed live whenever its
+    share moves. A job without one (a separate yt-dlp process) cannot be
+    changed after it starts, so it is given a fixed share of
+    ceiling / max_concurrent_downloads, which keeps the total under the
+    ceiling however many jobs run.
+    """
+
+    def __init__(self, settings, interval=1.0):
+        self.settings = settings
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._thread = None
+
+    def ceiling(self, now=None):
+        """The current global limit in bytes/s, or None when unlimited."""
+        limit = scheduled_limit(self.settings.get("rate_schedule"), now or datetime.now())
+        if limit is None:
+            limit = self.settings.get("rate_limit", 0)
+        return limit * 1024 if limit else None
+
+    def is_limited(self):
+        """True if any limit is configured, even if none applies right now."""
+        return bool(self.settings.get("rate_limit") or self.settings.get("rate_schedule"))
+
+    def register(self, job_id, cap=None, apply=None):
+        """Adds a running job and returns its initial limit in bytes/s, or None.
+
+        cap is the job's own limit in KiB/s.
+        """
+        with self._lock:
+            entry = {"cap": cap * 1024 if cap else None, "apply": apply, "allocated": None}
+            self._jobs[job_id] = entry
+            if apply is None:
+                entry["allocated"] = self._fixed_share(entry["cap"])
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self.rebalance()
+        return entry["allocated"]
+
+    def set_cap(self, job_id, cap):
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if entry is None:
+                return
+            entry["cap"] = cap * 1024 if cap else None
+        self.rebalance()
+
+    def unregister(self, job_id):
+        with self._lock:
+            removed = self._jobs.pop(job_id, None)
+        if removed is not None:
+            self.rebalance()
+
+    def allocations(self):
+        with self._lock:
+            return {job_id: entry["allocated"] for job_id, entry in self._jobs.items()}
+
+    def _fixed_share(self, cap):
+        # Caller must hold self._lock.
+        ceiling = self.ceiling()
+        if ceiling is None:
+            return cap
+        share = ceiling // max(1, int(self.settings.get("max_concurrent_downloads", 1)))
+        return min(share, cap) if cap else share
+
+    def rebalance(self):
+        ceiling = self.ceiling()
+        changed = []
+        with self._lock:
+            live = {job_id: entry for job_id, entry in self._jobs.items() if entry["apply"] is not None}
+            fixed = sum(entry["allocated"] or 0 for entry in self._jobs.values() if entry["apply"] is None)
+            if ceiling is not None:
+                ceiling = max(1024, ceiling - fixed)
+            shares = fair_shares(ceiling, {job_id: entry["cap"] for job_id, entry in live.items()})
+            for job_id, entry in live.items():
+                if shares[job_id] != entry["allocated"]:
+                    entry["allocated"] = shares[job_id]
+                    changed.append((entry["apply"], shares[job_id]))
+        for apply, rate in changed:
+            try:
+                apply(rate)
+            except Exception as e:
+                print(f"Could not change download limit: {e}")
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.rebalance()
@@ -0,0 +1,286 @@
+"""A stand-in for the yt-dlp binary that needs no network access and no extractors.
+
+It understands the options the engine passes: --get-title, --flat-playlist
+--dump-json, -J, and downloads with -f, -o, -x, --load-info-json,
+--progress-template and --print after_move. Every video has a video-only,
+an audio-only and a combined format; "a+b" selectors download two files and
+merge them, "a,b" download them separately, and files already on disk are
+not downloaded again, as with yt-dlp. Media URLs on a bench media server are
+really fetched, so throttling and latency apply. Any other URL is simulated
+at FAKE_YTDLP_RATE bytes/s. Progress is printed in yt-dlp's own formats: the
+template lines when --progress-template is given, "[download]  42.0% of ..."
+otherwise. Merging and audio extraction keep one core busy for
+FAKE_YTDLP_POSTPROCESS_SECONDS, like ffmpeg would.
+
+Environment:
+    FAKE_YTDLP_SIZE              bytes of a simulated download (default 4 MiB)
+    FAKE_YTDLP_RATE              bytes/s of a simulated download (default 8 MiB/s)
+    FAKE_YTDLP_PLAYLIST_SIZE     entries listed for a playlist URL (default 50)
+    FAKE_YTDLP_PROGRESS_INTERVAL seconds between progress lines (default 0, every block)
+    FAKE_YTDLP_PROBE_DELAY       seconds each extraction takes (default 0); skipped with --load-info-json
+    FAKE_YTDLP_POSTPROCESS_SECONDS CPU seconds per merge or conversion (default 0)
+"""
+import json
+import os
+import re
+import sys
+import time
+import urllib.request
+from urllib.parse import parse_qs, urlparse
+
+BLOCK_SIZE = 64 * 1024
+# Share of a video's size in its video-only format; the audio-only format has the rest.
+VIDEO_SHARE = 0.8
+FIELD_RE = re.compile(r"%\((\w+)\)s")
+PRINT_FIELDS_RE = re.compile(r"%\(\.\{([\w,]+)\}\)j")
+
+
+def _env(name, default):
+    return type(default)(os.environ.get(name, default))
+
+
+def _format(url, format_id, ext, size, **fields):
+    parsed = urlparse(url)
+    if parsed.path.startswith("/media/"):
+        # Each format is its own file on the media server.
+        name, _ = os.path.splitext(parsed.path)
+        url = parsed._replace(path=f"{name}.f{format_id}.{ext}", query=f"size={size}").geturl()
+    return dict({"format_id": format_id, "ext": ext, "url": url, "filesize": size,
+                 "protocol": "https" if parsed.scheme == "https" else "http"}, **fields)
+
+
+def video_info(url):
+    parsed = urlparse(url)
+    video_id = parse_qs(parsed.query).get("v", [os.path.splitext(os.path.basename(parsed.path))[0] or "video"])[0]
+    size = int(parse_qs(parsed.query).get("size", [_env("FAKE_YTDLP_SIZE", 4 * 1024 * 1024)])[0])
+    video_size = int(size * VIDEO_SHARE)
+    return {
+        "id": video_id,
+        "title": f"Benchmark video {video_id}",
+        "extractor_key": "Generic",
+        "webpage_url": url,
+        "duration": 60,
+        "_type": "video",
+        "formats": [
+            _format(url, "140", "m4a", size - video_size, vcodec="none", acodec="mp4a"),
+            _format(url, "137", "mp4", video_size, vcodec="avc1", acodec="none"),
+            _format(url, "18", "mp4", size, vcodec="avc1", acodec="mp4a"),
+        ],
+    }
+
+
+def _pick(formats, selector):
+    """The format one alternative of a -f selector stands for."""
+    by_id = {f["format_id"]: f for f in formats}
+    if selector in by_id:
+        return by_id[selector]
+    if selector.startswith("bestaudio"):
+        return by_id["140"]
+    if selector.startswith("bestvideo"):
+        return by_id["137"]
+    return by_id["18"]
+
+
+def select_formats(info, selector):
+    """A list of info dicts, one per file to produce, for a -f selector."""
+    formats = info["formats"]
+    results = []
+    for part in (selector or "best").split(","):
+        part = part.split("/")[0]
+        if "+" in part:
+            requested = [_pick(formats, sub) for sub in part.split("+")]
+            results.append(dict(info, requested_formats=requested, ext=requested[0]["ext"],
+                                format_id="+".join(f["format_id"] for f in requested),
+                                filesize=sum(f["filesize"] for f in requested)))
+        else:
+            single = dict(info, **_pick(formats, part))
+            single.pop("requested_formats", None)
+            results.append(single)
+    return results
+
+
+def parse_args(argv):
+    options = {"url": None, "output": "%(title)s [%(id)s].%(ext)s", "progress_templates": {}, "prints": {}}
+    flags = set()
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg in ("-o", "--output"):
+            options["output"] = argv[i + 1]
+            i += 1
+        elif arg == "--progress-template":
+            kind, _, template = argv[i + 1].partition(":")
+            options["progress_templates"][kind] = template
+            i += 1
+        elif arg == "--print":
+            kind, _, template = argv[i + 1].partition(":")
+            options["prints"][kind] = template
+            i += 1
+        elif arg in ("-f", "--format", "--merge-output-format", "--audio-format", "--external-downloader",
+                     "--external-downloader-args", "--limit-rate", "--load-info-json"):
+            options[arg.lstrip("-")] = argv[i + 1]
+            i += 1
+        elif arg.startswith("-"):
+            flags.add(arg)
+        else:
+            options["url"] = arg
+        i += 1
+    return options, flags
+
+
+def format_bytes(num):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if num < 1024:
+            return f"{num:.2f}{unit}"
+        num /= 1024
+    return f"{num:.2f}TiB"
+
+
+def print_progress(options, status):
+    template = options["progress_templates"].get("download")
+    if template:
+        print(template.replace("%(progress)j", json.dumps(status)), flush=True)
+        return
+    total = status["total_bytes"]
+    percent = status["downloaded_bytes"] / total * 100 if total else 0
+    eta = status.get("eta") or 0
+    print(f"[download] {percent:5.1f}% of {format_bytes(total):>10} at {format_bytes(status['speed']):>10}/s "
+          f"ETA {int(eta) // 60:02d}:{int(eta) % 60:02d}", flush=True)
+
+
+def prepare_filename(info, options):
+    ext = options.get("merge-output-format") if info.get("requested_formats") else None
+    return FIELD_RE.sub(lambda m: str(dict(info, ext=ext or info["ext"]).get(m.group(1), "NA")), options["output"])
+
+
+def fetch(fmt, filepath, options):
+    if os.path.exists(filepath):
+        print(f"[download] {filepath} has already been downloaded", flush=True)
+        return
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    total = fmt["filesize"]
+    interval = _env("FAKE_YTDLP_PROGRESS_INTERVAL", 0.0)
+    started = last_print = time.monotonic()
+    downloaded = 0
+    print(f"[download] Destination: {filepath}", flush=True)
+
+    if urlparse(fmt["url"]).path.startswith("/media/"):
+        blocks = urllib.request.urlopen(fmt["url"], timeout=30)
+        rate = None
+    else:
+        blocks = None
+        rate = _env("FAKE_YTDLP_RATE", 8 * 1024 * 1024)
+
+    with open(filepath + ".part", "wb") as f:
+        while downloaded < total:
+            if blocks is not None:
+                block = blocks.read(BLOCK_SIZE)
+                if not block:
+                    break
+            else:
+                block = b"\0" * min(BLOCK_SIZE, total - downloaded)
+                delay = (downloaded + len(block)) / rate - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            f.write(block)
+            downloaded += len(block)
+            now = time.monotonic()
+            if now - last_print >= interval or downloaded >= total:
+                last_print = now
+                speed = downloaded / max(now - started, 1e-6)
+                print_progress(options, {
+                    "status": "finished" if downloaded >= total else "downloading",
+                    "downloaded_bytes": downloaded, "total_bytes": total, "speed": speed,
+                    "eta": (total - downloaded) / speed, "elapsed": now - started,
+                    "filename": filepath, "tmpfilename": filepath + ".part",
+                })
+    if blocks is not None:
+        blocks.close()
+    os.replace(filepath + ".part", filepath)
+
+
+def postprocess(options, postprocessor, sources, target):
+    """Spends FAKE_YTDLP_POSTPROCESS_SECONDS of CPU, then joins sources into target."""
+    template = options["progress_templates"].get("postprocess")
+    if template:
+        print(template.replace("%(progress)j", json.dumps({"status": "started", "postprocessor": postprocessor})),
+              file=sys.stderr, flush=True)
+    deadline = time.process_time() + _env("FAKE_YTDLP_POSTPROCESS_SECONDS", 0.0)
+    while time.process_time() < deadline:
+        sum(range(10000))
+    with open(target + ".temp", "wb") as out:
+        for source in sources:
+            with open(source, "rb") as f:
+                out.write(f.read())
+    os.replace(target + ".temp", target)
+    for source in sources:
+        if source != target:
+            os.remove(source)
+    if template:
+        print(template.replace("%(progress)j", json.dumps({"status": "finished", "postprocessor": postprocessor})),
+              file=sys.stderr, flush=True)
+
+
+def download(info, options, flags):
+    filepath = prepare_filename(info, options)
+    if info.get("requested_formats"):
+        parts = [f"{os.path.splitext(filepath)[0]}.f{f['format_id']}.{f['ext']}" for f in info["requested_formats"]]
+        for fmt, part in zip(info["requested_formats"], parts):
+            fetch(fmt, part, options)
+        print(f'[Merger] Merging formats into "{filepath}"', flush=True)
+        postprocess(options, "Merger", parts, filepath)
+    else:
+        fetch(info, filepath, options)
+        if "-x" in flags:
+            audio_path = f"{os.path.splitext(filepath)[0]}.{options.get('audio-format', 'mp3')}"
+            postprocess(options, "ExtractAudio", [filepath], audio_path)
+            filepath = audio_path
+
+    template = options["prints"].get("after_move")
+    if template:
+        done = dict(info, filepath=filepath, filesize_approx=None)
+        print(PRINT_FIELDS_RE.sub(lambda m: json.dumps({k: done.get(k) for k in m.group(1).split(",")}), template),
+              flush=True)
+    return 0
+
+
+def main(argv):
+    options, flags = parse_args(argv)
+    if "--version" in flags:
+        print("2099.01.01 (benchmark stub)")
+        return 0
+    if options.get("load-info-json"):
+        with open(options["load-info-json"], encoding="utf-8") as f:
+            info = json.load(f)
+        for selected in select_formats(info, options.get("f") or options.get("format")):
+            download(selected, options, flags)
+        return 0
+    if not options["url"]:
+        print("ERROR: no URL given", file=sys.stderr)
+        return 2
+
+    if "--flat-playlist" in flags and "list" in parse_qs(urlparse(options["url"]).query):
+        base = options["url"].split("?")[0]
+        for index in range(_env("FAKE_YTDLP_PLAYLIST_SIZE", 50)):
+            print(json.dumps({"id": f"v{index}", "title": f"Benchmark video v{index}",
+                              "url": f"{base}?v=v{index}", "_type": "url"}), flush=True)
+        return 0
+
+    time.sleep(_env("FAKE_YTDLP_PROBE_DELAY", 0.0))
+    info = video_info(options["url"])
+    if "--get-title" in flags:
+        print(info["title"])
+        return 0
+    selected = select_formats(info, options.get("f") or options.get("format"))
+    if "-J" in flags or "--dump-json" in flags:
+        info = selected[0]
+        info["filename"] = prepare_filename(info, options)
+        print(json.dumps(info))
+        return 0
+    for info in selected:
+        download(info, options, flags)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
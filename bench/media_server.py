@@ -0,0 +1,122 @@
+"""A local HTTP server with synthetic media files, for benchmarks.
+
+GET /media/<name>.<ext>?size=<bytes> returns size bytes of deterministic
+data after latency seconds, throttled to rate bytes/s per connection. Range
+requests are honoured, so resumed and segmented downloads behave as they
+would against a real CDN.
+
+    python bench/media_server.py --port 8765 --latency 0.05 --rate 2097152
+"""
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_SIZE = 4 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+# One block of pseudo-random bytes, repeated; compresses badly and costs nothing to produce.
+PATTERN = bytes((i * 7919 + 13) % 251 for i in range(CHUNK_SIZE))
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _parse(self):
+        parsed = urlparse(self.path)
+        if not parsed.path.startswith("/media/"):
+            self.send_error(404)
+            return None
+        size = int(parse_qs(parsed.query).get("size", [self.server.default_size])[0])
+        start, end = 0, size - 1
+        header = self.headers.get("Range")
+        if header and header.startswith("bytes="):
+            first, _, last = header[len("bytes="):].partition("-")
+            start = int(first) if first else max(0, size - int(last))
+            end = int(last) if first and last else size - 1
+            if start >= size:
+                self.send_error(416)
+                return None
+        return size, start, min(end, size - 1), bool(header)
+
+    def _send_headers(self, size, start, end, partial):
+        time.sleep(self.server.latency)
+        self.send_response(206 if partial else 200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        if partial:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+
+    def do_HEAD(self):
+        parsed = self._parse()
+        if parsed:
+            self._send_headers(*parsed)
+
+    def do_GET(self):
+        parsed = self._parse()
+        if not parsed:
+            return
+        size, start, end, partial = parsed
+        self._send_headers(size, start, end, partial)
+        position = start
+        started = time.monotonic()
+        try:
+            while position <= end:
+                offset = position % CHUNK_SIZE
+                chunk = PATTERN[offset:offset + min(CHUNK_SIZE - offset, end - position + 1)]
+                self.wfile.write(chunk)
+                position += len(chunk)
+                if self.server.rate:
+                    # Sleep until the average since the first byte is back at the rate.
+                    delay = (position - start) / self.server.rate - (time.monotonic() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class MediaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, rate=None, default_size=DEFAULT_SIZE):
+        super().__init__((host, port), MediaHandler)
+        self.latency = latency
+        self.rate = rate
+        self.default_size = default_size
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def media_url(self, name, size=None):
+        return f"{self.base_url}/media/{name}" + (f"?size={size}" if size else "")
+
+    def start(self):
+        """Serves on a daemon thread and returns self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each response")
+    parser.add_argument("--rate", type=int, default=0, help="bytes/s per connection, 0 for unthrottled")
+    args = parser.parse_args()
+    server = MediaServer(args.host, args.port, args.latency, args.rate or None)
+    print(f"Serving {server.base_url}/media/<name>.mp4?size=<bytes>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
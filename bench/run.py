@@ -0,0 +1,382 @@
+"""Offline benchmarks for the download queue, the event pump and the history store.
+
+Everything runs in a scratch directory against bench/fake_ytdlp.py and a
+local throttled media server, so no network access is needed and the
+user's own history and settings are never touched. Results are written as
+JSON with stable keys, so two runs (say, before and after a commit) can be
+compared:
+
+    python bench/run.py --out before.json
+    python bench/run.py --out after.json
+    python bench/run.py --compare before.json after.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import engine as engine_module  # noqa: E402
+from engine import DownloadEngine  # noqa: E402
+from history_store import HistoryStore  # noqa: E402
+from download_archive import DownloadArchive  # noqa: E402
+from media_server import MediaServer  # noqa: E402
+import synth_history  # noqa: E402
+
+# Same as gui.PUMP_ACTIVE_INTERVAL (in seconds) and gui.HISTORY_PAGE_SIZE;
+# gui itself needs a display to import.
+UI_PUMP_INTERVAL = 0.05
+HISTORY_PAGE_SIZE = 200
+HISTORY_APPENDS = 200
+MIB = 1024 * 1024
+# How often MemorySampler reads /proc, in seconds. Children that start and
+# exit between two samples are not seen.
+MEMORY_SAMPLE_INTERVAL = 0.05
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def _distribution(values, scale=_ms):
+    if not values:
+        return None
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "mean": scale(statistics.fmean(values)),
+        "p50": scale(values[len(values) // 2]),
+        "p95": scale(values[min(len(values) - 1, int(len(values) * 0.95))]),
+        "max": scale(values[-1]),
+    }
+
+
+def _launcher(workdir):
+    """An executable that runs fake_ytdlp.py with this interpreter, for engine.YT_DLP_PATH."""
+    if sys.platform == "win32":
+        path = os.path.join(workdir, "yt-dlp.bat")
+        with open(path, "w") as f:
+            f.write(f'@"{sys.executable}" "{os.path.join(BENCH_DIR, "fake_ytdlp.py")}" %*\n')
+        return path
+    path = os.path.join(workdir, "yt-dlp")
+    with open(path, "w") as f:
+        f.write(f"#!{sys.executable}\nimport runpy, sys\nsys.argv[0] = {os.path.join(BENCH_DIR, 'fake_ytdlp.py')!r}\n"
+                f"runpy.run_path(sys.argv[0], run_name='__main__')\n")
+    os.chmod(path, 0o755)
+    return path
+
+
+def bench_queue(args, workdir):
+    """Queues args.jobs downloads and drains events the way the window's pump does."""
+    server = MediaServer(latency=args.latency, rate=args.rate * 1024 or None).start()
+    settings_path = os.path.join(workdir, "settings.json")
+    with open(settings_path, "w") as f:
+        json.dump({"download_dir": os.path.join(workdir, "downloads"), "max_concurrent_downloads": args.workers,
+                   "max_per_host": args.workers, "download_backend": "spawn", "extraction_engine": "binary",
+                   "aria2_tuning": False, "prefetch_lookahead": args.prefetch,
+                   "postprocess_pipeline": not args.no_pipeline, "postprocess_workers": args.postprocess_workers}, f)
+    engine_module.YT_DLP_PATH = _launcher(workdir)
+    os.environ["FAKE_YTDLP_PROBE_DELAY"] = str(args.probe_delay)
+    os.environ["FAKE_YTDLP_POSTPROCESS_SECONDS"] = str(args.postprocess_seconds)
+    engine = DownloadEngine(settings_path)
+
+    items = [engine.make_item(server.media_url(f"job{i}.mp4", args.size * MIB)) for i in range(args.jobs)]
+    started, finished, lags = {}, {}, []
+    failures = []
+    submitted_at = time.monotonic()
+    engine.submit(items)
+
+    done = False
+    while not done:
+        time.sleep(UI_PUMP_INTERVAL)
+        now = time.monotonic()
+        for msg in engine.queue.drain():
+            lags.append(now - msg["ts"])
+            if msg["type"] == "job_started":
+                started.setdefault(msg["job_id"], now)
+            elif msg["type"] == "video_done":
+                finished[msg["job_id"]] = now
+            elif msg["type"] == "job_failed":
+                failures.append(msg.get("error_message"))
+            elif msg["type"] in ("done", "cancelled") and not engine.is_busy():
+                done = True
+    stats = engine.queue.stats()
+    engine.shutdown()
+    server.shutdown()
+
+    elapsed = max(finished.values(), default=submitted_at) - submitted_at
+    return {
+        "jobs": args.jobs,
+        "completed": len(finished),
+        "failed": len(failures),
+        "errors": failures[:5],
+        "wall_s": round(elapsed, 3),
+        "jobs_per_min": round(len(finished) / elapsed * 60, 2) if elapsed else None,
+        "job_latency_ms": _distribution([t - submitted_at for t in finished.values()]),
+        "job_run_ms": _distribution([t - started[job_id] for job_id, t in finished.items() if job_id in started]),
+        "ui_event_lag_ms": _distribution(lags),
+        "events": {"put": stats["put"], "delivered": stats["delivered"], "coalesced": stats["coalesced"]},
+    }
+
+
+def bench_history(count, workdir):
+    """Import, startup and save costs of a history with count entries."""
+    json_path = synth_history.write(os.path.join(workdir, f"history-{count}.json"), count)
+    db_path = os.path.join(workdir, f"history-{count}.db")
+    result = {"json_bytes": os.path.getsize(json_path)}
+
+    store = HistoryStore(db_path)
+    t = time.perf_counter()
+    store.import_json(json_path)
+    result["import_ms"] = _ms(time.perf_counter() - t)
+    store.close()
+
+    # What a restart pays before the window can show anything.
+    t = time.perf_counter()
+    store = HistoryStore(db_path)
+    first_page = store.recent(HISTORY_PAGE_SIZE)
+    result["open_first_page_ms"] = _ms(time.perf_counter() - t)
+    t = time.perf_counter()
+    DownloadArchive(store, os.path.join(workdir, "archive.txt")).load()
+    result["archive_build_ms"] = _ms(time.perf_counter() - t)
+    t = time.perf_counter()
+    entries = store.all()
+    result["read_all_ms"] = _ms(time.perf_counter() - t)
+
+    appends = []
+    for entry in synth_history.entries(HISTORY_APPENDS, seed=count + 1):
+        t = time.perf_counter()
+        store.append(entry)
+        appends.append(time.perf_counter() - t)
+    result["append_ms"] = _distribution(appends)
+
+    # The cost of the old design, which rewrote the whole JSON file on every save.
+    t = time.perf_counter()
+    with open(os.path.join(workdir, "rewrite.json"), "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=4)
+    result["json_rewrite_ms"] = _ms(time.perf_counter() - t)
+    result["first_page_rows"] = len(first_page)
+    store.close()
+    return result
+
+
+def _status_kib(pid, field):
+    """A "<field>: <n> kB" line of /proc/<pid>/status, or None once the process is gone."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _cmdline(pid):
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _descendants(pid):
+    """Every live process below pid, found through the parent pid in /proc/<pid>/stat."""
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name in parentheses can contain spaces, so the fields are counted after it.
+        parent = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(parent, []).append(int(name))
+    found, pending = [], [pid]
+    while pending:
+        below = children.get(pending.pop(), [])
+        found += below
+        pending += below
+    return found
+
+
+class MemorySampler:
+    """Peak resident memory of this process and of the processes it starts while a phase runs.
+
+    RUSAGE_CHILDREN's ru_maxrss is the largest RSS any waited-for child had,
+    including what it inherited from this process when it was forked, so it
+    says little about yt-dlp or aria2c themselves. This polls /proc instead:
+    each child's own peak (VmHWM) and what all of them held at once. Linux
+    only; result() is None elsewhere.
+    """
+
+    def __init__(self, interval=MEMORY_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.supported = os.path.exists(f"/proc/{os.getpid()}/status")
+        self._stop = threading.Event()
+        self._thread = None
+        self._self_start = self._self_peak = 0
+        self._children_peak = 0
+        self._child_peaks = {}
+
+    def __enter__(self):
+        if self.supported:
+            self._self_start = self._self_peak = _status_kib(os.getpid(), "VmRSS") or 0
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            self._sample()
+            if self._stop.wait(self.interval):
+                return
+
+    def _sample(self):
+        self._self_peak = max(self._self_peak, _status_kib(os.getpid(), "VmRSS") or 0)
+        total = 0
+        own = _cmdline(os.getpid())
+        for pid in _descendants(os.getpid()):
+            if _cmdline(pid) == own:
+                # Forked but not exec'd yet: its figures are still this process's.
+                continue
+            rss, peak = _status_kib(pid, "VmRSS"), _status_kib(pid, "VmHWM")
+            if rss is None:
+                continue
+            total += rss
+            self._child_peaks[pid] = max(self._child_peaks.get(pid, 0), peak or rss)
+        self._children_peak = max(self._children_peak, total)
+
+    def result(self):
+        """MiB figures for the phase; self_growth is how far this process grew beyond where it started."""
+        if not self.supported:
+            return None
+        peaks = sorted(self._child_peaks.values())
+        return {
+            "self_peak_mib": round(self._self_peak / 1024, 1),
+            "self_growth_mib": round((self._self_peak - self._self_start) / 1024, 1),
+            "children_seen": len(peaks),
+            "children_peak_total_mib": round(self._children_peak / 1024, 1),
+            "child_peak_max_mib": round(peaks[-1] / 1024, 1) if peaks else 0,
+            "child_peak_median_mib": round(statistics.median(peaks) / 1024, 1) if peaks else 0,
+        }
+
+
+def _git(*git_args):
+    try:
+        return subprocess.check_output(["git", *git_args], cwd=REPO_DIR, text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(value, prefix=""):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _flatten(item, f"{prefix}{key}.")
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix[:-1], value
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = dict(_flatten(json.load(f)["results"]))
+    with open(new_path) as f:
+        new = dict(_flatten(json.load(f)["results"]))
+    width = max(len(key) for key in old.keys() | new.keys())
+    for key in sorted(old.keys() | new.keys()):
+        before, after = old.get(key), new.get(key)
+        change = f"{(after - before) / before * 100:+.1f}%" if before and after is not None else ""
+        print(f"{key:<{width}}  {before if before is not None else '-':>12}  "
+              f"{after if after is not None else '-':>12}  {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=20, help="downloads in the queue benchmark")
+    parser.add_argument("--workers", type=int, default=3, help="max_concurrent_downloads")
+    parser.add_argument("--size", type=int, default=4, help="MiB per download")
+    parser.add_argument("--rate", type=int, default=8192, help="KiB/s per connection, 0 for unthrottled")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds before each response")
+    parser.add_argument("--probe-delay", type=float, default=0.5, help="seconds the stub yt-dlp takes to extract")
+    parser.add_argument("--prefetch", type=int, default=3, help="prefetch_lookahead")
+    parser.add_argument("--postprocess-seconds", type=float, default=0.5, help="CPU seconds per merge")
+    parser.add_argument("--postprocess-workers", type=int, default=0, help="postprocess_workers")
+    parser.add_argument("--no-pipeline", action="store_true", help="merge inside the download slot")
+    parser.add_argument("--history-sizes", default="1000,10000,100000")
+    parser.add_argument("--skip-queue", action="store_true")
+    parser.add_argument("--skip-history", action="store_true")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two reports and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    workdir = tempfile.mkdtemp(prefix="downloader-bench-")
+    cwd = os.getcwd()
+    # The engine keeps its databases in the working directory.
+    os.chdir(workdir)
+    results = {}
+    try:
+        # Anything the engine prints goes to stderr, so stdout stays valid JSON.
+        # Memory is reported per phase: the queue runs yt-dlp processes, the history sizes only this one.
+        memory = {}
+        with contextlib.redirect_stdout(sys.stderr):
+            if not args.skip_history:
+                results["history"] = {}
+                for count in args.history_sizes.split(","):
+                    if count:
+                        with MemorySampler() as sampler:
+                            results["history"][count] = bench_history(int(count), workdir)
+                        memory[f"history_{count}"] = sampler.result()
+            if not args.skip_queue:
+                with MemorySampler() as sampler:
+                    results["queue"] = bench_queue(args, workdir)
+                memory["queue"] = sampler.result()
+        results["memory"] = memory
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": _git("rev-parse", "HEAD"),
+            "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 1 if results.get("queue", {}).get("failed") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""Writes a synthetic history.json in the legacy format, for benchmarks.
+
+The same count and seed always produce the same file.
+
+    python bench/synth_history.py 10000 history-10k.json
+"""
+import argparse
+import json
+import random
+import string
+from datetime import datetime, timedelta
+
+HOSTS = ["https://www.youtube.com/watch?v={}", "https://youtu.be/{}", "https://vimeo.com/{}"]
+WORDS = ["live", "tutorial", "review", "music", "video", "official", "trailer", "remix", "podcast", "episode",
+         "highlights", "interview", "how", "to", "best", "of", "2024", "full", "hd", "mix"]
+
+
+def entries(count, seed=0):
+    rng = random.Random(seed)
+    date = datetime(2020, 1, 1)
+    for index in range(count):
+        video_id = "".join(rng.choices(string.ascii_letters + string.digits + "-_", k=11))
+        date += timedelta(seconds=rng.randint(30, 3600))
+        entry = {
+            "url": rng.choice(HOSTS).format(video_id),
+            "title": " ".join(rng.choices(WORDS, k=rng.randint(3, 9))).title(),
+            "date": date.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        if index % 3:
+            entry["filepath"] = f"/downloads/{entry['title']} [{video_id}].mp4"
+        yield entry
+
+
+def write(path, count, seed=0):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(list(entries(count, seed)), f, indent=4)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("count", type=int)
+    parser.add_argument("path")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write(args.path, args.count, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""Coordinator and worker roles for downloading one queue on several machines.
+
+The coordinator keeps the whole queue, history and API of a normal engine,
+but instead of downloading a job itself it waits for a worker to lease it:
+
+    POST /cluster/lease      {worker_id, slots, free, throughput} -> {jobs: [item, ...], lease_ttl}
+    POST /cluster/heartbeat  {worker_id, slots, free, throughput, jobs: {id: {title, progress}}}
+                             -> {cancel: [id, ...], lease_ttl}
+    POST /cluster/complete   {worker_id, job_id, status, title, filepath, error}
+
+A heartbeat renews every lease the worker still holds. Leases that are not
+renewed within lease_ttl seconds expire, and their jobs go back to the
+front of the queue for another worker. Workers are plain engines that pull
+work over HTTP with ClusterWorker and report progress and results back.
+"""
+import json
+import math
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import deque
+
+# Seconds a lease lives without a heartbeat. Busy workers beat every
+# POLL_INTERVAL to report progress, idle ones at a third of the TTL.
+LEASE_TTL = 15
+POLL_INTERVAL = 1.0
+# Weight of the newest job in a worker's throughput average.
+THROUGHPUT_SMOOTHING = 0.3
+# The result a worker reports for each local event that ends a job.
+RESULT_STATES = {'video_done': "done", 'job_failed': "failed", 'job_cancelled': "cancelled",
+                 'job_skipped': "skipped", 'job_paused': "cancelled"}
+
+
+class WorkerInfo:
+    """What the coordinator knows about one worker."""
+
+    def __init__(self, worker_id):
+        self.id = worker_id
+        self.slots = 1
+        self.free = 0
+        self.throughput = None
+        self.last_seen = time.monotonic()
+        self.leases = set()
+
+    def update(self, data):
+        self.slots = max(1, int(data.get("slots") or 1))
+        self.free = max(0, int(data.get("free") or 0))
+        if data.get("throughput"):
+            self.throughput = float(data["throughput"])
+        self.last_seen = time.monotonic()
+
+    def to_dict(self):
+        return {"id": self.id, "slots": self.slots, "free": self.free, "throughput": self.throughput,
+                "leases": sorted(self.leases), "last_seen": round(time.monotonic() - self.last_seen, 1)}
+
+
+class Lease:
+    def __init__(self, job, worker_id, ttl):
+        self.job = job
+        self.worker_id = worker_id
+        self.expires = time.monotonic() + ttl
+
+
+class Coordinator:
+    """Hands the engine's jobs to remote workers instead of downloading them.
+
+    The engine's scheduler still decides which jobs may start; for each of
+    them run_remote(job) blocks a scheduler thread until a worker reports a
+    result, the way a local download would. The scheduler's limits follow
+    the slots of the live workers.
+    """
+
+    def __init__(self, engine, lease_ttl=LEASE_TTL):
+        self.engine = engine
+        self.lease_ttl = lease_ttl
+        self._lock = threading.Lock()
+        self._ready = deque()
+        self._leases = {}
+        self._results = {}
+        self._workers = {}
+        self._stopped = threading.Event()
+        self._update_limits()
+        threading.Thread(target=self._reap, daemon=True, name="lease-reaper").start()
+
+    def run_remote(self, job):
+        """Waits until a worker has finished job, then records the result like a local download."""
+        done = threading.Event()
+        with self._lock:
+            self._results[job.id] = (done, None)
+            self._ready.append(job)
+        while True:
+            while not done.wait(0.5):
+                if job.is_cancelled or self._stopped.is_set():
+                    with self._lock:
+                        if job in self._ready:
+                            self._ready.remove(job)
+                        # The worker is told to stop on its next heartbeat.
+                        self._drop_lease(job.id)
+                        self._results.pop(job.id, None)
+                    self.engine._cancel_job(job)
+                    return
+            with self._lock:
+                _, result = self._results[job.id]
+                if result["status"] != "cancelled":
+                    del self._results[job.id]
+                    break
+                # Stopped on the worker's side; another worker can take it.
+                done.clear()
+                self._results[job.id] = (done, None)
+                self._ready.appendleft(job)
+
+        if result["status"] == "done":
+            # The file is on the worker, so the archive keeps the id without a path to check.
+            self.engine._finish_job(job, result.get("title"), result.get("filepath"), worker=result["worker_id"])
+        elif result["status"] == "skipped":
+            self.engine._skip_job(job)
+        else:
+            # The worker has already used up the job's retries.
+            self.engine._fail_job(job, result.get("error") or "The worker reported an unknown error.", retry=False)
+
+    def _worker(self, worker_id, data):
+        # Caller must hold self._lock.
+        worker = self._workers.get(worker_id)
+        if worker is None:
+            worker = self._workers[worker_id] = WorkerInfo(worker_id)
+            print(f"Worker {worker_id} joined")
+        worker.update(data)
+        return worker
+
+    def _share(self, worker, waiting):
+        """How many of the waiting jobs worker should get now: its part of the free capacity, by speed."""
+        known = [w.throughput for w in self._workers.values() if w.throughput]
+        default = statistics.median(known) if known else 1.0
+        weights = {w.id: w.free * (w.throughput or default) for w in self._workers.values() if w.free}
+        total = sum(weights.values())
+        if not total:
+            return 0
+        return max(1, math.ceil(waiting * weights.get(worker.id, 0) / total))
+
+    def lease(self, worker_id, data):
+        """Leases up to the worker's free slots and returns the leased items."""
+        with self._lock:
+            worker = self._worker(worker_id, data)
+            granted = []
+            count = min(worker.free, self._share(worker, len(self._ready)))
+            while self._ready and len(granted) < count:
+                job = self._ready.popleft()
+                self._leases[job.id] = Lease(job, worker_id, self.lease_ttl)
+                worker.leases.add(job.id)
+                granted.append(job)
+        for job in granted:
+            self.engine.job_store.set_state(job.id, "running")
+            if job.timeline is not None:
+                job.timeline.enter("extract")
+            self.engine.emit({'type': 'job_leased', 'job_id': job.id, 'worker_id': worker_id})
+        return [job.item for job in granted]
+
+    def heartbeat(self, worker_id, data):
+        """Renews the worker's leases, forwards its progress and returns the jobs it should stop."""
+        reports = data.get("jobs") or {}
+        with self._lock:
+            worker = self._worker(worker_id, data)
+            expires = time.monotonic() + self.lease_ttl
+            cancel = []
+            for job_id in reports:
+                lease = self._leases.get(job_id)
+                if lease is None or lease.worker_id != worker_id or lease.job.is_cancelled:
+                    cancel.append(job_id)
+                else:
+                    lease.expires = expires
+            renewed = [self._leases[job_id].job for job_id in reports if job_id not in cancel]
+            worker.leases &= set(reports) - set(cancel)
+            self._update_limits()
+
+        for job in renewed:
+            report = reports[job.id]
+            if report.get("title") and report["title"] != job.item.get("title"):
+                self.engine.emit({'type': 'job_metadata', 'job_id': job.id, 'title': report["title"],
+                                  'filesize': None})
+            if report.get("progress"):
+                self.engine.emit(dict(report["progress"], type='progress', job_id=job.id))
+        return cancel
+
+    def complete(self, worker_id, data):
+        """Takes a worker's result for a job it leases. Returns False if the lease is gone."""
+        job_id = data.get("job_id")
+        with self._lock:
+            lease = self._leases.get(job_id)
+            if lease is None or lease.worker_id != worker_id:
+                return False
+            self._drop_lease(job_id)
+            done, _ = self._results.get(job_id, (None, None))
+            if done is None:
+                return False
+            self._results[job_id] = (done, dict(data, worker_id=worker_id))
+        done.set()
+        return True
+
+    def _drop_lease(self, job_id):
+        # Caller must hold self._lock.
+        lease = self._leases.pop(job_id, None)
+        if lease is not None and lease.worker_id in self._workers:
+            self._workers[lease.worker_id].leases.discard(job_id)
+
+    def _update_limits(self):
+        # Caller must hold self._lock. One scheduler thread waits for each leased or leasable job.
+        live = [w for w in self._workers.values() if time.monotonic() - w.last_seen < self.lease_ttl]
+        slots = sum(w.slots for w in live)
+        self.engine.scheduler.set_limits(max(1, slots),
+                                         self.engine.settings["max_per_host"] * max(1, len(live)))
+
+    def _reap(self):
+        while not self._stopped.wait(1.0):
+            now = time.monotonic()
+            expired = []
+            with self._lock:
+                for job_id, lease in list(self._leases.items()):
+                    if lease.expires < now:
+                        self._drop_lease(job_id)
+                        # Back to the front: it was next in line before.
+                        self._ready.appendleft(lease.job)
+                        expired.append(lease)
+                for worker_id, worker in list(self._workers.items()):
+                    if now - worker.last_seen >= self.lease_ttl and not worker.leases:
+                        del self._workers[worker_id]
+                        print(f"Worker {worker_id} left")
+                self._update_limits()
+            for lease in expired:
+                print(f"Lease on {lease.job.url} held by {lease.worker_id} expired; requeued")
+                self.engine.job_store.set_state(lease.job.id, "queued")
+                if lease.job.timeline is not None:
+                    lease.job.timeline.enter("queued")
+                self.engine.emit({'type': 'job_requeued', 'job_id': lease.job.id, 'worker_id': lease.worker_id})
+
+    def status(self):
+        with self._lock:
+            return {
+                "workers": [w.to_dict() for w in self._workers.values()],
+                "waiting": [job.id for job in self._ready],
+                "leases": {job_id: {"worker_id": lease.worker_id,
+                                    "expires_in": round(lease.expires - time.monotonic(), 1)}
+                           for job_id, lease in self._leases.items()},
+            }
+
+    def stop(self):
+        self._stopped.set()
+
+
+class ClusterWorker:
+    """Runs jobs leased from a coordinator on the local engine and reports back.
+
+    Leased items keep their coordinator job ids, so every local event can be
+    matched to its lease. Items are downloaded to this machine's own
+    download_dir.
+    """
+
+    def __init__(self, engine, coordinator_url, worker_id=None, slots=None):
+        self.engine = engine
+        self.url = coordinator_url.rstrip("/")
+        self.worker_id = worker_id or uuid.uuid4().hex[:8]
+        self.slots = slots or engine.settings["max_concurrent_downloads"]
+        self.lease_ttl = LEASE_TTL
+        self.throughput = None
+        self._lock = threading.Lock()
+        self._held = {}
+        self._titles = {}
+        self._outbox = []
+        self._stopped = threading.Event()
+        self._events = engine.broadcaster.subscribe()
+
+    def _post(self, path, payload):
+        request = urllib.request.Request(f"{self.url}{path}", data=json.dumps(payload).encode(),
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return json.loads(response.read())
+
+    def _state(self):
+        with self._lock:
+            free = max(0, self.slots - len(self._held))
+        return {"worker_id": self.worker_id, "slots": self.slots, "free": free, "throughput": self.throughput}
+
+    def _track(self, msg):
+        job_id = msg.get('job_id')
+        with self._lock:
+            if job_id not in self._held:
+                return
+            if msg['type'] == 'progress':
+                self._held[job_id] = {k: v for k, v in msg.items() if k not in ('type', 'job_id', 'ts')}
+            elif msg['type'] in ('job_started', 'job_metadata') and msg.get('title'):
+                self._titles[job_id] = msg['title']
+            elif msg['type'] in RESULT_STATES:
+                del self._held[job_id]
+                entry = msg.get('history_entry') or {}
+                self._outbox.append({"worker_id": self.worker_id, "job_id": job_id,
+                                     "status": RESULT_STATES[msg['type']],
+                                     "title": entry.get('title') or self._titles.pop(job_id, None),
+                                     "filepath": entry.get('filepath'), "error": msg.get('error_message')})
+        speed = ((msg.get('history_entry') or {}).get('metrics') or {}).get('avg_speed')
+        if speed:
+            self.throughput = (speed if self.throughput is None else
+                               THROUGHPUT_SMOOTHING * speed + (1 - THROUGHPUT_SMOOTHING) * self.throughput)
+
+    def _send_results(self):
+        with self._lock:
+            outbox, self._outbox = self._outbox, []
+        for index, result in enumerate(outbox):
+            try:
+                self._post("/cluster/complete", result)
+            except urllib.error.HTTPError as e:
+                if e.code != 409:
+                    raise
+                # The lease expired and the job went to someone else; nothing to report.
+            except Exception:
+                with self._lock:
+                    self._outbox[:0] = outbox[index:]
+                raise
+
+    def _heartbeat(self):
+        with self._lock:
+            jobs = {job_id: {"title": self._titles.get(job_id), "progress": progress}
+                    for job_id, progress in self._held.items()}
+        response = self._post("/cluster/heartbeat", dict(self._state(), jobs=jobs))
+        self.lease_ttl = response.get("lease_ttl", self.lease_ttl)
+        for job_id in response.get("cancel", []):
+            print(f"Coordinator revoked job {job_id}")
+            with self._lock:
+                self._held.pop(job_id, None)
+            self.engine.cancel(job_id)
+
+    def _lease(self):
+        state = self._state()
+        if not state["free"]:
+            return
+        response = self._post("/cluster/lease", state)
+        items = response.get("jobs") or []
+        if not items:
+            return
+        for item in items:
+            item["download_dir"] = self.engine.settings["download_dir"]
+        with self._lock:
+            for item in items:
+                self._held[item["id"]] = None
+        self.engine.submit(items)
+
+    def run(self):
+        """Leases, heartbeats and reports until stop() is called."""
+        last_beat = 0
+        connected = None
+        while not self._stopped.is_set():
+            for msg in self._events.drain():
+                self._track(msg)
+            try:
+                self._send_results()
+                with self._lock:
+                    busy = bool(self._held)
+                if busy or time.monotonic() - last_beat >= self.lease_ttl / 3:
+                    self._heartbeat()
+                    last_beat = time.monotonic()
+                self._lease()
+                if not connected:
+                    print(f"Worker {self.worker_id} connected to {self.url} with {self.slots} slots")
+                    connected = True
+            except (OSError, ValueError) as e:
+                if connected is not False:
+                    print(f"Cannot reach coordinator {self.url}: {e}")
+                    connected = False
+            self._stopped.wait(POLL_INTERVAL)
+
+    def stop(self):
+        self._stopped.set()
+        self.engine.broadcaster.unsubscribe(self._events)
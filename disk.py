@@ -0,0 +1,110 @@
+import os
+import shutil
+import threading
+
+MIB = 1024 * 1024
+# filesize_approx is an estimate from the bitrate and can be off by a few percent.
+SIZE_MARGIN = 1.05
+# How often jobs waiting for space check again even if no other job finished,
+# in case the space was freed by hand.
+RECHECK_INTERVAL = 30
+
+
+def output_paths(info):
+    """The files a download of info writes: its formats (and their .part files), the merge temp and the output."""
+    filename = info.get('filename')
+    if not filename:
+        return []
+    base, ext = os.path.splitext(filename)
+    if info.get('requested_formats'):
+        parts = [f"{base}.f{f['format_id']}.{f['ext']}" for f in info['requested_formats']]
+        return parts + [part + ".part" for part in parts] + [f"{base}.temp{ext}", filename]
+    return [filename, filename + ".part"]
+
+
+def required_bytes(info, converts):
+    """Bytes a download of info needs on disk at its peak, or None if its formats give no size.
+
+    Merging or converting writes the output next to the downloaded formats
+    before they are deleted, so that takes twice the download's size.
+    """
+    formats = info.get('requested_formats') or [info]
+    size = sum(f.get('filesize') or f.get('filesize_approx') or 0 for f in formats)
+    if not size:
+        return None
+    return int(size * SIZE_MARGIN * (2 if converts or len(formats) > 1 else 1))
+
+
+def allocated_bytes(paths):
+    """Space paths take up on disk, counting space preallocated for them but not written yet."""
+    total = 0
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        total += st.st_blocks * 512 if hasattr(st, "st_blocks") else st.st_size
+    return total
+
+
+class DiskSpace:
+    """Admits downloads only while their files fit on the download directory's filesystem.
+
+    Each admitted job holds a reservation of its peak size until it is
+    released. Space a reservation has already taken up (its partial or
+    preallocated files) is not counted twice, so what is set aside for the
+    running jobs is their reservations less their files on disk. min_free
+    bytes are always left over.
+    """
+
+    def __init__(self, min_free=0, on_release=None):
+        self.min_free = min_free
+        self.on_release = on_release
+        self._lock = threading.Lock()
+        self._reservations = {}
+
+    def admit(self, job_id, directory, size, paths=()):
+        """Reserves size bytes for job_id in directory.
+
+        Returns "ok" once reserved, "wait" if it only fits after running jobs
+        are done with the space they set aside, or "full" if it never fits.
+        """
+        os.makedirs(directory, exist_ok=True)
+        device = os.stat(directory).st_dev
+        with self._lock:
+            self._reservations.pop(job_id, None)
+            free = shutil.disk_usage(directory).free - self.min_free
+            needed = size - allocated_bytes(paths)
+            if needed > free:
+                return "full"
+            held = sum(self._outstanding(r) for r in self._reservations.values() if r["device"] == device)
+            if needed > free - held:
+                return "wait"
+            self._reservations[job_id] = {"device": device, "directory": directory, "size": size,
+                                          "paths": list(paths)}
+            return "ok"
+
+    def release(self, job_id):
+        with self._lock:
+            released = self._reservations.pop(job_id, None)
+        if released is not None and self.on_release:
+            self.on_release()
+
+    def free(self, directory):
+        return shutil.disk_usage(directory).free if os.path.isdir(directory) else None
+
+    def reserved(self):
+        """Bytes set aside for admitted jobs that their files do not take up yet."""
+        with self._lock:
+            return sum(self._outstanding(r) for r in self._reservations.values())
+
+    def reservations(self):
+        """Each admitted job's reservation and how much of it is on disk, by job id."""
+        with self._lock:
+            return {job_id: {"directory": r["directory"], "reserved": r["size"],
+                             "allocated": allocated_bytes(r["paths"])}
+                    for job_id, r in self._reservations.items()}
+
+    @staticmethod
+    def _outstanding(reservation):
+        return max(0, reservation["size"] - allocated_bytes(reservation["paths"]))
@@ -0,0 +1,144 @@
+import os
+import re
+import threading
+import time
+
+from video_ids import canonical_id
+
+ARCHIVE_FILE = "download_archive.txt"
+# Output directories are rescanned for finished files at most this often, in seconds.
+DISK_SCAN_TTL = 30
+# Matches the "[<id>].<ext>" tail every output template ends with.
+OUTPUT_ID_RE = re.compile(r"\[([^\[\]]+)\]\.(\w+)$")
+PARTIAL_EXTS = ("part", "ytdl", "aria2", "temp")
+
+
+class DownloadArchive:
+    """Canonical ids of everything already downloaded, checked without touching the network.
+
+    Built from the history (which also remembers each file's path) and from
+    ARCHIVE_FILE, which uses yt-dlp's --download-archive line format so it can
+    be shared with a plain yt-dlp. An id recorded with a file path only counts
+    while that file still exists. Any other id, including ones recorded
+    without a path, counts while the output directory or a playlist folder
+    directly in it holds a finished "... [<id>].<ext>" file, which is what
+    every output template here produces. Without an output directory to
+    check, only recorded ids count. Ids a cluster worker downloaded always
+    count, since their files are on the worker.
+    """
+
+    def __init__(self, history_store, path=ARCHIVE_FILE):
+        self.history_store = history_store
+        self.path = path
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+        self._files = {}
+        self._archived = set()
+        self._remote = set()
+        self._disk_ids = {}
+
+    def load(self):
+        """Reads the history and ARCHIVE_FILE. Every other method waits until this has run once.
+
+        Reading a large history takes a while, so this is meant to run on a
+        background thread while the app starts.
+        """
+        files, remote = {}, set()
+        for video_id, filepath, worker in self.history_store.downloaded():
+            if worker:
+                remote.add(video_id)
+                files.pop(video_id, None)
+            else:
+                files[video_id] = filepath
+                remote.discard(video_id)
+        archived = set()
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                archived = {line.strip() for line in f if line.strip()}
+        with self._lock:
+            self._files, self._archived, self._remote = files, archived, remote
+        self._loaded.set()
+
+    def _ids_on_disk(self, download_dir):
+        with self._lock:
+            scanned_at, ids = self._disk_ids.get(download_dir, (0, None))
+        if ids is not None and time.monotonic() - scanned_at < DISK_SCAN_TTL:
+            return ids
+        ids = set()
+        # The output templates write into the directory or one playlist folder in it, never deeper.
+        for name in self._scan(download_dir, subfolders=True):
+            match = OUTPUT_ID_RE.search(name)
+            if match and match.group(2) not in PARTIAL_EXTS:
+                ids.add(match.group(1))
+        with self._lock:
+            self._disk_ids[download_dir] = (time.monotonic(), ids)
+        return ids
+
+    def _scan(self, directory, subfolders):
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        continue
+                    if not is_dir:
+                        yield entry.name
+                    elif subfolders:
+                        yield from self._scan(entry.path, subfolders=False)
+        except OSError:
+            return
+
+    def is_downloaded(self, url, download_dir=None):
+        """True if url was downloaded before. Can scan download_dir, so keep it off the Tk thread."""
+        video_id = canonical_id(url)
+        self._loaded.wait()
+        with self._lock:
+            filepath = self._files.get(video_id)
+            known = video_id in self._files or video_id in self._archived
+            if video_id in self._remote:
+                return True
+        if filepath:
+            return os.path.exists(filepath)
+        if not download_dir:
+            return known
+        return video_id.split(" ", 1)[1] in self._ids_on_disk(download_dir)
+
+    def filter_new(self, urls, download_dir=None):
+        """Splits urls into (not yet downloaded, already downloaded)."""
+        new, done = [], []
+        for url in urls:
+            (done if self.is_downloaded(url, download_dir) else new).append(url)
+        return new, done
+
+    def add(self, url, archive_id=None, filepath=None, remote=False):
+        """Records a finished download. archive_id is yt-dlp's "<extractor> <id>" when known.
+
+        remote marks a download a cluster worker made; it has no local file to check.
+        """
+        video_id = canonical_id(url)
+        lines = {video_id, archive_id or video_id}
+        self._loaded.wait()
+        with self._lock:
+            if remote:
+                self._remote.add(video_id)
+                self._files.pop(video_id, None)
+            else:
+                self._remote.discard(video_id)
+                self._files[video_id] = filepath
+            new_lines = lines - self._archived
+            self._archived |= lines
+            if new_lines:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.writelines(f"{line}\n" for line in sorted(new_lines))
+
+    def clear(self):
+        """Forgets every download, along with ARCHIVE_FILE, so they can all be downloaded again."""
+        self._loaded.wait()
+        with self._lock:
+            self._files.clear()
+            self._archived.clear()
+            self._remote.clear()
+            self._disk_ids.clear()
+            if os.path.exists(self.path):
+                open(self.path, "w", encoding="utf-8").close()
@@ -0,0 +1,1259 @@
+import os
+import json
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from scheduler import DownloadScheduler, Job
+from aria2rpc import Aria2Daemon, Aria2RPCError
+from bandwidth import BandwidthManager
+from metrics import engine_metrics, JobTimeline
+from aria2_tuning import (ConnectionTuner, ThroughputHistory, ThroughputMeter, THROUGHPUT_DB, RETUNE_AFTER,
+                          aria2_args, aria2_options, media_host, static_plan)
+from ytdlp_engine import YtDlpEngine, DownloadCancelledError, media_urls_fresh
+from prefetch import MetadataPrefetcher
+from retry import classify, policy_for, retry_delay
+from disk import DiskSpace, MIB, RECHECK_INTERVAL, output_paths, required_bytes
+from postprocess import PostprocessPool
+from metadata_cache import MetadataCache, METADATA_DB
+from video_ids import video_key, playlist_key, canonical_id
+from history_store import HistoryStore, HISTORY_DB
+from event_pump import EventQueue, EventBroadcaster
+from download_archive import DownloadArchive, ARCHIVE_FILE
+from job_store import JobStore, JOBS_DB, UNFINISHED_STATES, FINISHED_STATES
+from progress import progress_args, parse_line, download_event, postprocess_event, aria2_event
+from startup import StartupTimer
+
+HISTORY_FILE = "history.json"
+# Older builds kept history in these JSON files; they are imported into
+# HISTORY_DB once and then left alone.
+LEGACY_HISTORY_FILES = [HISTORY_FILE, os.path.join("history", "downloads.json")]
+CONFIG_FILE = "settings.json"
+YT_DLP_PATH = f"./assets/yt-dlp{'.exe' if sys.platform == 'win32' else ''}"
+ARIA2C_PATH = f"./assets/aria2c{'.exe' if sys.platform == 'win32' else ''}"
+# Upper bound on aria2c connections to a single host, shared by every job
+# running against that host at the same time.
+ARIA2_MAX_CONNECTIONS = 16
+DOWNLOAD_BACKENDS = ["spawn", "rpc"]
+EXTRACTION_ENGINES = ["binary", "library"]
+# Finished jobs stay visible through the API, and in JOBS_DB, until this many
+# have piled up.
+FINISHED_JOBS_KEPT = 500
+# A job in one of these states can still be cancelled or paused.
+ACTIVE_STATES = ("queued", "running", "merging", "retrying", "deferred")
+# Results are remembered for this many idempotency keys.
+IDEMPOTENCY_KEYS_KEPT = 1000
+DEFAULT_SETTINGS = {
+    "download_dir": None,  # The working directory at startup.
+    "theme": "darkly",
+    "video_format": "mp4",
+    "audio_format": "mp3",
+    "quality": "720p",
+    "audio_only": False,
+    "embed_thumbnail": False,
+    "max_concurrent_downloads": 3,
+    "max_per_host": 2,
+    "download_backend": "spawn",
+    "extraction_engine": "binary",
+    "metadata_ttls": {},
+    # Global download limit in KiB/s, 0 for none. rate_schedule rules such as
+    # {"from": "09:00", "to": "18:00", "rate_limit": 2048} override it while
+    # they apply; see bandwidth.scheduled_limit.
+    "rate_limit": 0,
+    "rate_schedule": [],
+    # Pick aria2c's connection count and piece size per download from the file
+    # size and each host's measured speed, instead of the fixed per-job budget.
+    "aria2_tuning": True,
+    # How many queued items have their title, formats and size resolved while
+    # earlier ones download; 0 turns prefetching off.
+    "prefetch_lookahead": 3,
+    # Merge, convert and embed on their own pool of postprocess_workers threads
+    # (0: one per CPU core) once a download's files are on disk, so the next
+    # download starts instead of waiting for ffmpeg.
+    "postprocess_pipeline": True,
+    "postprocess_workers": 0,
+    # Failed jobs run again after a delay when their error class allows it;
+    # retry_policies overrides retry.RETRY_POLICIES per class.
+    "auto_retry": True,
+    "retry_policies": {},
+    # Start a download only if its expected size fits in download_dir with
+    # disk_min_free_mb to spare; jobs that would fit once running downloads
+    # finish wait for them, the others fail with a disk_full error.
+    "disk_space_check": True,
+    "disk_min_free_mb": 512,
+    # aria2c's --file-allocation: "falloc" reserves each file's full size up
+    # front in one contiguous extent; "none" writes it as it arrives.
+    "file_allocation": "falloc",
+}
+
+
+def archive_id(info):
+    """yt-dlp's download archive id for an info dict, or None."""
+    if info.get('extractor_key') and info.get('id'):
+        return f"{info['extractor_key'].lower()} {info['id']}"
+    return None
+
+
+class DownloadEngine:
+    """The download queue, history and backends, without any UI.
+
+    Worker threads report everything as dict events on self.queue; the Tk
+    window and the headless runner each drain it in their own way, and the
+    same events are fanned out to API subscribers through self.broadcaster.
+    Settings are a plain dict with the same keys as CONFIG_FILE. Pass startup
+    to have loading the config and the history timed along with the rest of
+    the app's start.
+    """
+
+    def __init__(self, config_file=CONFIG_FILE, startup=None):
+        self.startup = startup or StartupTimer()
+        self.config_file = config_file
+        self.settings = dict(DEFAULT_SETTINGS, download_dir=os.getcwd())
+        with self.startup.phase("config"):
+            self.load_config()
+
+        self.queue = EventQueue()
+        self.broadcaster = EventBroadcaster()
+        self.queue_cancelled = False
+        self.jobs = OrderedDict()
+        self.jobs_lock = threading.Lock()
+        self.ingest_lock = threading.Lock()
+        self.idempotency_results = OrderedDict()
+        # Jobs waiting to run again after a failure or for disk space, by id, with the timer that requeues them.
+        self.retry_timers = {}
+        self.retry_lock = threading.Lock()
+        self.aria2_daemon = None
+        self.aria2_lock = threading.Lock()
+        self.stopping = False
+        # A cluster.Coordinator when this engine leases its jobs to remote workers.
+        self.coordinator = None
+
+        with self.startup.phase("history"):
+            self.job_store = JobStore(JOBS_DB)
+            self.job_store.prune(FINISHED_JOBS_KEPT)
+            self.load_history()
+        self.archive = DownloadArchive(self.history_store, ARCHIVE_FILE)
+        threading.Thread(target=self._load_archive, daemon=True).start()
+        self.metadata_cache = MetadataCache(METADATA_DB, ttls=self.settings["metadata_ttls"])
+        self.ytdlp_engine = YtDlpEngine(metadata_cache=self.metadata_cache)
+        self.bandwidth = BandwidthManager(self.settings)
+        self.tuner = ConnectionTuner(ThroughputHistory(THROUGHPUT_DB))
+        self.metrics = engine_metrics()
+        self.disk = DiskSpace(self.settings["disk_min_free_mb"] * MIB, on_release=self._wake_deferred)
+        self.prefetcher = MetadataPrefetcher(self.resolve_metadata)
+        self.postprocessor = PostprocessPool(self.settings["postprocess_workers"], on_idle=self._on_queue_idle)
+        self.scheduler = DownloadScheduler(self.run_job, self.settings["max_concurrent_downloads"],
+                                           self.settings["max_per_host"], on_idle=self._on_queue_idle,
+                                           on_error=self._on_job_crashed)
+
+    def load_config(self):
+        if os.path.exists(self.config_file):
+            try:
+                with open(self.config_file, "r") as f:
+                    self.settings.update(json.load(f))
+            except json.JSONDecodeError:
+                pass  # Keep the defaults on a corrupt file.
+
+    def save_config(self):
+        with open(self.config_file, "w") as f:
+            json.dump(self.settings, f, indent=2)
+
+    def load_history(self):
+        self.history_store = HistoryStore(HISTORY_DB)
+        for path in LEGACY_HISTORY_FILES:
+            imported = self.history_store.import_json(path)
+            if imported:
+                print(f"Imported {imported} history entries from {path}")
+
+    def _load_archive(self):
+        # Reads every history row, so it runs in the background; archive lookups wait for it.
+        with self.startup.phase("archive"):
+            self.archive.load()
+
+    def clear_history(self):
+        """Deletes the history and forgets the archive, so every video can be downloaded again."""
+        self.history_store.clear()
+        self.archive.clear()
+
+    def make_item(self, url, from_playlist=False, force=False, **options):
+        """A queue item for url; options not given are taken from the settings."""
+        item = {
+            "id": uuid.uuid4().hex,
+            "url": url,
+            "quality": options.get("quality", self.settings["quality"]),
+            "audio_only": options.get("audio_only", self.settings["audio_only"]),
+            "embed_thumbnail": options.get("embed_thumbnail", self.settings["embed_thumbnail"]),
+            # Fixed per item, so a job resumed after a restart finds its partial files.
+            "download_dir": self.settings["download_dir"],
+            "title": "Fetching title..."
+        }
+        if from_playlist:
+            item["from_playlist"] = True
+        if force:
+            # Download again even if the archive says it is already done.
+            item["force"] = True
+        if options.get("rate_limit"):
+            # This job's own cap in KiB/s; it never gets more, even when the global limit would allow it.
+            item["rate_limit"] = int(options["rate_limit"])
+        return item
+
+    def submit(self, items):
+        """Hands items to the scheduler; each one is announced with a job_queued event."""
+        if not self.is_busy():
+            self.queue_cancelled = False
+        self.job_store.put_many(items, "queued")
+        for item in items:
+            job = Job(item)
+            job.timeline = JobTimeline()
+            self._register_job(job)
+            self.emit({'type': 'job_queued', 'job_id': job.id, 'item': item})
+            self.scheduler.submit(job)
+        self._prefetch_upcoming()
+
+    def stage(self, items):
+        """Stores items that are queued in the window but not started yet."""
+        self.job_store.put_many(items, "staged")
+        self.prefetcher.prefetch(items[:self.settings["prefetch_lookahead"]])
+
+    def recover(self):
+        """Requeues the jobs an earlier run left unfinished and returns the staged items.
+
+        Jobs that were running continue from their partial files: yt-dlp keeps
+        its .part files and aria2c its .aria2 control files when interrupted,
+        and the RPC daemon restores its own session. Paused jobs are listed
+        again so they can be resumed.
+        """
+        for row in self.job_store.in_states(("paused",)):
+            job = Job(row["item"])
+            self._register_job(job)
+            self._pause_job(job)
+        unfinished = [row["item"] for row in self.job_store.in_states(UNFINISHED_STATES)]
+        if unfinished:
+            self.submit(unfinished)
+        return [row["item"] for row in self.job_store.in_states(("staged",))]
+
+    def add_urls(self, urls, idempotency_key=None, **options):
+        """Queues and starts every url that is not a duplicate. Safe to call from any thread.
+
+        Duplicates are matched by canonical video id against unfinished and
+        paused jobs, items staged in the window, earlier urls in the same
+        call and the download archive. Returns one {url, status, job_id} dict per url, where status is
+        "accepted" or "duplicate". A repeated idempotency_key returns the
+        results of the first call without queueing anything.
+        """
+        with self.ingest_lock:
+            if idempotency_key is not None and idempotency_key in self.idempotency_results:
+                return self.idempotency_results[idempotency_key]
+
+            known = {canonical_id(row["item"]["url"]): row["id"] for row in self.job_store.in_states(("staged",))}
+            known.update((canonical_id(job.url), job.id) for job in self.list_jobs()
+                         if job.status in ACTIVE_STATES + ("paused",))
+            results = []
+            items = []
+            for url in urls:
+                video_id = canonical_id(url)
+                if video_id in known:
+                    results.append({"url": url, "status": "duplicate", "job_id": known[video_id], "reason": "queued"})
+                elif self.archive.is_downloaded(url, self.settings["download_dir"]):
+                    results.append({"url": url, "status": "duplicate", "job_id": None, "reason": "downloaded"})
+                else:
+                    item = self.make_item(url, **options)
+                    known[video_id] = item["id"]
+                    items.append(item)
+                    results.append({"url": url, "status": "accepted", "job_id": item["id"]})
+            self.submit(items)
+
+            if idempotency_key is not None:
+                self.idempotency_results[idempotency_key] = results
+                while len(self.idempotency_results) > IDEMPOTENCY_KEYS_KEPT:
+                    self.idempotency_results.popitem(last=False)
+        return results
+
+    def _register_job(self, job):
+        with self.jobs_lock:
+            self.jobs.pop(job.id, None)
+            self.jobs[job.id] = job
+            finished = [job_id for job_id, j in self.jobs.items() if j.status in FINISHED_STATES]
+            for job_id in finished[:max(0, len(finished) - FINISHED_JOBS_KEPT)]:
+                del self.jobs[job_id]
+
+    def get_job(self, job_id):
+        with self.jobs_lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        with self.jobs_lock:
+            return list(self.jobs.values())
+
+    def emit(self, msg):
+        """Reports msg to the UI queue and every API subscriber, and keeps the job's state current."""
+        job = self.get_job(msg.get('job_id'))
+        if job is not None:
+            if msg['type'] == 'progress':
+                job.progress = {k: v for k, v in msg.items() if k not in ('type', 'job_id', 'ts')}
+                if msg.get('phase') == 'download' and job.meter is not None:
+                    job.meter.update(msg['downloaded_bytes'])
+                if job.timeline is not None:
+                    job.timeline.on_progress(msg)
+                if msg.get('phase') in ('merge', 'postprocess') and job.status == "running":
+                    job.status = "merging"
+                    self.job_store.set_state(job.id, "merging")
+            elif msg['type'] in ('job_started', 'job_metadata') and msg.get('title'):
+                job.item['title'] = msg['title']
+            elif msg['type'] == 'job_failed':
+                job.error = msg.get('error_message')
+            elif msg['type'] == 'video_done':
+                job.filepath = msg['history_entry'].get('filepath')
+        self.broadcaster.publish(msg)
+        self.queue.put(msg)
+
+    def _stop_pending(self, job_id, paused):
+        job = self.scheduler.remove(job_id) or self._cancel_retry(job_id)
+        if job is None:
+            return False
+        if paused:
+            self._pause_job(job)
+        else:
+            self._cancel_job(job)
+        if not self.is_busy():
+            self._on_queue_idle()
+        return True
+
+    def cancel(self, job_id):
+        """Cancels one queued or running job. Returns False if there is nothing to cancel."""
+        job = self.get_job(job_id)
+        if job is None or job.status not in ACTIVE_STATES:
+            return False
+        if not self._stop_pending(job_id, paused=False):
+            job.cancel()
+        return True
+
+    def pause(self, job_id):
+        """Stops one job but keeps its partial files, so resume continues where it left off."""
+        job = self.get_job(job_id)
+        if job is None or job.status not in ACTIVE_STATES:
+            return False
+        job.paused = True
+        if not self._stop_pending(job_id, paused=True):
+            job.cancel()
+        return True
+
+    def set_rate_limit(self, job_id, rate_limit):
+        """Changes one job's own limit in KiB/s (0 or None removes it), also while it runs."""
+        job = self.get_job(job_id)
+        if job is None or job.status in FINISHED_STATES:
+            return False
+        if rate_limit:
+            job.item["rate_limit"] = int(rate_limit)
+        else:
+            job.item.pop("rate_limit", None)
+        self.job_store.put_many([job.item], job.status)
+        self.bandwidth.set_cap(job_id, job.item.get("rate_limit"))
+        return True
+
+    def resume(self, job_id):
+        job = self.get_job(job_id)
+        if job is None or job.status != "paused":
+            return False
+        self.submit([job.item])
+        return True
+
+    def retry(self, job_id):
+        """Queues a job that failed for good once more, with a fresh set of attempts."""
+        row = self.job_store.get(job_id)
+        if row is None or row["state"] != "failed":
+            return False
+        self.job_store.set_state(job_id, "failed", attempts=0)
+        self.submit([row["item"]])
+        return True
+
+    def cancel_all(self):
+        """Cancels running jobs and returns the items that never started."""
+        if not self.is_busy():
+            return []
+        self.queue_cancelled = True
+        pending = self.scheduler.cancel_all()
+        with self.retry_lock:
+            retrying, self.retry_timers = self.retry_timers, {}
+        for job_id, timer in retrying.items():
+            timer.cancel()
+            pending.append(self.get_job(job_id).item)
+        for job in self.postprocessor.waiting_jobs() + self.postprocessor.active_jobs():
+            job.cancel()
+        for item in pending:
+            job = self.get_job(item['id'])
+            if job is not None:
+                job.status = "cancelled"
+                self._close_timeline(job, "cancelled")
+            self.job_store.set_state(item['id'], "cancelled")
+        return pending
+
+    def is_busy(self):
+        return self.scheduler.is_busy() or self.postprocessor.is_busy() or bool(self.retry_timers)
+
+    def _on_queue_idle(self):
+        # Called by the scheduler and by the post-processing pool; the queue is
+        # done once both have run out of work.
+        if self.is_busy():
+            return
+        if self.queue_cancelled:
+            self.emit({'type': 'cancelled'})
+        else:
+            self.emit({'type': 'done', 'success': True})
+
+    def _close_timeline(self, job, result, error=None):
+        """Ends job's phase timing, adds it to the metrics and returns the summary, or None."""
+        self.disk.release(job.id)
+        timeline, job.timeline = job.timeline, None
+        if timeline is None:
+            return None
+        job.metrics = summary = timeline.finish(result, error)
+        self.metrics.inc("downloader_jobs_finished_total", result=result)
+        self.metrics.inc("downloader_bytes_downloaded_total", summary["bytes"])
+        self.metrics.inc("downloader_disk_written_bytes_total", summary["disk_bytes"])
+        self.metrics.inc("downloader_job_retries_total", summary["retries"])
+        self.metrics.observe("downloader_job_duration_seconds", summary["duration"])
+        for phase, seconds in summary["phases"].items():
+            self.metrics.observe("downloader_phase_duration_seconds", seconds, phase=phase)
+        return summary
+
+    def metrics_text(self):
+        """Current metrics in the Prometheus text format."""
+        active = self.scheduler.active_jobs()
+        self.metrics.set("downloader_jobs_active", len(active))
+        self.metrics.set("downloader_queue_depth", len(self.scheduler.pending_jobs()))
+        self.metrics.set("downloader_postprocess_active", len(self.postprocessor.active_jobs()))
+        self.metrics.set("downloader_postprocess_queue_depth", len(self.postprocessor.waiting_jobs()))
+        downloading = [job for job in active if job.progress.get('phase') == 'download']
+        self.metrics.set("downloader_download_speed_bytes", sum(job.progress.get('speed') or 0 for job in downloading))
+        cache = self.metadata_cache.stats()
+        self.metrics.set("downloader_metadata_cache_hits_total", cache["hits"])
+        self.metrics.set("downloader_metadata_cache_misses_total", cache["misses"])
+        self.metrics.set("downloader_metadata_cache_hit_ratio", round(cache["hit_rate"], 4))
+        self.metrics.set("downloader_event_lag_seconds", self.queue.stats()["latency_ms"] / 1000)
+        self.metrics.set("downloader_disk_free_bytes", self.disk.free(self.settings["download_dir"]) or 0)
+        self.metrics.set("downloader_disk_reserved_bytes", self.disk.reserved())
+        self.metrics.set("downloader_jobs_waiting_for_disk",
+                         sum(1 for job in self.list_jobs() if job.status == "deferred"))
+        return self.metrics.render()
+
+    def disk_status(self):
+        """Free space in download_dir, what running jobs have reserved of it and how fast each is downloading.
+
+        download_speed is the transfer rate yt-dlp or aria2c reports, not a measured disk write rate.
+        """
+        reservations = self.disk.reservations()
+        for job_id, reservation in reservations.items():
+            job = self.get_job(job_id)
+            progress = job.progress if job is not None else {}
+            reservation["download_speed"] = progress.get('speed') if progress.get('phase') == 'download' else None
+        return {"directory": self.settings["download_dir"], "free": self.disk.free(self.settings["download_dir"]),
+                "min_free": self.disk.min_free, "reserved": self.disk.reserved(),
+                "waiting": [job.id for job in self.list_jobs() if job.status == "deferred"], "jobs": reservations}
+
+    def use_library_engine(self):
+        return self.settings["extraction_engine"] == "library" and YtDlpEngine.available()
+
+    def connections_per_job(self):
+        """Splits the per-host connection budget between the jobs allowed on one host."""
+        return max(1, ARIA2_MAX_CONNECTIONS // max(1, self.settings["max_per_host"]))
+
+    def plan_aria2(self, job, filesize=None, info=None):
+        """Chooses aria2c settings for job and remembers them, so its speed can be recorded against them.
+
+        They are tuned for the host the media comes from, taken from info or
+        the cached metadata, since that is what aria2c connects to; the page's
+        host is only used when no media URL is known yet.
+        """
+        if not self.settings["aria2_tuning"]:
+            job.aria2_plan = static_plan(self.connections_per_job())
+        else:
+            filesize = filesize or self.metadata_cache.get(video_key(job.url), "filesize")
+            job.tuning_host = self._media_host(job, info) or job.host
+            job.aria2_plan = self.tuner.choose(job.tuning_host, filesize, self.connections_per_job())
+        return job.aria2_plan
+
+    def _media_host(self, job, info):
+        if info is None:
+            info = self.resolved_info(job.item, fetch=False) or self.metadata_cache.get(video_key(job.url), "info")
+        if info is None or info.get('_type', 'video') != 'video':
+            return None
+        return media_host(info)
+
+    def _aria2_args(self, plan):
+        """aria2c command line options for plan, with the configured file allocation."""
+        return aria2_args(plan or static_plan(self.connections_per_job())) + [
+            f"--file-allocation={self.settings['file_allocation']}"]
+
+    def _record_throughput(self, job):
+        if job.aria2_plan and job.meter is not None:
+            self.tuner.record(job.tuning_host or job.host, job.aria2_plan, job.meter)
+        job.meter = None
+
+    def _retune_aria2(self, job, daemon, gids, filesize):
+        """Moves a running RPC download to better aria2c settings if it is far below the host's usual speed."""
+        plan = self.tuner.retune(job.tuning_host or job.host, job.aria2_plan, filesize, job.meter.speed,
+                                 self.connections_per_job())
+        if plan is None:
+            return
+        self._record_throughput(job)
+        job.meter = ThroughputMeter()
+        job.aria2_plan = plan
+        for gid in gids:
+            daemon.change_options(gid, aria2_options(plan))
+
+    def update_scheduler_limits(self):
+        self.scheduler.set_limits(self.settings["max_concurrent_downloads"], self.settings["max_per_host"])
+
+    def cache_playlist_info(self, url, videos):
+        self.metadata_cache.put(playlist_key(url) or video_key(url), "entries", videos)
+
+    def iter_playlist_entries(self, url, cancel):
+        """Yields {id, title, url} for each entry as yt-dlp lists it."""
+        started = time.monotonic()
+        try:
+            yield from self._iter_playlist_entries(url, cancel)
+        finally:
+            self.metrics.observe("downloader_playlist_probe_seconds", time.monotonic() - started)
+
+    def _iter_playlist_entries(self, url, cancel):
+        if self.use_library_engine():
+            yield from self.ytdlp_engine.iter_entries(url)
+            return
+
+        cmd = [YT_DLP_PATH, "--flat-playlist", "--dump-json", url]
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8')
+        stderr_output = []
+        stderr_thread = threading.Thread(target=lambda: stderr_output.append(process.stderr.read()), daemon=True)
+        stderr_thread.start()
+
+        try:
+            for line in iter(process.stdout.readline, ''):
+                if cancel.is_set():
+                    process.terminate()
+                    break
+                try:
+                    video_data = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if video_data.get('formats'):
+                    self.metadata_cache.put_info(video_key(url), video_data)
+                yield {
+                    "id": video_data.get('id'),
+                    "title": video_data.get('title'),
+                    "url": video_data.get('url', url)
+                }
+        finally:
+            process.stdout.close()
+            return_code = process.wait()
+            stderr_thread.join()
+
+        if return_code != 0 and not cancel.is_set():
+            raise Exception(f"yt-dlp error: {''.join(stderr_output)}")
+
+    def _prefetch_upcoming(self):
+        lookahead = self.settings["prefetch_lookahead"]
+        if lookahead and self.coordinator is None:
+            self.prefetcher.prefetch([job.item for job in self.scheduler.pending_jobs()[:lookahead]])
+
+    def _resolve_command(self, item):
+        """yt-dlp -J for item with the same format, playlist and output options as its download."""
+        is_playlist = 'list=' in item['url']
+        download_playlist = item.get("from_playlist")
+        return ([YT_DLP_PATH, item['url'], "-J"] + self._format_args(item) +
+                self._playlist_args(is_playlist, download_playlist, item) +
+                ["-o", self._output_template(item, download_playlist)])
+
+    def resolved_info(self, item, fetch=True):
+        """item's yt-dlp -J info with formats selected, from the cache while its media URLs are valid.
+
+        With fetch=False nothing is extracted and a missing or stale entry gives None.
+        Raises subprocess.CalledProcessError or json.JSONDecodeError when yt-dlp fails.
+        """
+        cmd = self._resolve_command(item)
+        cached = self.metadata_cache.get(video_key(item['url']), "resolved")
+        if cached and cached["cmd"] == cmd[1:] and media_urls_fresh(cached["info"]):
+            return cached["info"]
+        if not fetch:
+            return None
+        info = json.loads(subprocess.check_output(cmd, text=True, encoding='utf-8', stderr=subprocess.PIPE))
+        if info.get('_type', 'video') == 'video':
+            self.metadata_cache.put(video_key(item['url']), "resolved", {"cmd": cmd[1:], "info": info})
+            self.metadata_cache.put_info(video_key(item['url']), info)
+        else:
+            # A URL that names only a playlist resolves to all of it even with
+            # --no-playlist. Only what it is and its title are kept, so it is
+            # not extracted again before yt-dlp downloads it.
+            self.metadata_cache.put(video_key(item['url']), "resolved",
+                                    {"cmd": cmd[1:], "info": {k: info.get(k) for k in ("_type", "id", "title")}})
+        return info
+
+    def resolve_metadata(self, item):
+        """Resolves title, formats and expected size ahead of item's download and reports them.
+
+        Runs on the prefetcher's threads. The results land in the caches the
+        download reads: the library engine's info cache, or the resolved -J
+        output that the spawn and RPC backends start from.
+        """
+        if self.use_library_engine():
+            info = self.ytdlp_engine.extract(item['url'], noplaylist=self._noplaylist(item))
+        else:
+            info = self.resolved_info(item)
+        if info.get('_type', 'video') != 'video':
+            return
+        key = video_key(item['url'])
+        self.metadata_cache.put(key, "title", info.get('title'))
+        if item['title'] == 'Fetching title...' and info.get('title'):
+            item['title'] = info['title']
+        self.emit({'type': 'job_metadata', 'job_id': item['id'], 'title': item['title'],
+                   'filesize': self.metadata_cache.get(key, "filesize")})
+
+    def _output_template(self, item, download_playlist):
+        # Absolute, so yt-dlp keeps .part files and merge output next to the
+        # destination even with a temp path in its config, and finishing is a rename.
+        download_dir = os.path.abspath(item.get("download_dir") or self.settings["download_dir"])
+        if download_playlist:
+            return os.path.join(download_dir, "%(playlist_title)s/%(playlist_index)s - %(title)s [%(id)s].%(ext)s")
+        return os.path.join(download_dir, "%(title)s [%(id)s].%(ext)s")
+
+    def _format_args(self, item):
+        video_format = self.settings["video_format"]
+        if item['audio_only']:
+            format_cmd = ["-f", "bestaudio/best", "-x", "--audio-format", self.settings["audio_format"]]
+            if item['embed_thumbnail']:
+                format_cmd.append("--embed-thumbnail")
+        else:
+            quality = item.get('quality', self.settings["quality"]).replace('p', '')
+            format_cmd = ["-f", f"bestvideo[ext={video_format}][height<={quality}]+bestaudio/best[ext={video_format}]/best[ext={video_format}]", "--merge-output-format", video_format]
+        return format_cmd
+
+    def _playlist_args(self, is_playlist, download_playlist, item):
+        if item.get("from_playlist"):
+            return ["--no-playlist"]
+        elif is_playlist:
+            return ["--yes-playlist"] if download_playlist else ["--no-playlist"]
+        return []
+
+    def _noplaylist(self, item):
+        """Whether item downloads just the video even if its URL also names a playlist."""
+        return self._playlist_args('list=' in item['url'], item.get("from_playlist"), item) != ["--yes-playlist"]
+
+    def _ytdlp_params(self, item, is_playlist, download_playlist, aria2_plan=None):
+        """The YoutubeDL options equivalent to build_command, for the library engine."""
+        params = {
+            'outtmpl': {'default': self._output_template(item, download_playlist)},
+            'external_downloader': {'default': ARIA2C_PATH},
+            'external_downloader_args': {'default': self._aria2_args(aria2_plan)},
+            'updatetime': False,
+            'noplaylist': self._playlist_args(is_playlist, download_playlist, item) != ["--yes-playlist"],
+        }
+        if item['audio_only']:
+            params['format'] = "bestaudio/best"
+            params['postprocessors'] = [{'key': 'FFmpegExtractAudio', 'preferredcodec': self.settings["audio_format"]}]
+            if item['embed_thumbnail']:
+                params['writethumbnail'] = True
+                params['postprocessors'].append({'key': 'EmbedThumbnail'})
+        else:
+            # Same selector as the command line, without the "-f" flag.
+            params['format'] = self._format_args(item)[1]
+            params['merge_output_format'] = self.settings["video_format"]
+        return params
+
+    def build_command(self, url, is_playlist, download_playlist, item, rate_limit=None, aria2_plan=None,
+                      info_path=None, staging=None):
+        """The yt-dlp command line for item; rate_limit is in bytes/s and fixed for the whole run.
+
+        With info_path, yt-dlp starts from that -J output instead of extracting url again.
+        staging is a (format_cmd, output_template) pair from _staging_args that
+        replaces the item's own, so only the raw formats are downloaded.
+        """
+        base_cmd = [YT_DLP_PATH, "--load-info-json", info_path] if info_path else [YT_DLP_PATH, url]
+        format_cmd, output_template = staging or (self._format_args(item),
+                                                  self._output_template(item, download_playlist))
+        playlist_cmd = self._playlist_args(is_playlist, download_playlist, item)
+
+        remaining_cmd = [
+            "--external-downloader", ARIA2C_PATH,
+            "--external-downloader-args", " ".join(self._aria2_args(aria2_plan)),
+            "-o", output_template,
+            "--no-mtime", "--progress"
+        ] + progress_args()
+        if rate_limit:
+            # yt-dlp hands this on to aria2c as --max-overall-download-limit.
+            remaining_cmd += ["--limit-rate", str(rate_limit)]
+        return base_cmd + format_cmd + playlist_cmd + remaining_cmd
+
+    def _postprocess_separately(self, item, info):
+        """Whether item's download leaves merging or conversion work for the post-processing pool."""
+        return bool(self.settings["postprocess_pipeline"] and info and info.get('_type', 'video') == 'video'
+                    and info.get('filename') and (info.get('requested_formats') or item['audio_only']))
+
+    def _staging_args(self, info):
+        """-f and -o that download info's selected formats, unprocessed, to where yt-dlp's own merge looks for them."""
+        filename = info['filename'].replace('%', '%%')
+        if info.get('requested_formats'):
+            format_ids = ",".join(f['format_id'] for f in info['requested_formats'])
+            return ["-f", format_ids], f"{os.path.splitext(filename)[0]}.f%(format_id)s.%(ext)s"
+        return ["-f", info['format_id']], filename
+
+    def _finalize_command(self, item, info_path):
+        """yt-dlp run that finds item's formats already downloaded and only merges/converts them."""
+        return ([YT_DLP_PATH, "--load-info-json", info_path] + self._format_args(item) +
+                ["-o", self._output_template(item, item.get("from_playlist")), "--no-mtime", "--progress"] +
+                progress_args())
+
+    def _hand_off(self, job, info):
+        """Queues job's post-processing on the pool and frees its download slot."""
+        with tempfile.NamedTemporaryFile("w", suffix=".info.json", delete=False, encoding='utf-8') as f:
+            json.dump(info, f)
+            info_path = f.name
+        cmd = self._finalize_command(job.item, info_path)
+        job.status = "merging"
+        self.job_store.set_state(job.id, "merging")
+        if job.timeline is not None:
+            job.timeline.enter("postprocess_wait")
+        self.emit({'type': 'job_postprocess_queued', 'job_id': job.id,
+                   'position': len(self.postprocessor.waiting_jobs()) + 1})
+
+        def run(job):
+            try:
+                if job.is_cancelled:
+                    self._cancel_job(job)
+                else:
+                    self.run_download(job, cmd)
+            finally:
+                os.remove(info_path)
+
+        self.postprocessor.submit(job, run)
+
+    def _finish_job(self, job, title, filepath=None, archive_id=None, worker=None):
+        """Records a completed download in the history and the archive, and reports it.
+
+        worker is the cluster worker that made the download; filepath is then a path on that machine.
+        """
+        history_entry = {
+            "url": job.url,
+            "title": title or job.item['title'],
+            "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        if worker:
+            history_entry['worker'] = worker
+            if filepath:
+                history_entry['remote_filepath'] = filepath
+            filepath = None
+        if filepath:
+            history_entry['filepath'] = filepath
+            if job.timeline is not None and os.path.isfile(filepath):
+                job.timeline.output_bytes = os.path.getsize(filepath)
+        history_entry['metrics'] = self._close_timeline(job, "done")
+        self.archive.add(job.url, archive_id, filepath, remote=bool(worker))
+        self.job_store.set_state(job.id, "done", output_path=filepath)
+        job.status = "done"
+        self.emit({'type': 'video_done', 'job_id': job.id, 'history_entry': self.history_store.append(history_entry)})
+
+    def _fail_job(self, job, error_message, details="", aria2_code=None, retry=True):
+        """Schedules another attempt if the kind of error allows one, otherwise reports the failure.
+
+        details is the rest of yt-dlp's stderr and aria2_code aria2c's exit
+        code or errorCode; both only help to classify the error.
+        """
+        # The failure may be an expired or revoked media URL; a retry resolves it again.
+        self.metadata_cache.invalidate(video_key(job.url), "resolved")
+        job.error_class = classify(error_message, details, aria2_code)
+        self.metrics.inc("downloader_job_errors_total", error_class=job.error_class)
+        if retry and self._schedule_retry(job, error_message):
+            return
+        self.job_store.set_state(job.id, "failed", error=error_message)
+        job.status = "failed"
+        self._close_timeline(job, "failed", error_message)
+        self.emit({'type': 'job_failed', 'job_id': job.id, 'error_message': error_message, 'url': job.url,
+                   'item': job.item, 'error_class': job.error_class})
+
+    def _on_job_crashed(self, job, exc):
+        """Fails a job whose run_job raised; called on its scheduler worker thread."""
+        row = self.job_store.get(job.id) or {}
+        if row.get("state") not in ("queued", "running"):
+            # Already finished, waiting to retry or handed to the postprocessor.
+            print(f"Download job {job.id} crashed after it left the scheduler: {exc}")
+            return
+        self._fail_job(job, f"Download crashed: {exc}", traceback.format_exc())
+
+    def _schedule_retry(self, job, error_message):
+        """Requeues job after its error class's backoff, without holding a worker. False if it is out of tries."""
+        if not self.settings["auto_retry"] or self.stopping or self.queue_cancelled or job.is_cancelled:
+            return False
+        attempt = (self.job_store.get(job.id) or {}).get("attempts", 1) + 1
+        delay = retry_delay(policy_for(job.error_class, self.settings["retry_policies"]), attempt)
+        if delay is None:
+            return False
+        job.status = "retrying"
+        job.error = error_message
+        self.job_store.set_state(job.id, "retrying", error=error_message)
+        self._requeue_later(job, delay, "retry_wait")
+        self.emit({'type': 'job_retrying', 'job_id': job.id, 'error_message': error_message,
+                   'error_class': job.error_class, 'attempt': attempt, 'delay': round(delay, 1)})
+        return True
+
+    def _requeue_later(self, job, delay, phase):
+        """Gives up job's slot and its disk reservation, and queues it again after delay seconds."""
+        self.disk.release(job.id)
+        if job.timeline is not None:
+            job.timeline.enter(phase)
+        timer = threading.Timer(delay, self._retry_now, args=(job,))
+        timer.daemon = True
+        with self.retry_lock:
+            self.retry_timers[job.id] = timer
+        timer.start()
+
+    def _admit_disk(self, job, info):
+        """Reserves the disk space job's download of info needs.
+
+        Returns False when the job has been deferred until running downloads
+        are done with their space, or failed because it can never fit.
+        """
+        if info is None:
+            size = self.metadata_cache.get(video_key(job.url), "filesize")
+            size, paths = (int(size * 2) if size else None), []
+        else:
+            size, paths = required_bytes(info, job.item['audio_only']), output_paths(info)
+        if not self.settings["disk_space_check"] or not size:
+            return True
+        directory = os.path.abspath(job.item.get("download_dir") or self.settings["download_dir"])
+        verdict = self.disk.admit(job.id, directory, size, paths)
+        if verdict == "ok":
+            return True
+        free = self.disk.free(directory)
+        if verdict == "wait" and not self.queue_cancelled and not job.is_cancelled:
+            # Not a real attempt; it has not downloaded anything.
+            attempts = self.job_store.get(job.id)["attempts"]
+            job.status = "deferred"
+            self.job_store.set_state(job.id, "deferred", attempts=max(0, attempts - 1))
+            self._requeue_later(job, RECHECK_INTERVAL, "disk_wait")
+            self.emit({'type': 'job_deferred', 'job_id': job.id, 'needed': size, 'free': free})
+            return False
+        self._fail_job(job, f"Not enough disk space in {directory}: needs {size // MIB} MiB, "
+                            f"{free // MIB} MiB free with {self.settings['disk_min_free_mb']} MiB kept spare")
+        return False
+
+    def _wake_deferred(self):
+        """Requeues the jobs waiting for disk space straight away, after a reservation was released."""
+        with self.retry_lock:
+            waiting = [(self.get_job(job_id), timer) for job_id, timer in self.retry_timers.items()]
+        for job, timer in waiting:
+            if job is not None and job.status == "deferred":
+                timer.cancel()
+                self._retry_now(job)
+
+    def _retry_now(self, job):
+        with self.retry_lock:
+            if job.id not in self.retry_timers:
+                return  # Cancelled or paused while waiting.
+            job.status = "queued"
+            self.job_store.set_state(job.id, "queued")
+            self.scheduler.submit(job)
+            # Dropped only once the scheduler has it, so the queue never looks idle in between.
+            del self.retry_timers[job.id]
+
+    def _cancel_retry(self, job_id):
+        """Stops job_id's pending retry and returns the job, or None if it is not waiting for one."""
+        with self.retry_lock:
+            timer = self.retry_timers.pop(job_id, None)
+        if timer is None:
+            return None
+        timer.cancel()
+        return self.get_job(job_id)
+
+    def _cancel_job(self, job):
+        if self.stopping:
+            return  # Left running in JOBS_DB, so the next start resumes it.
+        if job.paused:
+            self._pause_job(job)
+            return
+        self.job_store.set_state(job.id, "cancelled")
+        job.status = "cancelled"
+        self._close_timeline(job, "cancelled")
+        self.emit({'type': 'job_cancelled', 'job_id': job.id})
+
+    def _skip_job(self, job):
+        self.job_store.set_state(job.id, "skipped")
+        job.status = "skipped"
+        self._close_timeline(job, "skipped")
+        self.emit({'type': 'job_skipped', 'job_id': job.id, 'url': job.url})
+
+    def _pause_job(self, job):
+        self.job_store.set_state(job.id, "paused")
+        job.status = "paused"
+        self._close_timeline(job, "paused")
+        self.emit({'type': 'job_paused', 'job_id': job.id, 'item': job.item})
+
+    def run_download(self, job, cmd, on_success=None):
+        """Runs one yt-dlp process for job and reports its result.
+
+        on_success(final_info) replaces finishing the job when yt-dlp exits cleanly.
+        """
+        kwargs = {
+            'stdout': subprocess.PIPE, 'stderr': subprocess.PIPE,
+            'text': True, 'bufsize': 1, 'universal_newlines': True, 'encoding': 'utf-8'
+        }
+        if sys.platform != "win32":
+            kwargs['start_new_session'] = True
+
+        job.process = process = subprocess.Popen(cmd, **kwargs)
+
+        stderr_output = []
+        final_info = {}
+
+        def handle_line(line):
+            event = parse_line(line)
+            if event is None:
+                return False
+            if event['type'] == 'file_done':
+                final_info.update(event['info'])
+            else:
+                event['job_id'] = job.id
+                self.emit(event)
+            return True
+
+        def read_stdout(pipe):
+            for line in iter(pipe.readline, ''):
+                if job.is_cancelled: break
+                if not handle_line(line) and line.strip():
+                    self.emit({'type': 'status', 'job_id': job.id, 'text': line.strip()})
+            pipe.close()
+
+        def read_stderr(pipe, buffer):
+            # Postprocessor progress is printed to stderr.
+            for line in iter(pipe.readline, ''):
+                if not handle_line(line):
+                    buffer.append(line)
+            pipe.close()
+
+        stdout_thread = threading.Thread(target=read_stdout, args=(process.stdout,), daemon=True)
+        stderr_thread = threading.Thread(target=read_stderr, args=(process.stderr, stderr_output), daemon=True)
+
+        stdout_thread.start()
+        stderr_thread.start()
+
+        stdout_thread.join()
+        stderr_thread.join()
+
+        process.wait()
+        job.process = None
+
+        if job.is_cancelled:
+            self._cancel_job(job)
+            return
+
+        if process.returncode != 0:
+            error_message = "An unknown error occurred during download."
+            full_stderr = "".join(stderr_output)
+
+            if "ERROR: " in full_stderr:
+                match = re.search(r"ERROR: (.+)", full_stderr)
+                if match:
+                    error_message = match.group(1).strip()
+            elif "aria2c" in full_stderr and "error" in full_stderr.lower():
+                error_message = "aria2c encountered an error. Check console for details."
+
+            self._fail_job(job, error_message, full_stderr)
+        elif on_success is not None:
+            on_success(final_info)
+        else:
+            self._finish_job(job, final_info.get('title'), final_info.get('filepath'), archive_id(final_info))
+
+    def run_job(self, job):
+        """Runs one queued item to completion. Called on a scheduler worker thread."""
+        item = job.item
+        self._prefetch_upcoming()
+        if not item.get('force') and self.archive.is_downloaded(item['url'], self.settings["download_dir"]):
+            self._skip_job(job)
+            return
+        self.job_store.start(job.id)
+        if job.timeline is not None:
+            job.timeline.attempts = self.job_store.get(job.id)["attempts"]
+            job.timeline.enter("title" if item['title'] == 'Fetching title...' else "extract")
+        job.meter = ThroughputMeter()
+        job.aria2_plan = None
+        self.emit({'type': 'job_started', 'job_id': job.id, 'title': item['title']})
+        if self.coordinator is not None:
+            self.coordinator.run_remote(job)
+            return
+        # A prefetch already probing this item is cheaper to wait for than to repeat.
+        self.prefetcher.wait(job.id)
+
+        # Fetch title if necessary
+        if item['title'] == 'Fetching title...':
+            item['title'] = self.metadata_cache.get(video_key(item['url']), "title") or item['title']
+        if item['title'] == 'Fetching title...':
+            try:
+                if self.use_library_engine():
+                    item['title'] = self.ytdlp_engine.get_title(item['url'], noplaylist=self._noplaylist(item))
+                elif self._noplaylist(item):
+                    # The -J output the download starts from has the title too, so
+                    # yt-dlp is not run once more just for that.
+                    item['title'] = self.resolved_info(item).get('title') or item['url']
+                else:
+                    title_cmd = [YT_DLP_PATH, "--get-title", item['url']]
+                    item['title'] = subprocess.check_output(title_cmd, text=True, encoding='utf-8',
+                                                            stderr=subprocess.PIPE).strip()
+                self.metadata_cache.put(video_key(item['url']), "title", item['title'])
+                self.emit({'type': 'job_started', 'job_id': job.id, 'title': item['title']})
+            except Exception as e:
+                self._fail_job(job, f"Error fetching title for {item['url']}", getattr(e, 'stderr', None) or str(e))
+                return
+
+        if job.is_cancelled:
+            self._cancel_job(job)
+            return
+
+        if job.timeline is not None:
+            # Until the first progress event: resolving formats, inside yt-dlp or before aria2c.
+            job.timeline.enter("extract")
+        try:
+            if self.settings["download_backend"] == "rpc":
+                self.run_rpc_download(job)
+            elif self.use_library_engine():
+                self.run_library_download(job)
+            else:
+                self.run_spawned_download(job)
+        finally:
+            # Speeds held down by a rate limit say nothing about the host.
+            if self.bandwidth.allocations().get(job.id) is None:
+                self._record_throughput(job)
+            self.bandwidth.unregister(job.id)
+
+    def run_spawned_download(self, job):
+        """Downloads with a yt-dlp process, whose rate limit cannot change once it runs."""
+        item = job.item
+        rate_limit = self.bandwidth.register(job.id, item.get("rate_limit"))
+        info = self.resolved_info(item, fetch=False)
+        playlist_cmd = self._playlist_args('list=' in item['url'], item.get("from_playlist"), item)
+        # Also true once a resolve has shown that the URL gives a playlist.
+        whole_playlist = playlist_cmd == ["--yes-playlist"] or (info is not None and
+                                                                info.get('_type', 'video') != 'video')
+        if whole_playlist:
+            info = None
+        if info is None and (self.settings["postprocess_pipeline"] or self.settings["disk_space_check"]) \
+                and not whole_playlist:
+            # Knowing the formats up front is what lets the download end before ffmpeg starts,
+            # and what tells how much disk space it needs.
+            try:
+                info = self.resolved_info(item)
+            except (subprocess.CalledProcessError, json.JSONDecodeError):
+                info = None
+            if info is not None and info.get('_type', 'video') != 'video':
+                info = None
+        if not whole_playlist and not self._admit_disk(job, info):
+            return
+        if info is None:
+            cmd = self.build_command(item['url'], 'list=' in item['url'], item.get("from_playlist"), item, rate_limit,
+                                     self.plan_aria2(job))
+            self.run_download(job, cmd)
+            return
+
+        # Prefetched: start transferring straight away instead of extracting again.
+        with tempfile.NamedTemporaryFile("w", suffix=".info.json", delete=False, encoding='utf-8') as f:
+            json.dump(info, f)
+            info_path = f.name
+        try:
+            filesize = sum(fmt.get('filesize') or fmt.get('filesize_approx') or 0
+                           for fmt in info.get('requested_formats') or [info])
+            if self._postprocess_separately(item, info):
+                cmd = self.build_command(item['url'], False, item.get("from_playlist"), item, rate_limit,
+                                         self.plan_aria2(job, filesize, info), info_path, self._staging_args(info))
+                self.run_download(job, cmd, on_success=lambda final_info: self._hand_off(job, info))
+            else:
+                cmd = self.build_command(item['url'], False, item.get("from_playlist"), item, rate_limit,
+                                         self.plan_aria2(job, filesize, info), info_path)
+                self.run_download(job, cmd)
+        finally:
+            os.remove(info_path)
+
+    def run_library_download(self, job):
+        """Downloads with the in-process yt-dlp, reusing the info dict extracted for the title."""
+        item = job.item
+        if self._playlist_args('list=' in item['url'], item.get("from_playlist"), item) != ["--yes-playlist"]:
+            # The formats are only chosen inside yt-dlp; the size comes from a prefetch, if there was one.
+            if not self._admit_disk(job, None):
+                return
+        params = self._ytdlp_params(item, 'list=' in item['url'], item.get("from_playlist"),
+                                    None if self.bandwidth.is_limited() else self.plan_aria2(job))
+        if self.bandwidth.is_limited():
+            # Only yt-dlp's own downloader reads the limit again while it runs.
+            del params['external_downloader'], params['external_downloader_args']
+        downloaders = []
+
+        def set_rate_limit(rate):
+            params['ratelimit'] = rate
+            for ydl in downloaders:
+                ydl.params['ratelimit'] = rate
+
+        def on_start(ydl):
+            downloaders.append(ydl)
+            ydl.params['ratelimit'] = params['ratelimit']  # In case it changed since params were copied.
+
+        params['ratelimit'] = self.bandwidth.register(job.id, item.get("rate_limit"), apply=set_rate_limit)
+
+        def on_progress(status):
+            self.emit(dict(download_event(status), job_id=job.id))
+
+        def on_postprocess(status):
+            self.emit(dict(postprocess_event(status), job_id=job.id))
+
+        try:
+            info = self.ytdlp_engine.download(item['url'], params, on_progress, job.cancel_event,
+                                              postprocess_hook=on_postprocess, on_start=on_start)
+        except DownloadCancelledError:
+            self._cancel_job(job)
+            return
+        except Exception as e:
+            error_message = str(e).replace("ERROR: ", "", 1).strip() or "An unknown error occurred during download."
+            self._fail_job(job, error_message)
+            return
+        finally:
+            # Signed format URLs expire, so a retry must extract again.
+            self.ytdlp_engine.forget(item['url'])
+
+        downloads = info.get('requested_downloads') or [info]
+        self._finish_job(job, info.get('title'), downloads[-1].get('filepath'), archive_id(info))
+
+    def get_aria2_daemon(self):
+        with self.aria2_lock:
+            if self.aria2_daemon is None:
+                self.aria2_daemon = Aria2Daemon(ARIA2C_PATH, max_connections=self.connections_per_job())
+            self.aria2_daemon.start()
+            return self.aria2_daemon
+
+    def run_rpc_download(self, job):
+        """Downloads through the shared aria2c daemon, then lets yt-dlp merge and post-process.
+
+        yt-dlp resolves the media URLs once with -J, usually ahead of time in the
+        prefetcher. aria2c fetches each format to
+        the exact path yt-dlp would use for it, so the final --load-info-json run
+        finds the files already present and only merges/converts them. That run
+        goes to the post-processing pool when there is anything to convert.
+        """
+        item = job.item
+        try:
+            info = self.resolved_info(item)
+        except (subprocess.CalledProcessError, json.JSONDecodeError):
+            info = None
+
+        formats = []
+        if info and info.get('_type', 'video') == 'video' and info.get('filename'):
+            formats = info.get('requested_formats') or [info]
+        if not formats or any(f.get('protocol') not in ('http', 'https') or not f.get('url') for f in formats):
+            # Whole playlists and fragmented (HLS/DASH) formats stay on the per-item downloader.
+            self.run_spawned_download(job)
+            return
+
+        if not self._admit_disk(job, info):
+            return
+        self.job_store.set_state(job.id, job.status, output_path=info['filename'])
+        gids = []
+
+        def set_rate_limit(rate):
+            # A job's formats download side by side, so they split its share.
+            for gid in list(gids):
+                daemon.set_limit(gid, rate // len(gids) if rate else None)
+
+        try:
+            daemon = self.get_aria2_daemon()
+            rate_limit = self.bandwidth.register(job.id, item.get("rate_limit"), apply=set_rate_limit)
+            filesize = sum(f.get('filesize') or f.get('filesize_approx') or 0 for f in formats)
+            options = dict(aria2_options(self.plan_aria2(job, filesize, info)),
+                           **{"file-allocation": self.settings["file_allocation"]})
+            if rate_limit:
+                options["max-download-limit"] = str(rate_limit // len(formats))
+            for f in formats:
+                if info.get('requested_formats'):
+                    path = f"{os.path.splitext(info['filename'])[0]}.f{f['format_id']}.{f['ext']}"
+                else:
+                    path = info['filename']
+                if os.path.isfile(path) and not os.path.exists(path + ".aria2"):
+                    continue  # Already fully downloaded by an earlier run.
+                gid = daemon.find_by_path(path)
+                if gid is None:
+                    gid = daemon.add_uri(f['url'], os.path.dirname(path) or ".", os.path.basename(path),
+                                         headers=f.get('http_headers'), options=options)
+                elif rate_limit:
+                    daemon.set_limit(gid, rate_limit // len(formats))
+                gids.append(gid)
+        except (Aria2RPCError, OSError) as e:
+            self._fail_job(job, f"aria2c RPC error: {e}")
+            return
+
+        statuses = {}
+        status_lock = threading.Lock()
+        finished = threading.Event()
+
+        def on_status(status):
+            with status_lock:
+                statuses[status['gid']] = status
+                current = list(statuses.values())
+            self.emit(dict(aria2_event(current), job_id=job.id))
+            if len(current) == len(gids) and all(s['status'] not in ('active', 'waiting', 'paused')
+                                                 for s in current):
+                finished.set()
+
+        for gid in gids:
+            daemon.watch(gid, on_status)
+        if not gids:
+            finished.set()
+
+        retuned = False
+        while not finished.wait(0.5):
+            if not retuned and job.meter.seconds >= RETUNE_AFTER and self.bandwidth.allocations().get(job.id) is None:
+                retuned = True
+                self._retune_aria2(job, daemon, gids, filesize)
+            if job.is_cancelled:
+                # Removing keeps the partial file and its .aria2 control file, so a later run resumes.
+                for gid in gids:
+                    daemon.unwatch(gid)
+                    if not self.stopping:
+                        daemon.remove(gid)
+                self._cancel_job(job)
+                return
+
+        failed = [s for s in statuses.values() if s['status'] != 'complete']
+        if failed:
+            code = failed[0].get('errorCode')
+            self._fail_job(job, failed[0].get('errorMessage') or f"aria2c error {code}",
+                           aria2_code=int(code) if code else None)
+            return
+
+        if self._postprocess_separately(item, info):
+            self._hand_off(job, info)
+            return
+        with tempfile.NamedTemporaryFile("w", suffix=".info.json", delete=False, encoding='utf-8') as f:
+            json.dump(info, f)
+            info_path = f.name
+        try:
+            self.run_download(job, self._finalize_command(item, info_path))
+        finally:
+            os.remove(info_path)
+
+    def shutdown(self):
+        """Stops running downloads without marking them finished, so the next start resumes them."""
+        self.stopping = True
+        with self.retry_lock:
+            # Left as "retrying" in JOBS_DB, so the next start runs them again.
+            for timer in self.retry_timers.values():
+                timer.cancel()
+            self.retry_timers.clear()
+        if self.coordinator is not None:
+            self.coordinator.stop()
+        self.prefetcher.shutdown()
+        self.postprocessor.shutdown()
+        for job in self.scheduler.active_jobs() + self.postprocessor.active_jobs():
+            job.cancel()
+        if self.aria2_daemon:
+            self.aria2_daemon.stop()
+        self.metadata_cache.flush()
@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import deque
+
+# Only the latest of these matters, so a newer one replaces any still waiting for the same job.
+COALESCED_TYPES = ("progress", "status")
+# Each event stream subscriber holds at most this many undelivered events;
+# a client that stops reading loses the oldest ones first.
+SUBSCRIBER_MAX_EVENTS = 5000
+
+
+class EventQueue:
+    """Thread-safe event queue drained in batches by the UI thread.
+
+    Progress and status events (COALESCED_TYPES) are coalesced per job:
+    while one for a job is still waiting to be delivered, a newer one
+    replaces it in place instead of being queued behind it, so the queue
+    holds at most one of each per job no matter how fast workers report.
+    Other events are all kept, unless max_events is set: then the oldest
+    are dropped to make room. Every event is stamped on put so the consumer
+    can measure how far behind it is running.
+    """
+
+    def __init__(self, latency_window=50, max_events=None):
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self._events = deque()
+        self._latest = {}
+        self._latencies = deque(maxlen=latency_window)
+        self.put_count = 0
+        self.delivered_count = 0
+        self.coalesced_count = 0
+        self.dropped_count = 0
+        self.last_batch_size = 0
+
+    def put(self, msg):
+        now = time.monotonic()
+        with self._lock:
+            self.put_count += 1
+            if msg.get('type') in COALESCED_TYPES:
+                key = (msg['type'], msg.get('job_id'))
+                pending = self._latest.get(key)
+                if pending is not None:
+                    # Keep the original timestamp so latency reflects the oldest undelivered update.
+                    msg['ts'] = pending['ts']
+                    self._latest[key] = msg
+                    self.coalesced_count += 1
+                    return
+                msg['ts'] = now
+                self._latest[key] = msg
+                self._events.append(key)
+            else:
+                msg.setdefault('ts', now)
+                self._events.append(msg)
+            while self.max_events is not None and len(self._events) > self.max_events:
+                event = self._events.popleft()
+                if isinstance(event, tuple):
+                    del self._latest[event]
+                self.dropped_count += 1
+
+    def qsize(self):
+        with self._lock:
+            return len(self._events)
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def drain(self, limit=None):
+        """Removes and returns up to limit pending events, oldest first."""
+        now = time.monotonic()
+        batch = []
+        with self._lock:
+            while self._events and (limit is None or len(batch) < limit):
+                event = self._events.popleft()
+                if isinstance(event, tuple):
+                    event = self._latest.pop(event)
+                batch.append(event)
+            self.delivered_count += len(batch)
+            self.last_batch_size = len(batch)
+            if batch:
+                self._latencies.append(now - batch[0]['ts'])
+        return batch
+
+    def stats(self):
+        with self._lock:
+            latencies = list(self._latencies)
+            return {
+                'depth': len(self._events),
+                'put': self.put_count,
+                'delivered': self.delivered_count,
+                'coalesced': self.coalesced_count,
+                'dropped': self.dropped_count,
+                'last_batch': self.last_batch_size,
+                'latency_ms': latencies[-1] * 1000 if latencies else 0.0,
+                'max_latency_ms': max(latencies) * 1000 if latencies else 0.0,
+            }
+
+
+class EventBroadcaster:
+    """Fans events out to any number of subscribers without blocking the publisher.
+
+    Publishing only puts the event into a single coalescing inbox, so a
+    download worker pays the same small cost whether nobody or a hundred
+    clients are listening. A background thread copies each drained batch into
+    one EventQueue per subscriber. Those coalesce progress and status per job
+    as well and hold at most SUBSCRIBER_MAX_EVENTS events, so a slow
+    subscriber costs bounded memory and loses its oldest events first.
+    """
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self._inbox = EventQueue()
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._thread = None
+
+    def publish(self, msg):
+        if self._subscribers:
+            self._inbox.put(dict(msg))
+
+    def subscribe(self):
+        subscriber = EventQueue(max_events=SUBSCRIBER_MAX_EVENTS)
+        with self._lock:
+            self._subscribers = self._subscribers + [subscriber]
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s is not subscriber]
+
+    def _run(self):
+        while True:
+            events = self._inbox.drain()
+            for subscriber in self._subscribers:
+                for event in events:
+                    subscriber.put(dict(event))
+            time.sleep(self.interval)
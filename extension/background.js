@@ -9,12 +9,14 @@ chrome.runtime.onMessage.addListener((request, sender, sendResponse) => {
       })
         .then(response => response.json())
         .then(result => {
-          if (result.status === "queued") {
+          if (result.status === "queued" || result.status === "duplicate") {
             chrome.notifications.create({
               type: "basic",
               iconUrl: "icon.png",
               title: "Aria Downloader",
-              message: "Video has been queued for download!"
+              message: result.status === "queued"
+                ? "Video has been queued for download!"
+                : "This video is already queued or downloaded."
             });
           } else {
             console.error("Failed to send download:", result.error);
@@ -0,0 +1,1152 @@
+import os
+import subprocess
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import tkinter as tk
+from tkinter import filedialog, messagebox, END, NORMAL, DISABLED
+from tkinterdnd2 import DND_FILES, TkinterDnD
+import ttkbootstrap as ttk
+from ttkbootstrap.constants import *
+import sys
+from engine import DOWNLOAD_BACKENDS, EXTRACTION_ENGINES
+from instance import API_HOST, API_PORT
+from video_ids import video_key, playlist_key
+
+# Playlist entries are handed to the UI in batches of this size, or sooner
+# if this many seconds pass without a full batch.
+PLAYLIST_BATCH_SIZE = 50
+PLAYLIST_BATCH_INTERVAL = 0.3
+# History rows are loaded into the treeview this many at a time, as the user
+# scrolls towards the end of what is already shown.
+HISTORY_PAGE_SIZE = 200
+# The UI event pump runs every PUMP_ACTIVE_INTERVAL ms while events are
+# flowing or downloads are running, and backs off to PUMP_IDLE_INTERVAL ms
+# when nothing is happening.
+PUMP_ACTIVE_INTERVAL = 50
+PUMP_IDLE_INTERVAL = 250
+PUMP_MAX_EVENTS = 500
+
+
+def format_bytes(num):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(num) < 1024:
+            return f"{num:.2f}{unit}"
+        num /= 1024
+    return f"{num:.2f}TiB"
+
+
+class PlaylistSelectionWindow(ttk.Toplevel):
+    def __init__(self, master, app_instance, videos, original_url, download_now, loading=False, on_close=None):
+        super().__init__(master)
+        self.title("Select Playlist Videos")
+        self.geometry("800x600")
+        self.app = app_instance
+        self.videos = videos
+        self.original_url = original_url
+        self.download_now = download_now
+        self.loading = loading
+        self.on_close = on_close
+        self.selected_videos = {}
+
+        self.create_widgets()
+        self.populate_videos()
+        self.protocol("WM_DELETE_WINDOW", self.close)
+
+    def create_widgets(self):
+        # Select All/None buttons
+        button_frame = ttk.Frame(self, padding=10)
+        button_frame.pack(fill=tk.X)
+        ttk.Button(button_frame, text="Select All", command=self.select_all).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Select None", command=self.select_none).pack(side=tk.LEFT, padx=5)
+        self.count_var = ttk.StringVar()
+        ttk.Label(button_frame, textvariable=self.count_var).pack(side=tk.RIGHT, padx=5)
+
+        # Treeview for videos
+        self.tree = ttk.Treeview(self, columns=('select', 'title', 'id'), show='headings')
+        self.tree.heading('select', text='Select', anchor=tk.CENTER)
+        self.tree.heading('title', text='Title')
+        self.tree.heading('id', text='ID')
+
+        self.tree.column('select', width=50, anchor=tk.CENTER)
+        self.tree.column('title', width=500)
+        self.tree.column('id', width=150)
+
+        self.tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.tree.bind("<Button-1>", self.on_tree_click)
+
+        # Download/Cancel buttons
+        action_frame = ttk.Frame(self, padding=10)
+        action_frame.pack(fill=tk.X)
+        ttk.Button(action_frame, text="Download Selected", command=self.download_selected).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(action_frame, text="Cancel", command=self.close).pack(side=tk.RIGHT, padx=5)
+
+    def populate_videos(self):
+        self.append_videos(self.videos)
+
+    def append_videos(self, videos):
+        for video in videos:
+            item_id = self.tree.insert('', tk.END, values=('☐', video['title'], video['id']))
+            self.selected_videos[item_id] = {'selected': False, 'queued': False, 'data': video}
+        if videos is not self.videos:
+            self.videos.extend(videos)
+        self._update_count()
+
+    def finish_loading(self):
+        self.loading = False
+        self._update_count()
+
+    def _update_count(self):
+        suffix = " (loading...)" if self.loading else ""
+        self.count_var.set(f"{len(self.selected_videos)} videos{suffix}")
+
+    def close(self):
+        if self.on_close:
+            self.on_close()
+        self.destroy()
+
+    def on_tree_click(self, event):
+        region = self.tree.identify("region", event.x, event.y)
+        if region == "heading":
+            return
+
+        item_id = self.tree.identify_row(event.y)
+        if not item_id: return
+
+        column = self.tree.identify_column(event.x)
+        if column == '#1' and not self.selected_videos[item_id]['queued']:  # The 'select' column
+            current_state = self.selected_videos[item_id]['selected']
+            new_state = not current_state
+            self.selected_videos[item_id]['selected'] = new_state
+            self.tree.set(item_id, 'select', '☑' if new_state else '☐')
+
+    def select_all(self):
+        for item_id in self.tree.get_children():
+            if not self.selected_videos[item_id]['queued']:
+                self.selected_videos[item_id]['selected'] = True
+                self.tree.set(item_id, 'select', '☑')
+
+    def select_none(self):
+        for item_id in self.tree.get_children():
+            if not self.selected_videos[item_id]['queued']:
+                self.selected_videos[item_id]['selected'] = False
+                self.tree.set(item_id, 'select', '☐')
+
+    def download_selected(self):
+        selected_urls = []
+        for item_id, data in self.selected_videos.items():
+            if data['selected'] and not data['queued']:
+                selected_urls.append(data['data']['url'])
+                if self.loading:
+                    data['queued'] = True
+                    self.tree.set(item_id, 'select', '✔')
+
+        if not selected_urls:
+            messagebox.showwarning("No Videos Selected", "Please select at least one video to download.")
+            return
+
+        # While the playlist is still being listed, keep the window open so
+        # more entries can be picked as they arrive.
+        if not self.loading:
+            self.destroy()
+        self.app.process_playlist_selection(selected_urls, self.download_now)
+
+
+class FailedJobsWindow(ttk.Toplevel):
+    """Jobs that failed for good, with their errors. Non-modal; the queue keeps running."""
+
+    def __init__(self, master, app_instance):
+        super().__init__(master)
+        self.title("Failed Downloads")
+        self.geometry("800x400")
+        self.app = app_instance
+        self.create_widgets()
+        self.refresh()
+        self.protocol("WM_DELETE_WINDOW", self.close)
+
+    def create_widgets(self):
+        self.tree = ttk.Treeview(self, columns=('title', 'error', 'url'), show='headings')
+        self.tree.heading('title', text='Title')
+        self.tree.heading('error', text='Error')
+        self.tree.heading('url', text='Video URL')
+        self.tree.column('title', width=250)
+        self.tree.column('error', width=350)
+        self.tree.column('url', width=200)
+        self.tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        action_frame = ttk.Frame(self, padding=10)
+        action_frame.pack(fill=tk.X)
+        ttk.Button(action_frame, text="Retry Selected", command=self.retry_selected).pack(side=tk.LEFT, padx=5)
+        ttk.Button(action_frame, text="Retry All", command=self.retry_all).pack(side=tk.LEFT, padx=5)
+        ttk.Button(action_frame, text="Dismiss Selected", command=self.dismiss_selected).pack(side=tk.LEFT, padx=5)
+        ttk.Button(action_frame, text="Close", command=self.close).pack(side=tk.RIGHT, padx=5)
+
+    def refresh(self):
+        self.tree.delete(*self.tree.get_children())
+        for job_id, msg in self.app.failed_jobs.items():
+            item = msg.get('item') or {}
+            self.tree.insert('', tk.END, iid=job_id,
+                             values=(item.get('title', ''), msg.get('error_message', ''), msg.get('url', '')))
+
+    def retry_selected(self):
+        self.app.retry_failed(self.tree.selection())
+
+    def retry_all(self):
+        self.app.retry_failed(list(self.app.failed_jobs))
+
+    def dismiss_selected(self):
+        self.app.dismiss_failed(self.tree.selection())
+
+    def close(self):
+        self.app.failed_window = None
+        self.destroy()
+
+
+class HistoryViewModel:
+    """Keeps the queue/history treeview in sync by applying row-level changes.
+
+    Queue rows are keyed by item id and history rows by their database id, so
+    a status change or a completed download touches a single row. History is
+    read from the store a page at a time, only when the user scrolls near the
+    end of the rows already shown.
+    """
+
+    def __init__(self, tree, history_store, page_size=HISTORY_PAGE_SIZE):
+        self.tree = tree
+        self.history_store = history_store
+        self.page_size = page_size
+        self.queue_iids = []
+        self.oldest_loaded_id = None
+        self.exhausted = False
+
+    def reload(self, queue_rows=(), load_history=True):
+        """Rebuilds the view from scratch; queue_rows is a list of (item, status).
+
+        Without load_history no history is shown until add_page is given the first page.
+        """
+        self.tree.delete(*self.tree.get_children())
+        self.queue_iids = []
+        self.oldest_loaded_id = None
+        self.exhausted = not load_history
+        for item, status in queue_rows:
+            self.upsert_item(item, status)
+        if load_history:
+            self.load_more()
+
+    def upsert_item(self, item, status):
+        iid = f"q:{item['id']}"
+        values = (status, item.get('title', 'N/A'), "", item.get('url', 'N/A'))
+        if self.tree.exists(iid):
+            self.tree.item(iid, values=values)
+        else:
+            self.tree.insert(parent='', index=len(self.queue_iids), iid=iid, values=values)
+            self.queue_iids.append(iid)
+
+    def set_title(self, item_id, title):
+        iid = f"q:{item_id}"
+        if self.tree.exists(iid):
+            values = list(self.tree.item(iid, "values"))
+            values[1] = title
+            self.tree.item(iid, values=values)
+
+    def remove_item(self, item_id):
+        iid = f"q:{item_id}"
+        if self.tree.exists(iid):
+            self.tree.delete(iid)
+            self.queue_iids.remove(iid)
+
+    def _history_values(self, entry):
+        return ("Completed", entry.get('title', 'N/A'), entry.get('date', 'N/A'), entry.get('url', 'N/A'))
+
+    def add_history(self, entry):
+        self.tree.insert(parent='', index=len(self.queue_iids), iid=f"h:{entry['id']}",
+                         values=self._history_values(entry))
+        if self.oldest_loaded_id is None:
+            self.oldest_loaded_id = entry['id']
+
+    def clear_history(self):
+        queued = set(self.queue_iids)
+        self.tree.delete(*[iid for iid in self.tree.get_children() if iid not in queued])
+        self.oldest_loaded_id = None
+        self.exhausted = True
+
+    def load_more(self):
+        if self.exhausted:
+            return
+        self.add_page(self.history_store.recent(self.page_size, before_id=self.oldest_loaded_id))
+
+    def add_page(self, entries):
+        """Appends a page of history entries, newest first, read with history_store.recent."""
+        for entry in entries:
+            if not self.tree.exists(f"h:{entry['id']}"):
+                self.tree.insert(parent='', index=END, iid=f"h:{entry['id']}", values=self._history_values(entry))
+        if entries:
+            self.oldest_loaded_id = entries[-1]['id']
+        self.exhausted = len(entries) < self.page_size
+
+    def on_scroll(self, first, last):
+        if float(last) > 0.9:
+            self.load_more()
+
+
+class SettingsWindow(ttk.Toplevel):
+    def __init__(self, master, app_instance):
+        super().__init__(master)
+        self.title("Settings")
+        self.geometry("400x580")
+        self.app = app_instance
+
+        self.create_widgets()
+
+    def create_widgets(self):
+        # Theme Selector
+        theme_frame = ttk.Frame(self, padding=10)
+        theme_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(theme_frame, text="Theme:").pack(side=tk.LEFT, padx=(0, 5))
+        self.theme_selector = ttk.Combobox(theme_frame, textvariable=self.app.theme_var, values=self.app.style.theme_names(),
+                                           state="readonly", width=15)
+        self.theme_selector.pack(side=tk.LEFT, padx=5)
+        self.theme_selector.bind("<<ComboboxSelected>>", self.app.change_theme)
+
+        # Save Location
+        save_location_frame = ttk.Frame(self, padding=10)
+        save_location_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(save_location_frame, text="Download Folder:").pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Entry(save_location_frame, textvariable=self.app.download_dir, state="readonly").pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        ttk.Button(save_location_frame, text="Browse", command=self.app.select_folder).pack(side=tk.LEFT, padx=5)
+
+        # Video Format
+        video_format_frame = ttk.Frame(self, padding=10)
+        video_format_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(video_format_frame, text="Video Format:").pack(side=tk.LEFT, padx=(0, 5))
+        self.video_format_selector = ttk.Combobox(video_format_frame, textvariable=self.app.video_format_var, values=["mp4", "mkv", "webm"],
+                                                  state="readonly", width=15)
+        self.video_format_selector.pack(side=tk.LEFT, padx=5)
+
+        # Audio Format
+        audio_format_frame = ttk.Frame(self, padding=10)
+        audio_format_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(audio_format_frame, text="Audio Format:").pack(side=tk.LEFT, padx=(0, 5))
+        self.audio_format_selector = ttk.Combobox(audio_format_frame, textvariable=self.app.audio_format_var, values=["mp3", "m4a", "wav"],
+                                                  state="readonly", width=15)
+        self.audio_format_selector.pack(side=tk.LEFT, padx=5)
+
+        # Parallel Downloads
+        workers_frame = ttk.Frame(self, padding=10)
+        workers_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(workers_frame, text="Parallel Downloads:").pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Spinbox(workers_frame, from_=1, to=16, textvariable=self.app.max_workers_var, width=5,
+                    state="readonly").pack(side=tk.LEFT, padx=5)
+        ttk.Label(workers_frame, text="Max per Host:").pack(side=tk.LEFT, padx=(10, 5))
+        ttk.Spinbox(workers_frame, from_=1, to=16, textvariable=self.app.max_per_host_var, width=5,
+                    state="readonly").pack(side=tk.LEFT, padx=5)
+
+        # Speed Limit
+        rate_limit_frame = ttk.Frame(self, padding=10)
+        rate_limit_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(rate_limit_frame, text="Speed Limit (KiB/s, 0 = unlimited):").pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Spinbox(rate_limit_frame, from_=0, to=1048576, increment=256, textvariable=self.app.rate_limit_var,
+                    width=10).pack(side=tk.LEFT, padx=5)
+
+        # Download Backend
+        backend_frame = ttk.Frame(self, padding=10)
+        backend_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(backend_frame, text="Download Backend:").pack(side=tk.LEFT, padx=(0, 5))
+        self.backend_selector = ttk.Combobox(backend_frame, textvariable=self.app.download_backend_var,
+                                             values=DOWNLOAD_BACKENDS, state="readonly", width=15)
+        self.backend_selector.pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(backend_frame, text="Tune aria2c connections", variable=self.app.aria2_tuning_var,
+                        bootstyle="round-toggle").pack(side=tk.LEFT, padx=10)
+
+        # Extraction Engine
+        engine_frame = ttk.Frame(self, padding=10)
+        engine_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(engine_frame, text="Extraction Engine:").pack(side=tk.LEFT, padx=(0, 5))
+        self.engine_selector = ttk.Combobox(engine_frame, textvariable=self.app.extraction_engine_var,
+                                            values=EXTRACTION_ENGINES, state="readonly", width=15)
+        self.engine_selector.pack(side=tk.LEFT, padx=5)
+
+        # Update yt-dlp
+        update_frame = ttk.Frame(self, padding=10)
+        update_frame.pack(fill=tk.X, pady=5)
+        ttk.Button(update_frame, text="Update yt-dlp", command=self.app.update_yt_dlp).pack(side=tk.LEFT, padx=5)
+
+        # Clear History
+        clear_history_frame = ttk.Frame(self, padding=10)
+        clear_history_frame.pack(fill=tk.X, pady=5)
+        ttk.Button(clear_history_frame, text="Clear History", command=self.app.clear_history).pack(side=tk.LEFT, padx=5)
+
+        # Save Button
+        save_button_frame = ttk.Frame(self, padding=10)
+        save_button_frame.pack(fill=tk.X, pady=5)
+        ttk.Button(save_button_frame, text="Save", command=self.save_settings).pack(side=RIGHT, padx=5)
+
+    def save_settings(self):
+        self.app.save_config()
+        self.app.update_scheduler_limits()
+        self.destroy()
+
+
+class DownloaderApp(ttk.Frame):
+    def __init__(self, master, style, engine, host=None, port=None):
+        super().__init__(master, padding=15)
+        self.pack(fill=BOTH, expand=YES)
+        self.root = master
+        self.style = style
+        self.engine = engine
+        # Where the HTTP API listens; a second launch looks for this instance there.
+        self.api_host, self.api_port = host or API_HOST, port or API_PORT
+        settings = engine.settings
+
+        # App variables
+        self.download_dir = ttk.StringVar(value=settings["download_dir"])
+        self.url_var = ttk.StringVar()
+        self.quality_var = ttk.StringVar(value=settings["quality"])
+        self.audio_only_var = ttk.BooleanVar(value=settings["audio_only"])
+        self.embed_thumbnail_var = ttk.BooleanVar(value=settings["embed_thumbnail"])
+        self.theme_var = ttk.StringVar(value=settings["theme"])
+        self.video_format_var = ttk.StringVar(value=settings["video_format"])
+        self.audio_format_var = ttk.StringVar(value=settings["audio_format"])
+        self.max_workers_var = ttk.IntVar(value=settings["max_concurrent_downloads"])
+        self.max_per_host_var = ttk.IntVar(value=settings["max_per_host"])
+        self.download_backend_var = ttk.StringVar(value=settings["download_backend"])
+        self.extraction_engine_var = ttk.StringVar(value=settings["extraction_engine"])
+        self.rate_limit_var = ttk.IntVar(value=settings["rate_limit"])
+        self.aria2_tuning_var = ttk.BooleanVar(value=settings["aria2_tuning"])
+        # The engine reads settings on its worker threads, so every change is
+        # mirrored into it straight away; save_config only writes them out.
+        for key, var in [("download_dir", self.download_dir), ("quality", self.quality_var),
+                         ("audio_only", self.audio_only_var), ("embed_thumbnail", self.embed_thumbnail_var),
+                         ("theme", self.theme_var), ("video_format", self.video_format_var),
+                         ("audio_format", self.audio_format_var), ("max_concurrent_downloads", self.max_workers_var),
+                         ("max_per_host", self.max_per_host_var), ("download_backend", self.download_backend_var),
+                         ("extraction_engine", self.extraction_engine_var), ("aria2_tuning", self.aria2_tuning_var)]:
+            var.trace_add("write", lambda *_, key=key, var=var: settings.__setitem__(key, var.get()))
+        # Typed by hand, so it is only taken once it is a valid number. Running
+        # downloads pick it up within a second.
+        self.rate_limit_var.trace_add("write", lambda *_: self._mirror_rate_limit())
+        self.queue = engine.queue
+        self.pump_interval = PUMP_ACTIVE_INTERVAL
+        self.pump_after_id = None
+        self.queue_running = False
+        self.download_queue = []
+        self.job_progress = {}
+        self.playlist_fetches = {}
+        self.fetch_ids = itertools.count(1)
+        # Archive lookups can scan the download folder, so they run off the Tk
+        # thread; one at a time, so playlist batches are staged in order.
+        self.archive_checks = ThreadPoolExecutor(max_workers=1, thread_name_prefix="archive")
+        # Jobs that are out of retries, by id, with their job_failed event.
+        self.failed_jobs = OrderedDict()
+        self.failed_window = None
+
+        self.style.theme_use(self.theme_var.get())
+
+        # UI Elements
+        self.create_widgets()
+        self.update_option_states()  # Set initial state
+
+        # History and the HTTP API come up in the background once the window
+        # has been drawn; the startup report is printed when both are ready.
+        engine.startup.expect("history_view", "server", "recover")
+        self.after_idle(self._recover)
+        self.after_idle(self._load_history_page)
+        self.after_idle(self._start_server)
+
+        self.pump_after_id = self.after(100, self.process_queue)
+
+    def create_widgets(self):
+        option_text = "Enter a video URL to begin"
+        option_lf = ttk.Labelframe(self, text=option_text, padding=15)
+        option_lf.pack(fill=X, expand=NO, anchor=N)
+
+        self.create_url_row(option_lf)
+        self.create_options_row(option_lf)
+
+        progress_frame = ttk.Frame(self)
+        progress_frame.pack(fill=X, pady=10)
+
+        self.progress = ttk.Progressbar(progress_frame, mode='determinate', bootstyle=(STRIPED, SUCCESS))
+        self.progress.pack(side=LEFT, fill=X, expand=YES)
+
+        self.percentage_var = ttk.StringVar()
+        self.percentage_label = ttk.Label(progress_frame, textvariable=self.percentage_var)
+        self.percentage_label.pack(side=LEFT, padx=10)
+
+        status_frame = ttk.Frame(self)
+        status_frame.pack(fill=X, expand=NO)
+        self.status_var = ttk.StringVar(value="Status: Idle")
+        ttk.Label(status_frame, textvariable=self.status_var).pack(side=LEFT, fill=X, anchor=W)
+
+        self.open_folder_button = ttk.Button(status_frame, text="Open Folder", command=self.open_download_folder,
+                                             width=12)
+
+        self.speed_var = ttk.StringVar()
+        self.speed_label = ttk.Label(status_frame, textvariable=self.speed_var)
+        self.speed_label.pack(side=RIGHT, padx=5)
+
+        self.size_var = ttk.StringVar()
+        self.size_label = ttk.Label(status_frame, textvariable=self.size_var)
+        self.size_label.pack(side=RIGHT, padx=5)
+
+        self.create_history_view()
+        self.update_history_view(load_history=False)
+        self.create_footer()
+
+    def create_url_row(self, parent):
+        url_row = ttk.Frame(parent)
+        url_row.pack(fill=X, expand=YES, pady=5)
+        ttk.Label(url_row, text="Video URL", width=10).pack(side=LEFT, padx=(0, 5))
+
+        self.url_entry = ttk.Entry(url_row, textvariable=self.url_var)
+        self.url_entry.pack(side=LEFT, fill=X, expand=YES, padx=5)
+        self.url_entry.drop_target_register(DND_FILES)
+        self.url_entry.dnd_bind("<<Drop>>", self.on_drop)
+
+        menu = tk.Menu(self.root, tearoff=0)
+        menu.add_command(label="Paste", command=self.paste_url)
+        self.url_entry.bind("<Button-3>", lambda e: menu.tk_popup(e.x_root, e.y_root))
+
+        self.add_to_queue_button = ttk.Button(url_row, text="Add to Queue", command=self.add_to_queue, width=12, bootstyle=OUTLINE)
+        self.add_to_queue_button.pack(side=LEFT, padx=5)
+
+        self.download_now_button = ttk.Button(url_row, text="Download Now", command=self.download_now, width=12, bootstyle=PRIMARY)
+        self.download_now_button.pack(side=LEFT, padx=5)
+
+        self.start_queue_button = ttk.Button(url_row, text="Start Queue", command=self.start_queue, width=12, bootstyle=SUCCESS)
+        self.start_queue_button.pack(side=LEFT, padx=5)
+
+        self.cancel_button = ttk.Button(url_row, text="Cancel", command=self.cancel_download, width=10,
+                                        bootstyle=DANGER)
+
+    def create_options_row(self, parent):
+        options_row = ttk.Frame(parent)
+        options_row.pack(fill=X, expand=YES, pady=5)
+
+        self.quality_combobox = ttk.Combobox(options_row, textvariable=self.quality_var, 
+                                                 values=['1080p', '720p', '480p', '360p'], 
+                                                 state="readonly", width=8)
+        self.quality_combobox.pack(side=LEFT, padx=5)
+        ttk.Label(options_row, text="Quality:").pack(side=LEFT, padx=(0, 5))
+
+        self.audio_only_checkbox = ttk.Checkbutton(options_row, text="Audio Only (MP3)", variable=self.audio_only_var,
+                                                   bootstyle="round-toggle", command=self.update_option_states)
+        self.audio_only_checkbox.pack(side=LEFT, padx=15)
+
+        self.embed_thumbnail_checkbox = ttk.Checkbutton(options_row, text="Embed Thumbnail",
+                                                        variable=self.embed_thumbnail_var, bootstyle="round-toggle")
+        self.embed_thumbnail_checkbox.pack(side=LEFT, padx=5)
+
+        self.select_folder_button = ttk.Button(options_row, text="Save Location", command=self.select_folder, width=15,
+                                               bootstyle=OUTLINE)
+        self.select_folder_button.pack(side=LEFT, padx=5)
+
+        self.settings_button = ttk.Button(options_row, text="Settings", command=self.open_settings, width=10,
+                                          bootstyle=INFO)
+        self.settings_button.pack(side=RIGHT, padx=5)
+
+        self.close_button = ttk.Button(options_row, text="Close", command=self.root.quit, width=10,
+                                       bootstyle="danger-outline")
+        self.close_button.pack(side=RIGHT, padx=5)
+
+    def create_history_view(self):
+        history_frame = ttk.Frame(self)
+        history_frame.pack(fill=BOTH, expand=YES, pady=10)
+
+        self.history_view = ttk.Treeview(
+            master=history_frame, bootstyle=INFO, columns=['status', 'title', 'date', 'url'], show=HEADINGS
+        )
+        self.history_scrollbar = ttk.Scrollbar(history_frame, orient=VERTICAL, command=self.history_view.yview)
+        self.history_scrollbar.pack(side=RIGHT, fill=Y)
+        self.history_view.pack(side=LEFT, fill=BOTH, expand=YES)
+        self.history_view.configure(yscrollcommand=self._on_history_scroll)
+        self.history_model = HistoryViewModel(self.history_view, self.engine.history_store)
+
+        self.history_view.heading('status', text='Status', anchor=W)
+        self.history_view.heading('title', text='Title', anchor=W)
+        self.history_view.heading('date', text='Date', anchor=W)
+        self.history_view.heading('url', text='Video URL', anchor=W)
+
+        self.history_view.column('status', anchor=W, width=100)
+        self.history_view.column('title', anchor=W, width=250)
+        self.history_view.column('date', anchor=W, width=150)
+        self.history_view.column('url', anchor=W, width=200)
+
+        self.history_menu = tk.Menu(self.root, tearoff=0)
+        self.history_menu.add_command(label="Copy URL", command=self.copy_history_url)
+        self.history_menu.add_command(label="Re-download", command=self.redownload_history_item)
+        self.history_view.bind("<Button-3>", self.show_history_menu)
+
+    def _on_history_scroll(self, first, last):
+        self.history_scrollbar.set(first, last)
+        self.history_model.on_scroll(first, last)
+
+    def create_footer(self):
+        footer_frame = ttk.Frame(self)
+        footer_frame.pack(fill=X, side=BOTTOM, padx=0, pady=(10, 0))
+
+        self.pump_stats_var = ttk.StringVar()
+        ttk.Label(footer_frame, textvariable=self.pump_stats_var, bootstyle=SECONDARY).pack(side=RIGHT)
+
+        # Shown only while there are failed jobs.
+        self.failed_button = ttk.Button(footer_frame, command=self.show_failed_jobs, bootstyle=(DANGER, OUTLINE))
+
+    def _set_ui_state(self, state):
+        is_downloading = state == DISABLED
+
+        self.url_entry.config(state=state)
+
+        if is_downloading:
+            self.add_to_queue_button.pack_forget()
+            self.download_now_button.pack_forget()
+            self.start_queue_button.pack_forget()
+            self.cancel_button.pack(side=LEFT, padx=5)
+        else:
+            self.cancel_button.pack_forget()
+            self.add_to_queue_button.pack(side=LEFT, padx=5)
+            self.download_now_button.pack(side=LEFT, padx=5)
+            self.start_queue_button.pack(side=LEFT, padx=5)
+
+        self.update_option_states()
+
+    def on_drop(self, event):
+        self.url_var.set(event.data.strip("{}"))
+
+    def paste_url(self):
+        try:
+            self.url_var.set(self.root.clipboard_get())
+        except tk.TclError:
+            pass
+
+    def select_folder(self):
+        path = filedialog.askdirectory(title="Select Download Folder")
+        if path:
+            self.download_dir.set(path)
+            self.save_config()
+
+    def update_option_states(self):
+        is_downloading = self.add_to_queue_button.cget('state') == DISABLED
+        audio_only = self.audio_only_var.get()
+
+        self.quality_combobox.config(state=DISABLED if audio_only or is_downloading else 'readonly')
+        self.embed_thumbnail_checkbox.config(state=NORMAL if audio_only and not is_downloading else DISABLED)
+
+        if not audio_only:
+            self.embed_thumbnail_var.set(False)
+
+    def download_now(self, force=False):
+        url = self.url_var.get().strip()
+        if not url:
+            messagebox.showwarning("Missing URL", "Please enter a video URL")
+            return
+
+        self._fetch_playlist_info(url, download_now=True, force=force)
+
+    def add_to_queue(self):
+        url = self.url_var.get().strip()
+        if not url:
+            messagebox.showwarning("Missing URL", "Please enter a video URL")
+            return
+
+        self._fetch_playlist_info(url, download_now=False)
+
+    def _fetch_playlist_info(self, url, download_now, force=False):
+        self.status_var.set("Status: Fetching playlist info...")
+        self._set_ui_state(DISABLED)
+
+        fetch = {
+            'id': next(self.fetch_ids),
+            'url': url,
+            'download_now': download_now,
+            'force': force,
+            'videos': [],
+            'mode': None,
+            'window': None,
+            'done': False,
+            'cancel': threading.Event()
+        }
+        self.playlist_fetches[fetch['id']] = fetch
+
+        thread = threading.Thread(target=self._run_fetch_playlist_info, args=(fetch,), daemon=True)
+        thread.start()
+
+    def _on_playlist_entries(self, fetch, batch):
+        fetch['videos'].extend(batch)
+        self.status_var.set(f"Status: Fetching playlist info... {len(fetch['videos'])} videos found")
+        if fetch['mode'] is None and len(fetch['videos']) >= 2:
+            # Asked once the pump has finished this batch of events; the
+            # dialog's nested event loop would otherwise handle the rest of
+            # the batch after events that arrived later.
+            fetch['mode'] = 'asking'
+            self.after_idle(self._ask_playlist_download_options, fetch)
+        elif fetch['mode'] == 'all':
+            self.process_playlist_selection([v['url'] for v in batch], fetch['download_now'], fetch['force'])
+        elif fetch['mode'] == 'select' and fetch['window'] is not None:
+            fetch['window'].append_videos(batch)
+
+    def _on_playlist_done(self, fetch):
+        fetch['done'] = True
+        self.playlist_fetches.pop(fetch['id'], None)
+        if fetch['mode'] is None:
+            if fetch['videos']:
+                self.process_playlist_selection([fetch['videos'][0]['url']], fetch['download_now'], fetch['force'])
+            else:
+                self.status_var.set("Status: No videos found")
+                self._set_ui_state(NORMAL)
+        elif fetch['mode'] == 'select' and fetch['window'] is not None:
+            fetch['window'].finish_loading()
+            self.status_var.set(f"Status: Found {len(fetch['videos'])} videos")
+
+    def _ask_playlist_download_options(self, fetch):
+        # The dialog runs a nested event loop, so batches keep arriving while it
+        # is open; they are collected and handed over once the user decides.
+        answer = messagebox.askyesnocancel(
+            "Playlist Detected",
+            "This is a playlist. Do you want to download the entire playlist?\n" +
+            "Yes - Download all videos.\n" +
+            "No - Select specific videos to download.",
+            parent=self.root
+        )
+
+        if answer is True: # Yes
+            fetch['mode'] = 'all'
+            self.process_playlist_selection([v['url'] for v in fetch['videos']], fetch['download_now'], fetch['force'])
+        elif answer is False: # No
+            fetch['mode'] = 'select'
+            fetch['window'] = PlaylistSelectionWindow(self.root, self, list(fetch['videos']), fetch['url'],
+                                                      fetch['download_now'], loading=not fetch['done'],
+                                                      on_close=fetch['cancel'].set)
+        else: # Cancel
+            fetch['mode'] = 'cancelled'
+            fetch['cancel'].set()
+            self._set_ui_state(NORMAL)
+
+    def _run_fetch_playlist_info(self, fetch):
+        url, cancel = fetch['url'], fetch['cancel']
+        videos = self.engine.metadata_cache.get(playlist_key(url) or video_key(url), "entries")
+        if videos:
+            self.queue.put({'type': 'playlist_entries', 'fetch_id': fetch['id'], 'videos': videos})
+            self.queue.put({'type': 'playlist_done', 'fetch_id': fetch['id']})
+            return
+
+        videos = []
+        batch = []
+        last_flush = time.monotonic()
+        try:
+            for video in self.engine.iter_playlist_entries(url, cancel):
+                if cancel.is_set():
+                    break
+                videos.append(video)
+                batch.append(video)
+                if video.get('title'):
+                    self.engine.metadata_cache.put(video_key(video['url']), "title", video['title'])
+                # Flush the first two entries right away so the playlist prompt
+                # appears immediately, then in batches to keep the UI responsive.
+                if (len(videos) <= 2 or len(batch) >= PLAYLIST_BATCH_SIZE
+                        or time.monotonic() - last_flush >= PLAYLIST_BATCH_INTERVAL):
+                    self.queue.put({'type': 'playlist_entries', 'fetch_id': fetch['id'], 'videos': batch})
+                    batch = []
+                    last_flush = time.monotonic()
+
+            if batch:
+                self.queue.put({'type': 'playlist_entries', 'fetch_id': fetch['id'], 'videos': batch})
+            if not cancel.is_set():
+                self.engine.cache_playlist_info(url, videos)
+            self.queue.put({'type': 'playlist_done', 'fetch_id': fetch['id']})
+
+        except Exception as e:
+            error_message = f"Failed to fetch information: {e}"
+            self.queue.put({'type': 'playlist_fetch_error', 'fetch_id': fetch['id'], 'error': error_message})
+
+    def update_scheduler_limits(self):
+        self.engine.update_scheduler_limits()
+
+    def cancel_download(self):
+        # Items that never started go back to the front of the queue.
+        pending = self.engine.cancel_all()
+        self.engine.stage(pending)
+        self.download_queue[:0] = pending
+
+    def _refresh_progress(self):
+        if not self.job_progress:
+            self.progress.config(value=0)
+            self.percentage_var.set("")
+            self.size_var.set("")
+            self.speed_var.set("")
+            return
+
+        progresses = list(self.job_progress.values())
+        percent = sum(p.get('percent', 0) for p in progresses) / len(progresses)
+        total = sum(p.get('total_bytes') or 0 for p in progresses)
+        speed = sum(p.get('speed') or 0 for p in progresses)
+        self.progress.config(value=percent)
+        self.percentage_var.set(f"{percent:.1f}%")
+        self.speed_var.set(f"Speed: {format_bytes(speed)}/s")
+        if len(progresses) == 1:
+            phase = progresses[0].get('phase', 'download')
+            size = f"Size: {format_bytes(total)}" if total else ""
+            self.size_var.set(size if phase == 'download' else phase.capitalize() + "...")
+        else:
+            self.size_var.set(f"Downloads: {len(progresses)} ({format_bytes(total)})")
+
+    def process_queue(self):
+        """Drains every pending event, then reschedules itself at an adaptive rate."""
+        events = self.queue.drain(PUMP_MAX_EVENTS)
+        progress_changed = False
+        for msg in events:
+            if msg.get('type') == 'progress':
+                # Only the latest update per job matters; the bar is redrawn once per tick.
+                self.job_progress[msg.get('job_id')] = msg
+                progress_changed = True
+            else:
+                self.handle_event(msg)
+        if progress_changed:
+            self._refresh_progress()
+
+        stats = self.queue.stats()
+        self.pump_stats_var.set(f"Events: {stats['depth']} queued, {stats['latency_ms']:.0f} ms lag")
+
+        if events or self.engine.is_busy() or self.queue.qsize():
+            self.pump_interval = PUMP_ACTIVE_INTERVAL
+        else:
+            self.pump_interval = min(self.pump_interval * 2, PUMP_IDLE_INTERVAL)
+        # handle_event never opens a modal dialog itself, as its nested event
+        # loop would run the pump again in the middle of this batch. Dialogs
+        # are opened from after_idle instead; those still re-enter the pump,
+        # and cancelling the pending tick keeps a single loop alive.
+        if self.pump_after_id is not None:
+            self.after_cancel(self.pump_after_id)
+        self.pump_after_id = self.after(self.pump_interval, self.process_queue)
+
+    def handle_event(self, msg):
+        msg_type = msg.get('type')
+
+        if msg_type == 'status':
+            self.status_var.set(f"Status: {msg.get('text', '')}")
+        elif msg_type == 'job_queued':
+            # Also sent for URLs queued through the HTTP API.
+            self.history_model.upsert_item(msg['item'], "Queued")
+            self._on_queue_started()
+        elif msg_type == 'job_metadata':
+            # Resolved ahead of time by the prefetcher, for queued and staged items alike.
+            self.history_model.set_title(msg.get('job_id'), msg.get('title'))
+        elif msg_type == 'job_postprocess_queued':
+            job = self.engine.get_job(msg.get('job_id'))
+            if job:
+                self.history_model.upsert_item(job.item, "Converting")
+        elif msg_type == 'job_started':
+            self.status_var.set(f"Status: Starting {msg.get('title', '')}...")
+            job = self.engine.scheduler.get_job(msg.get('job_id'))
+            if job:
+                self.history_model.upsert_item(job.item, "Downloading")
+        elif msg_type == 'video_done':
+            self.job_progress.pop(msg.get('job_id'), None)
+            self.history_model.remove_item(msg.get('job_id'))
+            if msg.get('history_entry'):
+                self.history_model.add_history(msg['history_entry'])
+            self._refresh_progress()
+        elif msg_type == 'job_skipped':
+            self.job_progress.pop(msg.get('job_id'), None)
+            self.history_model.remove_item(msg.get('job_id'))
+            self.status_var.set(f"Status: Already downloaded {msg.get('url', '')}")
+        elif msg_type == 'job_paused':
+            self.job_progress.pop(msg.get('job_id'), None)
+            self.history_model.upsert_item(msg['item'], "Paused")
+            self._refresh_progress()
+        elif msg_type == 'job_cancelled':
+            self.job_progress.pop(msg.get('job_id'), None)
+            self.history_model.remove_item(msg.get('job_id'))
+            self._refresh_progress()
+        elif msg_type == 'job_retrying':
+            self.job_progress.pop(msg.get('job_id'), None)
+            self._refresh_progress()
+            job = self.engine.get_job(msg.get('job_id'))
+            if job:
+                self.history_model.upsert_item(job.item, f"Retry in {msg.get('delay', 0):.0f}s")
+            self.status_var.set(f"Status: Retrying after {msg.get('error_class')} error - {msg.get('error_message')}")
+        elif msg_type == 'job_deferred':
+            self.job_progress.pop(msg.get('job_id'), None)
+            self._refresh_progress()
+            job = self.engine.get_job(msg.get('job_id'))
+            if job:
+                self.history_model.upsert_item(job.item, "Waiting for disk space")
+            self.status_var.set(f"Status: Waiting for disk space - needs {msg.get('needed', 0) // 2**20} MiB, "
+                                f"{(msg.get('free') or 0) // 2**20} MiB free")
+        elif msg_type == 'job_failed':
+            self.job_progress.pop(msg.get('job_id'), None)
+            self.history_model.remove_item(msg.get('job_id'))
+            self._refresh_progress()
+            if not self.engine.queue_cancelled:
+                error_message = msg.get('error_message', "An unknown error occurred.")
+                self.status_var.set(f"Status: Error - {error_message}")
+                self.failed_jobs[msg.get('job_id')] = msg
+                self._update_failed_jobs()
+        elif msg_type == 'cancelled' and not self.engine.is_busy():
+            self.queue_running = False
+            self.status_var.set("Status: Download cancelled")
+            self.job_progress.clear()
+            self._refresh_progress()
+            self._set_ui_state(NORMAL)
+        elif msg_type == 'done' and not self.engine.is_busy():
+            self.queue_running = False
+            self.progress.config(value=100)
+            self.percentage_var.set("100.0%")
+            self.status_var.set("Status: Download complete!")
+            self.open_folder_button.pack(side=RIGHT, padx=10)
+            self._set_ui_state(NORMAL)
+        elif msg_type == 'show_window':
+            # Another launch handed its URLs to this instance.
+            self.root.deiconify()
+            self.root.lift()
+            self.root.focus_force()
+        elif msg_type == 'recovered':
+            # Staged before anything added since the window came up.
+            self.download_queue[:0] = msg['items']
+            for item in msg['items']:
+                self.history_model.upsert_item(item, "Queued")
+            self._startup_step_done("recover")
+        elif msg_type == 'history_page':
+            self.history_model.add_page(msg['entries'])
+            self._startup_step_done("history_view")
+        elif msg_type == 'playlist_entries':
+            fetch = self.playlist_fetches.get(msg.get('fetch_id'))
+            if fetch:
+                self._on_playlist_entries(fetch, msg.get('videos', []))
+        elif msg_type == 'playlist_filtered':
+            self._stage_playlist_selection(msg['urls'], msg['skipped'], msg['download_now'], msg['force'])
+        elif msg_type == 'playlist_done':
+            fetch = self.playlist_fetches.get(msg.get('fetch_id'))
+            if fetch:
+                self._on_playlist_done(fetch)
+        elif msg_type == 'playlist_fetch_error':
+            fetch = self.playlist_fetches.pop(msg.get('fetch_id'), None)
+            if fetch and fetch['window'] is not None:
+                fetch['window'].finish_loading()
+            error_message = msg.get('error', "An unknown error occurred.")
+            self.status_var.set(f"Status: Error - {error_message}")
+            self.after_idle(messagebox.showerror, "Error", error_message)
+            if not self.engine.is_busy():
+                self._set_ui_state(NORMAL)
+
+    def open_download_folder(self):
+        path = self.download_dir.get()
+        try:
+            if sys.platform == "win32":
+                os.startfile(path)
+            elif sys.platform == "darwin":
+                subprocess.run(["open", path])
+            else:
+                subprocess.run(["xdg-open", path])
+        except FileNotFoundError:
+            messagebox.showerror("Error", f"Could not open folder. Path not found: {path}")
+        except Exception as e:
+            messagebox.showerror("Error", f"An unexpected error occurred: {e}")
+
+    def _update_failed_jobs(self):
+        if self.failed_jobs:
+            self.failed_button.config(text=f"Failed: {len(self.failed_jobs)}")
+            self.failed_button.pack(side=LEFT)
+        else:
+            self.failed_button.pack_forget()
+        if self.failed_window is not None:
+            self.failed_window.refresh()
+
+    def show_failed_jobs(self):
+        if self.failed_window is None:
+            self.failed_window = FailedJobsWindow(self.root, self)
+        else:
+            self.failed_window.lift()
+
+    def retry_failed(self, job_ids):
+        for job_id in job_ids:
+            if self.failed_jobs.pop(job_id, None):
+                self.engine.retry(job_id)
+        self._update_failed_jobs()
+
+    def dismiss_failed(self, job_ids):
+        for job_id in job_ids:
+            self.failed_jobs.pop(job_id, None)
+        self._update_failed_jobs()
+
+    def show_history_menu(self, event):
+        iid = self.history_view.identify_row(event.y)
+        if iid:
+            self.history_view.selection_set(iid)
+            self.history_menu.tk_popup(event.x_root, event.y_root)
+
+    def copy_history_url(self):
+        selected_items = self.history_view.selection()
+        if not selected_items: return
+        item_values = self.history_view.item(selected_items[0], 'values')
+        if item_values and len(item_values) > 3:
+            url = item_values[3]
+            self.root.clipboard_clear()
+            self.root.clipboard_append(url)
+            self.status_var.set("Status: URL copied to clipboard!")
+            self.after(3000, lambda: self.status_var.set("Status: Idle"))
+
+    def redownload_history_item(self):
+        selected_items = self.history_view.selection()
+        if not selected_items: return
+        item_values = self.history_view.item(selected_items[0], 'values')
+        if item_values and len(item_values) > 3:
+            url = item_values[3]
+            self.url_var.set(url)
+            self.download_now(force=True)
+
+    def update_yt_dlp(self):
+        if messagebox.askyesno("Confirm", "This will download the latest version of yt-dlp. Continue?"):
+            thread = threading.Thread(target=self._update_yt_dlp_thread, daemon=True)
+            thread.start()
+
+    def _update_yt_dlp_thread(self):
+        self.queue.put({'type': 'status', 'text': 'Updating yt-dlp...'})
+        try:
+            from updater import update_yt_dlp
+            update_yt_dlp()
+            self.queue.put({'type': 'status', 'text': 'yt-dlp updated successfully!'})
+            messagebox.showinfo("Success", "yt-dlp has been updated to the latest version.")
+
+        except Exception as e:
+            print(f"yt-dlp update failed: {e}")
+            self.queue.put({'type': 'status', 'text': 'Error: yt-dlp update failed.'})
+            messagebox.showerror("Error", f"Failed to update yt-dlp. Check the console for details.")
+
+    def open_settings(self):
+        SettingsWindow(self.root, self)
+
+    def change_theme(self, event):
+        self.style.theme_use(self.theme_var.get())
+        self.save_config()
+
+    def _mirror_rate_limit(self):
+        try:
+            rate_limit = self.rate_limit_var.get()
+        except tk.TclError:
+            return
+        self.engine.settings["rate_limit"] = max(0, rate_limit)
+
+    def save_config(self):
+        self.engine.save_config()
+
+    def update_history_view(self, load_history=True):
+        """Rebuilds the whole view. Routine changes go through history_model instead."""
+        queue_rows = [(job.item, "Converting") for job in self.engine.postprocessor.waiting_jobs()]
+        queue_rows += [(job.item, "Converting") for job in self.engine.postprocessor.active_jobs()]
+        queue_rows += [(job.item, "Downloading") for job in self.engine.scheduler.active_jobs()]
+        queue_rows += [(job.item, "Queued") for job in self.engine.scheduler.pending_jobs()]
+        queue_rows += [(item, "Queued") for item in self.download_queue]
+        self.history_model.reload(queue_rows, load_history)
+
+    def _recover(self):
+        """Picks up whatever the last session left queued, staged or half-downloaded, on a thread.
+
+        Requeued jobs show up through their own events; the staged items come back as a recovered event.
+        """
+        def recover():
+            with self.engine.startup.phase("recover"):
+                items = self.engine.recover()
+            self.queue.put({'type': 'recovered', 'items': items})
+
+        threading.Thread(target=recover, daemon=True).start()
+
+    def _load_history_page(self):
+        """Reads the first page of history on a thread; it reaches the view as a history_page event."""
+        def load():
+            with self.engine.startup.phase("history_view"):
+                entries = self.engine.history_store.recent(self.history_model.page_size)
+            self.queue.put({'type': 'history_page', 'entries': entries})
+
+        threading.Thread(target=load, daemon=True).start()
+
+    def _start_server(self):
+        """Imports and starts the HTTP API on its own thread, so fastapi and uvicorn load after the first frame."""
+        def serve():
+            with self.engine.startup.phase("server"):
+                from server import create_app, run_app
+                app = create_app(self.engine)
+            self._startup_step_done("server")
+            run_app(app, self.api_host, self.api_port)
+
+        threading.Thread(target=serve, daemon=True).start()
+
+    def _startup_step_done(self, step):
+        if self.engine.startup.finish(step):
+            print(self.engine.startup.report())
+
+    def process_playlist_selection(self, selected_urls, download_now, force=False):
+        if force:
+            self._stage_playlist_selection(selected_urls, [], download_now, force)
+            return
+
+        def check(download_dir):
+            # Checked against the local archive only, so re-syncing a playlist
+            # costs nothing for the videos that are already on disk.
+            new, skipped = self.engine.archive.filter_new(selected_urls, download_dir)
+            self.queue.put({'type': 'playlist_filtered', 'urls': new, 'skipped': skipped,
+                            'download_now': download_now, 'force': force})
+
+        self.archive_checks.submit(check, self.download_dir.get())
+
+    def _stage_playlist_selection(self, selected_urls, skipped, download_now, force):
+        items = [self.engine.make_item(url, from_playlist=True, force=force) for url in selected_urls]
+        self.engine.stage(items)
+        for item in items:
+            self.download_queue.append(item)
+            self.history_model.upsert_item(item, "Queued")
+
+        self.url_var.set("")
+        if skipped:
+            self.status_var.set(f"Status: Skipped {len(skipped)} already downloaded")
+        if not self.engine.is_busy():
+            self._set_ui_state(NORMAL)
+
+        if download_now and selected_urls:
+            self.start_queue()
+
+    def start_queue(self):
+        if not self.download_queue:
+            if not self.engine.is_busy():
+                messagebox.showinfo("Queue Empty", "There are no videos in the queue.")
+            return
+
+        # Hand everything queued so far to the scheduler; items added while it
+        # runs are picked up by the next start_queue call.
+        items, self.download_queue = self.download_queue, []
+        self._on_queue_started()
+        self.engine.submit(items)
+
+    def _on_queue_started(self):
+        if not self.queue_running:
+            self.queue_running = True
+            self.open_folder_button.pack_forget()
+            self._set_ui_state(DISABLED)
+            self.status_var.set("Status: Starting queue...")
+
+    def clear_history(self):
+        if messagebox.askyesno("Confirm", "Are you sure you want to delete all download history?"):
+            self.engine.clear_history()
+            self.history_model.clear_history()
+
+
+def main(engine, urls=(), host=None, port=None):
+    """Runs the window until it is closed; urls are queued once it is up.
+
+    host and port are where the HTTP API listens, API_HOST and API_PORT by default.
+    """
+    try:
+        with engine.startup.phase("window"):
+            root = TkinterDnD.Tk()
+            root.title("Aria Youtube Downloader")
+            root.geometry("900x700")
+            style = ttk.Style()
+            DownloaderApp(root, style, engine, host, port)
+        if urls:
+            # The archive check can scan the download folder, so it is kept off the Tk thread.
+            threading.Thread(target=engine.add_urls, args=(urls,), daemon=True).start()
+        root.mainloop()
+    except BrokenPipeError:
+        # This error can be safely ignored.
+        pass
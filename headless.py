@@ -0,0 +1,159 @@
+import sys
+import threading
+import time
+
+# How often the headless runners drain the engine's event queue, in seconds.
+POLL_INTERVAL = 0.25
+
+
+class EventLog:
+    """Prints engine events as one line each and keeps per-job results."""
+
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.titles = {}
+        self.completed = []
+        self.failed = []
+        self.cancelled = []
+        self.skipped = []
+
+    def handle(self, msg):
+        msg_type = msg.get('type')
+        job_id = msg.get('job_id')
+        if msg_type == 'job_queued':
+            self.titles[msg['item']['id']] = msg['item']['url']
+        elif msg_type == 'job_metadata':
+            self.titles[job_id] = msg['title']
+        elif msg_type == 'job_started':
+            if msg.get('title') and msg['title'] != 'Fetching title...':
+                self.titles[job_id] = msg['title']
+            self._print(f"[started] {self.titles.get(job_id, job_id)}")
+        elif msg_type == 'job_leased':
+            self._print(f"[leased] {self.titles.get(job_id, job_id)} to worker {msg.get('worker_id')}")
+        elif msg_type == 'job_requeued':
+            self._print(f"[requeued] {self.titles.get(job_id, job_id)}: worker {msg.get('worker_id')} went quiet")
+        elif msg_type == 'job_retrying':
+            self._print(f"[retrying] {self.titles.get(job_id, job_id)} in {msg.get('delay')}s "
+                        f"after {msg.get('error_class')} error: {msg.get('error_message')}")
+        elif msg_type == 'job_deferred':
+            self._print(f"[waiting] {self.titles.get(job_id, job_id)} needs {msg.get('needed', 0) // 2**20} MiB "
+                        f"of disk space, {(msg.get('free') or 0) // 2**20} MiB free")
+        elif msg_type == 'job_postprocess_queued':
+            self._print(f"[converting] {self.titles.get(job_id, job_id)}")
+        elif msg_type == 'video_done':
+            entry = msg.get('history_entry') or {}
+            self.completed.append(entry)
+            self._print(f"[done] {entry.get('title')} -> {entry.get('filepath', entry.get('url'))}")
+        elif msg_type == 'job_failed':
+            self.failed.append((msg.get('url'), msg.get('error_message')))
+            self._print(f"[failed] {msg.get('url')} ({msg.get('error_class')}): {msg.get('error_message')}")
+        elif msg_type == 'job_skipped':
+            self.skipped.append(msg.get('url'))
+            self._print(f"[skipped] {msg.get('url')} is already downloaded")
+        elif msg_type == 'job_paused':
+            self._print(f"[paused] {self.titles.get(job_id, job_id)}")
+        elif msg_type == 'job_cancelled':
+            self.cancelled.append(job_id)
+            self._print(f"[cancelled] {self.titles.get(job_id, job_id)}")
+
+    def _print(self, line):
+        print(line, file=self.out, flush=True)
+
+    def summary(self):
+        lines = [f"{len(self.completed)} downloaded, {len(self.skipped)} already downloaded, "
+                 f"{len(self.failed)} failed, {len(self.cancelled)} cancelled"]
+        lines += [f"  failed: {url}: {error}" for url, error in self.failed]
+        return "\n".join(lines)
+
+
+def read_url_file(path):
+    """URLs from path, one per line; blank lines and # comments are skipped. "-" reads stdin."""
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
+
+
+def run_batch(engine, urls):
+    """Downloads urls with the engine's settings and returns a process exit code.
+
+    Ctrl+C cancels whatever is still running and still prints the summary.
+    """
+    log = EventLog()
+    if not urls:
+        print("No URLs to download.")
+        return 0
+
+    engine.submit([engine.make_item(url) for url in urls])
+    finished = False
+    while not finished:
+        try:
+            time.sleep(POLL_INTERVAL)
+            for msg in engine.queue.drain():
+                log.handle(msg)
+                if msg.get('type') in ('done', 'cancelled') and not engine.is_busy():
+                    finished = True
+        except KeyboardInterrupt:
+            print("Cancelling...")
+            engine.cancel_all()
+
+    print(log.summary())
+    return 1 if log.failed or log.cancelled else 0
+
+
+def run_daemon(engine, host=None, port=None, urls=()):
+    """Serves the HTTP API and downloads urls and whatever it is sent until interrupted.
+
+    host and port default to server.API_HOST and API_PORT.
+    """
+    with engine.startup.phase("server"):
+        from server import API_HOST, API_PORT, create_app, run_app
+        app = create_app(engine)
+    host, port = host or API_HOST, port or API_PORT
+
+    log = EventLog()
+
+    def pump():
+        while True:
+            for msg in engine.queue.drain():
+                log.handle(msg)
+            time.sleep(POLL_INTERVAL)
+
+    threading.Thread(target=pump, daemon=True).start()
+    engine.recover()
+    if urls:
+        engine.add_urls(urls)
+    print(engine.startup.report())
+    print(f"Listening on http://{host}:{port}")
+    run_app(app, host, port)
+
+
+def run_worker(engine, coordinator_url, worker_id=None, slots=None):
+    """Downloads jobs leased from a coordinator until interrupted.
+
+    Unfinished local jobs are not recovered: their leases expire and the
+    coordinator hands them out again.
+    """
+    from cluster import ClusterWorker
+
+    log = EventLog()
+    worker = ClusterWorker(engine, coordinator_url, worker_id, slots)
+    if slots:
+        engine.settings["max_concurrent_downloads"] = slots
+        engine.update_scheduler_limits()
+
+    def pump():
+        while True:
+            for msg in engine.queue.drain():
+                log.handle(msg)
+            time.sleep(POLL_INTERVAL)
+
+    threading.Thread(target=pump, daemon=True).start()
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.stop()
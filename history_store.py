@@ -0,0 +1,130 @@
+import json
+import os
+import sqlite3
+import threading
+
+from video_ids import canonical_id
+
+HISTORY_DB = "history.db"
+ENTRY_COLUMNS = ("url", "title", "date")
+
+
+class HistoryStore:
+    """Download history in a WAL-mode SQLite table.
+
+    Each completed download is one INSERT, so saving no longer depends on how
+    long the history is, and an interrupted write cannot corrupt older
+    entries. Fields beyond url/title/date are kept as JSON in the extra column.
+    """
+
+    def __init__(self, path=HISTORY_DB):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                video_id TEXT,
+                title TEXT,
+                date TEXT,
+                extra TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_history_url ON history (url);
+            CREATE INDEX IF NOT EXISTS idx_history_video_id ON history (video_id);
+            CREATE INDEX IF NOT EXISTS idx_history_date ON history (date);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def _to_entry(row):
+        entry = json.loads(row["extra"]) if row["extra"] else {}
+        entry.update({"id": row["id"], "url": row["url"], "title": row["title"], "date": row["date"]})
+        return entry
+
+    def _insert(self, entry):
+        extra = {k: v for k, v in entry.items() if k not in ENTRY_COLUMNS and k != "id"}
+        cursor = self._conn.execute(
+            "INSERT INTO history (url, video_id, title, date, extra) VALUES (?, ?, ?, ?, ?)",
+            (entry["url"], canonical_id(entry["url"]), entry.get("title"), entry.get("date"),
+             json.dumps(extra) if extra else None))
+        return cursor.lastrowid
+
+    def append(self, entry):
+        """Adds entry and returns it with its new id."""
+        with self._lock:
+            entry_id = self._insert(entry)
+            self._conn.commit()
+        return dict(entry, id=entry_id)
+
+    def recent(self, limit=100, before_id=None):
+        """Newest entries first. Pass the last id of the previous page as before_id to page further back."""
+        with self._lock:
+            if before_id is None:
+                rows = self._conn.execute("SELECT * FROM history ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+            else:
+                rows = self._conn.execute("SELECT * FROM history WHERE id < ? ORDER BY id DESC LIMIT ?",
+                                          (before_id, limit)).fetchall()
+        return [self._to_entry(row) for row in rows]
+
+    def all(self):
+        """Every entry, oldest first."""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM history ORDER BY id").fetchall()
+        return [self._to_entry(row) for row in rows]
+
+    def downloaded(self):
+        """(video_id, filepath or None, worker or None) for every entry, oldest first.
+
+        worker is set for downloads a cluster worker made; their files are on that machine.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT video_id, extra FROM history ORDER BY id").fetchall()
+        result = []
+        for row in rows:
+            extra = json.loads(row["extra"]) if row["extra"] else {}
+            result.append((row["video_id"], extra.get("filepath"), extra.get("worker")))
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM history")
+            self._conn.commit()
+
+    def import_json(self, path):
+        """Imports a legacy JSON history list once; later calls for the same file do nothing.
+
+        Returns the number of imported entries. A file that cannot be parsed is
+        left untouched and not marked as imported, so it can be fixed and
+        imported on a later start.
+        """
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return 0
+        marker = f"imported:{os.path.abspath(path)}"
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+                return 0
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            print(f"Could not import history from {path}: {e}")
+            return 0
+
+        entries = [entry for entry in entries if isinstance(entry, dict) and entry.get("url")]
+        with self._lock:
+            for entry in entries:
+                self._insert(entry)
+            self._conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (marker, str(len(entries))))
+            self._conn.commit()
+        return len(entries)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
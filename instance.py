@@ -0,0 +1,59 @@
+import http.client
+import json
+
+# Only the standard library is imported here: a second launch that finds the
+# app already running hands its URLs over and exits before loading anything else.
+API_HOST = "127.0.0.1"
+API_PORT = 5000
+# Sent by GET /instance, so a launch can tell this app from anything else on the port.
+APP_ID = "aria-youtube-downloader"
+# A running instance answers on the local machine within milliseconds.
+PROBE_TIMEOUT = 0.5
+HANDOFF_TIMEOUT = 10
+# URLs per /add/batch request; server.MAX_BATCH_URLS is the most it takes.
+HANDOFF_BATCH = 1000
+
+
+def _connect_host(host):
+    # A server listening on every interface is reached through loopback.
+    return "127.0.0.1" if host in (None, "", "0.0.0.0") else host
+
+
+def _request(method, path, host, port, body=None, timeout=PROBE_TIMEOUT):
+    conn = http.client.HTTPConnection(_connect_host(host), port, timeout=timeout)
+    try:
+        conn.request(method, path, body=json.dumps(body) if body is not None else None,
+                     headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read() or b"null")
+    finally:
+        conn.close()
+
+
+def running_instance(host=API_HOST, port=API_PORT):
+    """The pid of this app serving on host:port, or None if nothing there is this app."""
+    try:
+        status, data = _request("GET", "/instance", host, port)
+    except (OSError, ValueError, http.client.HTTPException):
+        return None
+    if status == 200 and isinstance(data, dict) and data.get("app") == APP_ID:
+        return data.get("pid")
+    return None
+
+
+def hand_off(urls, host=API_HOST, port=API_PORT):
+    """Queues urls on the instance at host:port and brings its window to the front.
+
+    Returns how many urls were accepted and how many were duplicates. Raises
+    OSError or http.client.HTTPException if the instance could not take them.
+    """
+    accepted = duplicates = 0
+    for start in range(0, len(urls), HANDOFF_BATCH):
+        status, result = _request("POST", "/add/batch", host, port, {"urls": urls[start:start + HANDOFF_BATCH]},
+                                  timeout=HANDOFF_TIMEOUT)
+        if status != 200:
+            raise http.client.HTTPException(f"the running instance refused the URLs: {result}")
+        accepted += result["accepted"]
+        duplicates += result["duplicates"]
+    _request("POST", "/instance/show", host, port)
+    return accepted, duplicates
@@ -0,0 +1,98 @@
+import json
+import sqlite3
+import threading
+import time
+
+JOBS_DB = "jobs.db"
+# Jobs in these states are picked up again on the next start.
+UNFINISHED_STATES = ("queued", "running", "merging", "retrying", "deferred")
+FINISHED_STATES = ("done", "failed", "cancelled", "skipped")
+
+
+class JobStore:
+    """The download queue in a WAL-mode SQLite table, so it survives restarts and crashes.
+
+    Every state change is one UPDATE by primary key, committed before the
+    engine reports it, so after a crash the table says exactly which jobs
+    had not finished. States are staged (added in the window but not
+    started), queued, running, merging, retrying (failed, waiting to run
+    again), deferred (waiting for disk space), paused, done, failed,
+    cancelled and skipped. Rows keep their insertion order through the seq
+    column.
+    """
+
+    def __init__(self, path=JOBS_DB):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE,
+                url TEXT NOT NULL,
+                item TEXT NOT NULL,
+                state TEXT NOT NULL,
+                output_path TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, seq);
+        """)
+        self._conn.commit()
+
+    def put_many(self, items, state):
+        """Inserts items, or moves them to state if they are already stored."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO jobs (id, url, item, state, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET item = excluded.item, state = excluded.state, "
+                "updated_at = excluded.updated_at",
+                [(item["id"], item["url"], json.dumps(item), state, now) for item in items])
+            self._conn.commit()
+
+    def set_state(self, job_id, state, **fields):
+        """Updates state and any of output_path, error and attempts for one job."""
+        columns = {k: v for k, v in fields.items() if k in ("output_path", "error", "attempts")}
+        assignments = "".join(f", {column} = ?" for column in columns)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET state = ?, updated_at = ?{assignments} WHERE id = ?",
+                               (state, time.time(), *columns.values(), job_id))
+            self._conn.commit()
+
+    def start(self, job_id):
+        """Marks a job running and counts the attempt."""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET state = 'running', attempts = attempts + 1, updated_at = ? "
+                               "WHERE id = ?", (time.time(), job_id))
+            self._conn.commit()
+
+    def in_states(self, states):
+        """Stored jobs in any of states, oldest first, as dicts with the item decoded."""
+        placeholders = ", ".join("?" for _ in states)
+        with self._lock:
+            rows = self._conn.execute(f"SELECT * FROM jobs WHERE state IN ({placeholders}) ORDER BY seq",
+                                      tuple(states)).fetchall()
+        return [dict(row, item=json.loads(row["item"])) for row in rows]
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row, item=json.loads(row["item"])) if row else None
+
+    def prune(self, keep):
+        """Deletes all but the newest keep finished jobs."""
+        placeholders = ", ".join("?" for _ in FINISHED_STATES)
+        with self._lock:
+            self._conn.execute(
+                f"DELETE FROM jobs WHERE state IN ({placeholders}) AND seq NOT IN "
+                f"(SELECT seq FROM jobs WHERE state IN ({placeholders}) ORDER BY seq DESC LIMIT ?)",
+                (*FINISHED_STATES, *FINISHED_STATES, keep))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,177 @@
+import json
+import sqlite3
+import threading
+import time
+
+METADATA_DB = "metadata.db"
+
+# Seconds each field stays fresh. Titles and durations practically never
+# change, while format lists carry signed media URLs that expire in hours.
+DEFAULT_TTLS = {
+    "title": 30 * 24 * 3600,
+    "duration": 30 * 24 * 3600,
+    "entries": 24 * 3600,
+    "filesize": 6 * 3600,
+    "formats": 30 * 60,
+    "info": 30 * 60,
+    # yt-dlp -J output after format selection, with the same signed URLs.
+    "resolved": 30 * 60,
+}
+# Access times only order rows for eviction, so hits collect them in memory
+# and they are written in one transaction once this many are pending or this
+# many seconds have passed, and always before evicting.
+ACCESS_FLUSH_SIZE = 256
+ACCESS_FLUSH_INTERVAL = 30
+
+
+class MetadataCache:
+    """On-disk metadata cache keyed by (extractor, video_id, field).
+
+    Every field has its own TTL, and the least recently used rows are evicted
+    once the cache grows past max_bytes. Hit and miss counts are kept for the
+    lifetime of the process.
+    """
+
+    def __init__(self, path=METADATA_DB, ttls=None, max_bytes=50 * 1024 * 1024):
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._accessed = {}
+        self._flushed_at = time.monotonic()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS metadata (
+                extractor TEXT NOT NULL,
+                video_id TEXT NOT NULL,
+                field TEXT NOT NULL,
+                value TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL,
+                PRIMARY KEY (extractor, video_id, field)
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_metadata_accessed ON metadata (accessed_at)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM metadata").fetchone()[0]
+
+    def get(self, key, field):
+        extractor, video_id = key
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, fetched_at, size FROM metadata WHERE extractor = ? AND video_id = ? AND field = ?",
+                (extractor, video_id, field)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, fetched_at, size = row
+            if now - fetched_at > self.ttls.get(field, 0):
+                self._conn.execute("DELETE FROM metadata WHERE extractor = ? AND video_id = ? AND field = ?",
+                                   (extractor, video_id, field))
+                self._conn.commit()
+                self._total_bytes -= size
+                self.misses += 1
+                return None
+            self._accessed[(extractor, video_id, field)] = now
+            if len(self._accessed) >= ACCESS_FLUSH_SIZE or \
+                    time.monotonic() - self._flushed_at >= ACCESS_FLUSH_INTERVAL:
+                self._flush_accessed()
+                self._conn.commit()
+            self.hits += 1
+        return json.loads(value)
+
+    def _flush_accessed(self):
+        # Caller must hold self._lock and commit.
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE metadata SET accessed_at = ? WHERE extractor = ? AND video_id = ? AND field = ?",
+                [(accessed_at,) + key for key, accessed_at in self._accessed.items()])
+            self._accessed.clear()
+        self._flushed_at = time.monotonic()
+
+    def put(self, key, field, value):
+        if value is None:
+            return
+        extractor, video_id = key
+        encoded = json.dumps(value, default=str)
+        now = time.time()
+        with self._lock:
+            self._accessed.pop((extractor, video_id, field), None)
+            old = self._conn.execute(
+                "SELECT size FROM metadata WHERE extractor = ? AND video_id = ? AND field = ?",
+                (extractor, video_id, field)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO metadata (extractor, video_id, field, value, fetched_at, accessed_at, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (extractor, video_id, field, encoded, now, now, len(encoded)))
+            self._total_bytes += len(encoded) - (old[0] if old else 0)
+            self._evict()
+            self._conn.commit()
+
+    def put_info(self, key, info):
+        """Stores the cacheable fields of a yt-dlp info dict."""
+        self.put(key, "title", info.get("title"))
+        self.put(key, "duration", info.get("duration"))
+        if info.get("formats"):
+            self.put(key, "formats", [
+                {k: f.get(k) for k in ("format_id", "ext", "height", "vcodec", "acodec", "filesize",
+                                       "filesize_approx", "tbr")}
+                for f in info["formats"]])
+        filesize = info.get("filesize") or info.get("filesize_approx")
+        if not filesize and info.get("requested_formats"):
+            filesize = sum(f.get("filesize") or f.get("filesize_approx") or 0 for f in info["requested_formats"])
+        self.put(key, "filesize", filesize or None)
+
+    def invalidate(self, key, field=None):
+        extractor, video_id = key
+        with self._lock:
+            if field is None:
+                self._conn.execute("DELETE FROM metadata WHERE extractor = ? AND video_id = ?", (extractor, video_id))
+            else:
+                self._conn.execute("DELETE FROM metadata WHERE extractor = ? AND video_id = ? AND field = ?",
+                                   (extractor, video_id, field))
+            self._conn.commit()
+            self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM metadata").fetchone()[0]
+
+    def _evict(self):
+        # Caller must hold self._lock.
+        if self._total_bytes > self.max_bytes:
+            self._flush_accessed()
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT rowid, size FROM metadata ORDER BY accessed_at LIMIT 100").fetchall()
+            if not rows:
+                self._total_bytes = 0
+                return
+            for rowid, size in rows:
+                self._conn.execute("DELETE FROM metadata WHERE rowid = ?", (rowid,))
+                self._total_bytes -= size
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "bytes": self._total_bytes,
+            }
+
+    def flush(self):
+        """Writes the access times collected since the last write."""
+        with self._lock:
+            self._flush_accessed()
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._flush_accessed()
+            self._conn.commit()
+            self._conn.close()
@@ -0,0 +1,168 @@
+import threading
+import time
+
+from aria2_tuning import ThroughputMeter
+
+# Upper bounds, in seconds, of the histogram buckets for phase and job durations.
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+# Postprocessors reported as their own phase rather than as "postprocess".
+POSTPROCESS_PHASES = {"EmbedThumbnail": "thumbnail"}
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{str(value)}"' for key, value in sorted(labels)) + "}"
+
+
+class MetricsRegistry:
+    """Counters, gauges and histograms rendered in the Prometheus text format.
+
+    Metrics are declared once with describe() and then updated by name with
+    labels as keyword arguments. Everything lives in plain dicts under one
+    lock; there are only a few dozen series.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._values = {}
+
+    def describe(self, name, kind, help_text, buckets=None):
+        self._meta[name] = (kind, help_text, buckets)
+        self._values.setdefault(name, {})
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values[name]
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._values[name][tuple(sorted(labels.items()))] = value
+
+    def observe(self, name, value, **labels):
+        buckets = self._meta[name][2]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total, count = self._values[name].get(key, ([0] * len(buckets), 0.0, 0))
+            counts = [c + (value <= bound) for c, bound in zip(counts, buckets)]
+            self._values[name][key] = (counts, total + value, count + 1)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, buckets) in self._meta.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(self._values[name].items()):
+                    if kind != "histogram":
+                        lines.append(f"{name}{_labels(key)} {value}")
+                        continue
+                    counts, total, count = value
+                    for bound, bucket_count in zip(buckets, counts):
+                        lines.append(f"{name}_bucket{_labels(key + (('le', bound),))} {bucket_count}")
+                    lines.append(f"{name}_bucket{_labels(key + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{_labels(key)} {total}")
+                    lines.append(f"{name}_count{_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def engine_metrics():
+    """A registry with every metric the download engine reports."""
+    registry = MetricsRegistry()
+    registry.describe("downloader_jobs_active", "gauge", "Jobs currently running.")
+    registry.describe("downloader_queue_depth", "gauge", "Jobs waiting for a worker.")
+    registry.describe("downloader_postprocess_active", "gauge", "Jobs being merged or converted.")
+    registry.describe("downloader_postprocess_queue_depth", "gauge",
+                      "Downloaded jobs waiting to be merged or converted.")
+    registry.describe("downloader_download_speed_bytes", "gauge", "Combined speed of running jobs in bytes/s.")
+    registry.describe("downloader_bytes_downloaded_total", "counter", "Bytes transferred by finished jobs.")
+    registry.describe("downloader_jobs_finished_total", "counter", "Jobs that stopped, by result.")
+    registry.describe("downloader_job_retries_total", "counter", "Job attempts after the first.")
+    registry.describe("downloader_job_errors_total", "counter", "Failed attempts by error class, retried or not.")
+    registry.describe("downloader_phase_duration_seconds", "histogram", "Time jobs spent in each phase.",
+                      DURATION_BUCKETS)
+    registry.describe("downloader_job_duration_seconds", "histogram", "Time from queueing to the end of a job.",
+                      DURATION_BUCKETS)
+    registry.describe("downloader_playlist_probe_seconds", "histogram", "Time to list a playlist's entries.",
+                      DURATION_BUCKETS)
+    registry.describe("downloader_metadata_cache_hits_total", "counter", "Metadata cache hits.")
+    registry.describe("downloader_metadata_cache_misses_total", "counter", "Metadata cache misses.")
+    registry.describe("downloader_metadata_cache_hit_ratio", "gauge", "Metadata cache hits per lookup.")
+    registry.describe("downloader_event_lag_seconds", "gauge", "Age of the oldest event in the last UI batch.")
+    registry.describe("downloader_disk_free_bytes", "gauge", "Free space on the download directory's filesystem.")
+    registry.describe("downloader_disk_reserved_bytes", "gauge",
+                      "Space set aside for running jobs that their files do not take up yet.")
+    registry.describe("downloader_jobs_waiting_for_disk", "gauge", "Jobs deferred until there is disk space.")
+    registry.describe("downloader_disk_written_bytes_total", "counter",
+                      "Bytes finished jobs wrote to disk, downloads and converted output.")
+    return registry
+
+
+class JobTimeline:
+    """Where one job's time went, phase by phase.
+
+    Phases are queued, title, extract, download, postprocess_wait (downloaded,
+    waiting for a post-processing thread), merge, postprocess, thumbnail,
+    retry_wait (failed, waiting to run again) and disk_wait (deferred until
+    there is disk space).
+    Entering a phase ends the previous one, and a phase entered twice (the
+    video, then the audio download) adds up. Bytes and speeds come from the
+    job's download progress events; output_bytes is the size of the file
+    merging or converting wrote, set by the engine when the job finishes.
+    """
+
+    def __init__(self):
+        self.created = time.time()
+        self.phases = {}
+        self.phase = "queued"
+        self._phase_started = time.monotonic()
+        self._created_monotonic = self._phase_started
+        self.transfer = ThroughputMeter()
+        self.peak_speed = 0.0
+        self.attempts = 0
+        self.output_bytes = 0
+
+    def enter(self, phase):
+        now = time.monotonic()
+        if phase == self.phase:
+            return
+        if self.phase is not None:
+            self.phases[self.phase] = self.phases.get(self.phase, 0.0) + now - self._phase_started
+        self.phase = phase
+        self._phase_started = now
+
+    def on_progress(self, msg):
+        """Moves to the phase a progress event reports and keeps the transfer figures."""
+        if msg.get('phase') == 'download':
+            self.enter("download")
+            self.transfer.update(msg.get('downloaded_bytes') or 0)
+            self.peak_speed = max(self.peak_speed, msg.get('speed') or 0.0)
+        elif msg.get('phase') == 'merge':
+            self.enter("merge")
+        elif msg.get('phase') == 'postprocess':
+            self.enter(POSTPROCESS_PHASES.get(msg.get('postprocessor'), "postprocess"))
+
+    def finish(self, result, error=None):
+        """Ends the job and returns its summary, as stored with the history entry."""
+        self.enter(None)
+        download_seconds = self.phases.get("download", 0.0)
+        converted = any(phase in self.phases for phase in ("merge", "postprocess", "thumbnail"))
+        disk_bytes = self.transfer.bytes + (self.output_bytes if converted else 0)
+        disk_seconds = download_seconds + sum(self.phases.get(phase, 0.0)
+                                              for phase in ("merge", "postprocess", "thumbnail"))
+        return {
+            "result": result,
+            "error": error,
+            "queued_at": self.created,
+            "duration": round(time.monotonic() - self._created_monotonic, 3),
+            "phases": {phase: round(seconds, 3) for phase, seconds in self.phases.items()},
+            "bytes": self.transfer.bytes,
+            "avg_speed": round(self.transfer.bytes / download_seconds, 1) if download_seconds else None,
+            "peak_speed": round(self.peak_speed, 1),
+            "disk_bytes": disk_bytes,
+            "disk_write_speed": round(disk_bytes / disk_seconds, 1) if disk_seconds else None,
+            "retries": max(0, self.attempts - 1),
+        }
@@ -0,0 +1,63 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def default_workers():
+    """One post-processing thread per CPU core; ffmpeg is the bottleneck there, not the network."""
+    return os.cpu_count() or 2
+
+
+class PostprocessPool:
+    """Merges, converts and embeds finished downloads while the next ones transfer.
+
+    A download hands its job over with submit(job, run) once every byte is on
+    disk and frees its download slot straight away; run(job) then does the
+    CPU-bound yt-dlp/ffmpeg step on one of workers threads. Jobs start in
+    the order they were handed over. on_idle() is called when the last one
+    finishes.
+    """
+
+    def __init__(self, workers=None, on_idle=None):
+        self.workers = max(1, int(workers or default_workers()))
+        self.on_idle = on_idle
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="postprocess")
+        self._lock = threading.Lock()
+        self._waiting = OrderedDict()
+        self._running = {}
+
+    def submit(self, job, run):
+        with self._lock:
+            self._waiting[job.id] = job
+        self._executor.submit(self._run, job, run)
+
+    def _run(self, job, run):
+        with self._lock:
+            self._waiting.pop(job.id, None)
+            self._running[job.id] = job
+        try:
+            run(job)
+        except Exception as e:
+            print(f"Post-processing job {job.id} crashed: {e}")
+        finally:
+            with self._lock:
+                self._running.pop(job.id, None)
+                idle = not self._waiting and not self._running
+            if idle and self.on_idle:
+                self.on_idle()
+
+    def is_busy(self):
+        with self._lock:
+            return bool(self._waiting or self._running)
+
+    def waiting_jobs(self):
+        with self._lock:
+            return list(self._waiting.values())
+
+    def active_jobs(self):
+        with self._lock:
+            return list(self._running.values())
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,56 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Upcoming items are resolved on this many threads, next to the running downloads.
+PREFETCH_WORKERS = 2
+
+
+class MetadataPrefetcher:
+    """Resolves title, formats and size of upcoming items while earlier ones download.
+
+    resolve(item) does the work and caches the result wherever the download
+    will look for it; the prefetcher only makes sure each item is resolved
+    once, off the worker threads. wait(item_id) lets a job that starts while
+    its own prefetch is still running pick up that result instead of
+    probing a second time.
+    """
+
+    def __init__(self, resolve, workers=PREFETCH_WORKERS):
+        self.resolve = resolve
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._futures = {}
+
+    def prefetch(self, items):
+        started = []
+        with self._lock:
+            for item in items:
+                if item["id"] not in self._futures:
+                    future = self._futures[item["id"]] = self._executor.submit(self._run, item)
+                    started.append((item["id"], future))
+        # Outside the lock: a future that is already done runs its callback right here.
+        for item_id, future in started:
+            future.add_done_callback(lambda done, item_id=item_id: self._forget(item_id, done))
+
+    def _forget(self, item_id, future):
+        # Finished or cancelled prefetches are dropped whether or not a job waited for them.
+        with self._lock:
+            if self._futures.get(item_id) is future:
+                del self._futures[item_id]
+
+    def _run(self, item):
+        try:
+            self.resolve(item)
+        except Exception as e:
+            # The download probes again itself, and reports the error if it persists.
+            print(f"Could not prefetch {item['url']}: {e}")
+
+    def wait(self, item_id, timeout=None):
+        """Waits for item_id's prefetch if it is still queued or running, and forgets it."""
+        with self._lock:
+            future = self._futures.pop(item_id, None)
+        if future is not None and not future.cancel():
+            future.exception(timeout)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,111 @@
+"""Structured progress events shared by every download path.
+
+The yt-dlp binary is asked to print its progress hooks as JSON lines with a
+fixed prefix, the library engine hands over the same dicts directly, and the
+aria2 RPC backend builds them from tellActive numbers. All of them end up as
+one event shape:
+
+    {'type': 'progress', 'phase': 'download' | 'merge' | 'postprocess',
+     'downloaded_bytes': int, 'total_bytes': int | None, 'speed': float,
+     'eta': float | None, 'fragment_index': int | None,
+     'fragment_count': int | None, 'percent': float}
+"""
+import json
+
+PROGRESS_PREFIX = "ARIA_PROGRESS "
+POSTPROCESS_PREFIX = "ARIA_POSTPROCESS "
+DONE_PREFIX = "ARIA_DONE "
+MERGE_POSTPROCESSORS = ("Merger", "FFmpegMerger")
+
+
+def progress_args():
+    """yt-dlp options that make it print machine-readable progress and the final file."""
+    return [
+        "--newline",
+        "--progress-template", f"download:{PROGRESS_PREFIX}%(progress)j",
+        "--progress-template", f"postprocess:{POSTPROCESS_PREFIX}%(progress)j",
+        "--print", f"after_move:{DONE_PREFIX}%(.{{id,extractor_key,title,filepath,filesize,filesize_approx}})j",
+    ]
+
+
+def _percent(downloaded, total, fragment_index, fragment_count):
+    if total:
+        return min(100.0, downloaded / total * 100)
+    if fragment_count:
+        return min(100.0, (fragment_index or 0) / fragment_count * 100)
+    return 0.0
+
+
+def download_event(status):
+    """Normalizes a yt-dlp download progress hook dict."""
+    downloaded = status.get('downloaded_bytes') or 0
+    total = status.get('total_bytes') or status.get('total_bytes_estimate')
+    fragment_index = status.get('fragment_index')
+    fragment_count = status.get('fragment_count')
+    return {
+        'type': 'progress',
+        'phase': 'download',
+        'downloaded_bytes': int(downloaded),
+        'total_bytes': int(total) if total else None,
+        'speed': float(status.get('speed') or 0),
+        'eta': status.get('eta'),
+        'fragment_index': fragment_index,
+        'fragment_count': fragment_count,
+        'percent': 100.0 if status.get('status') == 'finished' else _percent(downloaded, total, fragment_index,
+                                                                            fragment_count),
+    }
+
+
+def postprocess_event(status):
+    """Normalizes a yt-dlp postprocessor hook dict."""
+    postprocessor = status.get('postprocessor')
+    return {
+        'type': 'progress',
+        'phase': 'merge' if postprocessor in MERGE_POSTPROCESSORS else 'postprocess',
+        'postprocessor': postprocessor,
+        'status': status.get('status'),
+        'downloaded_bytes': 0,
+        'total_bytes': None,
+        'speed': 0.0,
+        'eta': None,
+        'fragment_index': None,
+        'fragment_count': None,
+        # Post-processing only starts once every byte is on disk.
+        'percent': 100.0,
+    }
+
+
+def aria2_event(statuses):
+    """Builds one download event from the aria2 status dicts of a job's files."""
+    total = sum(int(s.get('totalLength', 0)) for s in statuses)
+    downloaded = sum(int(s.get('completedLength', 0)) for s in statuses)
+    speed = sum(int(s.get('downloadSpeed', 0)) for s in statuses)
+    return {
+        'type': 'progress',
+        'phase': 'download',
+        'downloaded_bytes': downloaded,
+        'total_bytes': total or None,
+        'speed': float(speed),
+        'eta': (total - downloaded) / speed if speed and total else None,
+        'fragment_index': None,
+        'fragment_count': None,
+        'percent': _percent(downloaded, total, None, None),
+    }
+
+
+def parse_line(line):
+    """Parses one line of yt-dlp output.
+
+    Returns a progress event, a {'type': 'file_done', 'info': {...}} event for
+    the final file, or None when the line is not part of the protocol.
+    """
+    try:
+        if line.startswith(PROGRESS_PREFIX):
+            return download_event(json.loads(line[len(PROGRESS_PREFIX):]))
+        if line.startswith(POSTPROCESS_PREFIX):
+            return postprocess_event(json.loads(line[len(POSTPROCESS_PREFIX):]))
+        if line.startswith(DONE_PREFIX):
+            return {'type': 'file_done', 'info': json.loads(line[len(DONE_PREFIX):])}
+    except (json.JSONDecodeError, TypeError, AttributeError):
+        return None
+    return None
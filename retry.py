@@ -0,0 +1,90 @@
+import random
+import re
+
+# What went wrong, and whether waiting and trying again can help:
+#   network      connection reset/refused, timeouts, DNS, 5xx: retry soon
+#   throttled    429 or "server busy": back off for longer
+#   expired      403 on a signed media URL: resolve again and retry at once
+#   unavailable  private, removed, geo-blocked, 404, unsupported: never retry
+#   disk_full    needs someone to free space: never retry
+#   unknown      anything else: one more try
+ERROR_CLASSES = ("network", "throttled", "expired", "unavailable", "disk_full", "unknown")
+# attempts counts the first run; delays are in seconds and double per attempt
+# up to max_delay, with jitter. Settings can override any of them through
+# "retry_policies", e.g. {"throttled": {"attempts": 10}}.
+RETRY_POLICIES = {
+    "network": {"attempts": 5, "delay": 5, "max_delay": 300},
+    "throttled": {"attempts": 6, "delay": 30, "max_delay": 900},
+    "expired": {"attempts": 3, "delay": 1, "max_delay": 10},
+    "unavailable": {"attempts": 1, "delay": 0, "max_delay": 0},
+    "disk_full": {"attempts": 1, "delay": 0, "max_delay": 0},
+    "unknown": {"attempts": 2, "delay": 10, "max_delay": 60},
+}
+
+# aria2c exit codes and RPC errorCode values, from aria2c(1) "EXIT STATUS".
+ARIA2_ERROR_CLASSES = {
+    2: "network",  # timeout
+    3: "unavailable",  # resource not found
+    4: "unavailable",  # max file not found
+    5: "network",  # speed too slow
+    6: "network",  # network problem
+    9: "disk_full",  # not enough disk space
+    19: "network",  # name resolution failed
+    22: "expired",  # bad or unexpected HTTP response header, such as a 403
+    24: "expired",  # HTTP authorization failed
+    29: "throttled",  # server overloaded or in maintenance
+}
+ARIA2_EXIT_RE = re.compile(r"aria2c exited with code (\d+)")
+# Checked in order; the first class with a matching pattern wins.
+ERROR_PATTERNS = [
+    ("disk_full", re.compile(r"No space left on device|Errno 28|not enough disk space|Disk quota exceeded", re.I)),
+    ("unavailable", re.compile(
+        r"Private video|Video unavailable|has been removed|no longer available|not available in your country|"
+        r"geo.?restrict|blocked it in your country|members.only|Join this channel|Sign in to confirm your age|"
+        r"HTTP Error 404|Unsupported URL|This video is unavailable|account .* terminated|copyright", re.I)),
+    ("throttled", re.compile(r"HTTP Error 429|Too Many Requests|rate.?limit|status=429", re.I)),
+    ("expired", re.compile(r"HTTP Error 403|403:? Forbidden|status=403|URL.{0,40}\bexpired|"
+                           r"\bexpired.{0,20}\bURL", re.I)),
+    ("network", re.compile(
+        r"Connection (reset|refused|aborted)|timed? ?out|Temporary failure in name resolution|Name or service not known|"
+        r"Remote end closed|IncompleteRead|Unable to download (webpage|API page)|HTTP Error 5\d\d|"
+        r"Network is unreachable|SSLError|\[SSL[:\]]|SSL routines|EOF occurred in violation of protocol|"
+        r"getaddrinfo|RPC error|BrokenPipe", re.I)),
+]
+# Only the message and the error lines of the output are classified: yt-dlp's
+# "ERROR:" lines and aria2c's "[ERROR]" ones. WARNING lines often mention
+# signatures or retries on downloads that fail for another reason.
+ERROR_LINE_RE = re.compile(r"^(?:ERROR:|.*\[ERROR\]).*$", re.M)
+
+
+def classify(message, details="", aria2_code=None):
+    """The error class of a failure from its message, yt-dlp's stderr and aria2c's exit code or errorCode."""
+    if aria2_code is None:
+        match = ARIA2_EXIT_RE.search(f"{message}\n{details}")
+        aria2_code = int(match.group(1)) if match else None
+    text = "\n".join([message] + ERROR_LINE_RE.findall(details or ""))
+    for error_class, pattern in ERROR_PATTERNS:
+        if pattern.search(text):
+            return error_class
+    if aria2_code in ARIA2_ERROR_CLASSES:
+        return ARIA2_ERROR_CLASSES[aria2_code]
+    return "unknown"
+
+
+def policy_for(error_class, overrides=None):
+    policy = dict(RETRY_POLICIES.get(error_class, RETRY_POLICIES["unknown"]))
+    policy.update((overrides or {}).get(error_class, {}))
+    return policy
+
+
+def retry_delay(policy, attempt, rng=random):
+    """Seconds to wait before attempt (2 for the first retry) under policy, or None when attempts are used up.
+
+    The delay doubles per attempt up to max_delay, then a random amount of up
+    to half of it is taken off, so jobs that failed together do not all come
+    back at the same moment.
+    """
+    if attempt > policy["attempts"]:
+        return None
+    delay = min(policy["max_delay"], policy["delay"] * 2 ** (attempt - 2))
+    return delay - rng.uniform(0, delay / 2)
@@ -0,0 +1,193 @@
+import os
+import signal
+import sys
+import threading
+import uuid
+from collections import deque
+from urllib.parse import urlparse
+
+
+def host_of(url):
+    """Returns the host a URL will be fetched from, without a leading www./m."""
+    host = (urlparse(url).hostname or "").lower()
+    for prefix in ("www.", "m."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    if host == "youtu.be":
+        host = "youtube.com"
+    return host
+
+
+class Job:
+    """A single download with its own process, progress and cancel state."""
+
+    def __init__(self, item):
+        self.id = item.get("id") or uuid.uuid4().hex
+        item["id"] = self.id
+        self.item = item
+        self.url = item["url"]
+        self.host = host_of(self.url)
+        self.process = None
+        self.cancel_event = threading.Event()
+        self.status = "queued"
+        self.paused = False
+        self.progress = {}
+        self.error = None
+        # One of retry.ERROR_CLASSES once the job has failed.
+        self.error_class = None
+        self.filepath = None
+        # Set by the engine while the job runs: how fast it downloads, the
+        # aria2c settings it downloads with and the media host they were chosen for.
+        self.meter = None
+        self.aria2_plan = None
+        self.tuning_host = None
+        # Phase timing while the job is queued or running, then its summary.
+        self.timeline = None
+        self.metrics = None
+
+    @property
+    def title(self):
+        return self.item.get("title", "N/A")
+
+    @property
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "url": self.url,
+            "title": self.title,
+            "host": self.host,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "error_class": self.error_class,
+            "filepath": self.filepath,
+            "rate_limit": self.item.get("rate_limit"),
+            "metrics": self.metrics,
+        }
+
+    def cancel(self):
+        self.cancel_event.set()
+        process = self.process
+        if not process:
+            return
+        try:
+            if sys.platform != "win32":
+                os.killpg(os.getpgid(process.pid), signal.SIGTERM)
+            else:
+                process.terminate()
+        except (ProcessLookupError, PermissionError) as e:
+            print(f"Could not cancel download: {e}")
+
+
+class DownloadScheduler:
+    """Runs queued jobs on up to max_workers threads, at most max_per_host per host.
+
+    run_job(job) is called on a worker thread and should block until the job
+    has finished. on_idle() is called once the last running job completes and
+    nothing else is pending. on_error(job, exc) is called if run_job raises,
+    so the job can be failed instead of being left running.
+    """
+
+    def __init__(self, run_job, max_workers=3, max_per_host=2, on_idle=None, on_error=None):
+        self.run_job = run_job
+        self.on_idle = on_idle
+        self.on_error = on_error
+        self.max_workers = max(1, int(max_workers))
+        self.max_per_host = max(1, int(max_per_host))
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._active = {}
+        self._host_counts = {}
+
+    def set_limits(self, max_workers, max_per_host):
+        with self._lock:
+            self.max_workers = max(1, int(max_workers))
+            self.max_per_host = max(1, int(max_per_host))
+            self._dispatch()
+
+    def submit(self, job):
+        with self._lock:
+            self._pending.append(job)
+            self._dispatch()
+        return job
+
+    def is_busy(self):
+        with self._lock:
+            return bool(self._active or self._pending)
+
+    def active_jobs(self):
+        with self._lock:
+            return list(self._active.values())
+
+    def pending_jobs(self):
+        with self._lock:
+            return list(self._pending)
+
+    def get_job(self, job_id):
+        with self._lock:
+            if job_id in self._active:
+                return self._active[job_id]
+            for job in self._pending:
+                if job.id == job_id:
+                    return job
+        return None
+
+    def remove(self, job_id):
+        """Takes a job that has not started off the queue. Returns it, or None if it is not pending."""
+        with self._lock:
+            for job in self._pending:
+                if job.id == job_id:
+                    self._pending.remove(job)
+                    return job
+        return None
+
+    def cancel_all(self):
+        """Cancels running jobs and returns the items that had not started yet."""
+        with self._lock:
+            pending = [job.item for job in self._pending]
+            self._pending.clear()
+            active = list(self._active.values())
+        for job in active:
+            job.cancel()
+        return pending
+
+    def _dispatch(self):
+        # Caller must hold self._lock.
+        if not self._pending:
+            return
+        skipped = deque()
+        while self._pending and len(self._active) < self.max_workers:
+            job = self._pending.popleft()
+            if self._host_counts.get(job.host, 0) >= self.max_per_host:
+                skipped.append(job)
+                continue
+            self._active[job.id] = job
+            self._host_counts[job.host] = self._host_counts.get(job.host, 0) + 1
+            job.status = "running"
+            threading.Thread(target=self._run, args=(job,), daemon=True).start()
+        skipped.extend(self._pending)
+        self._pending = skipped
+
+    def _run(self, job):
+        try:
+            self.run_job(job)
+        except Exception as e:
+            if self.on_error:
+                self.on_error(job, e)
+            else:
+                print(f"Download job {job.id} crashed: {e}")
+        finally:
+            with self._lock:
+                self._active.pop(job.id, None)
+                remaining = self._host_counts.get(job.host, 1) - 1
+                if remaining > 0:
+                    self._host_counts[job.host] = remaining
+                else:
+                    self._host_counts.pop(job.host, None)
+                self._dispatch()
+                idle = not self._active and not self._pending
+            if idle and self.on_idle:
+                self.on_idle()
@@ -0,0 +1,236 @@
+import asyncio
+import json
+import os
+import time
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+from instance import API_HOST, API_PORT, APP_ID
+
+# How often an event stream client is sent what has accumulated, and how long
+# an idle stream waits before sending a keep-alive comment, in seconds.
+STREAM_INTERVAL = 0.25
+STREAM_KEEPALIVE = 15
+MAX_BATCH_URLS = 1000
+
+
+def _sse(msg):
+    return f"event: {msg.get('type', 'message')}\ndata: {json.dumps(msg, default=str)}\n\n"
+
+
+def create_app(engine):
+    """The HTTP API used by the browser extension, bound to one DownloadEngine."""
+    app = FastAPI()
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    def find_job(job_id):
+        job = engine.get_job(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="no such job")
+        return job
+
+    def rate_limit_of(data):
+        """data's rate_limit in KiB/s, or None; anything but a non-negative whole number is a 400."""
+        rate_limit = data.get("rate_limit")
+        # bool is an int subclass, so true would otherwise be taken as 1 KiB/s.
+        if rate_limit is not None and (not isinstance(rate_limit, int) or isinstance(rate_limit, bool)
+                                       or rate_limit < 0):
+            raise HTTPException(status_code=400, detail="rate_limit must be a number of KiB/s")
+        return rate_limit
+
+    def idempotency_key(request, data):
+        return request.headers.get("Idempotency-Key") or data.get("idempotency_key")
+
+    @app.get("/instance")
+    async def instance():
+        """Identifies this app, so a second launch can hand its URLs over instead of starting another."""
+        return {"app": APP_ID, "pid": os.getpid()}
+
+    @app.post("/instance/show")
+    async def show_instance():
+        """Brings the window to the front; a no-op without one."""
+        engine.emit({'type': 'show_window'})
+        return {"status": "ok"}
+
+    @app.post("/add")
+    async def add_video(request: Request):
+        data = await request.json()
+        url = data.get("url")
+        if url:
+            rate_limit = rate_limit_of(data)
+            result = (await asyncio.to_thread(engine.add_urls, [url], idempotency_key(request, data),
+                                              rate_limit=rate_limit))[0]
+            if result["status"] == "duplicate":
+                return {"status": "duplicate", "job_id": result["job_id"], "reason": result["reason"]}
+            return {"status": "queued", "job_id": result["job_id"]}
+        return {"error": "no url"}
+
+    @app.post("/add/batch")
+    async def add_videos(request: Request):
+        """Queues a list of URLs in one request and reports accepted/duplicate per URL.
+
+        A rate_limit, if given, applies to each of them.
+        """
+        data = await request.json()
+        urls = data.get("urls")
+        if not isinstance(urls, list) or not all(isinstance(url, str) and url.strip() for url in urls):
+            raise HTTPException(status_code=400, detail="urls must be a list of URLs")
+        if len(urls) > MAX_BATCH_URLS:
+            raise HTTPException(status_code=413, detail=f"at most {MAX_BATCH_URLS} urls per request")
+        rate_limit = rate_limit_of(data)
+        results = await asyncio.to_thread(engine.add_urls, [url.strip() for url in urls],
+                                          idempotency_key(request, data), rate_limit=rate_limit)
+        accepted = sum(1 for result in results if result["status"] == "accepted")
+        return {"accepted": accepted, "duplicates": len(results) - accepted, "results": results}
+
+    @app.get("/jobs")
+    async def list_jobs(status: str = None):
+        jobs = engine.list_jobs()
+        if status:
+            jobs = [job for job in jobs if job.status == status]
+        return {"jobs": [job.to_dict() for job in jobs]}
+
+    @app.get("/jobs/{job_id}")
+    async def get_job(job_id: str):
+        return find_job(job_id).to_dict()
+
+    @app.post("/jobs/{job_id}/cancel")
+    async def cancel_job(job_id: str):
+        job = find_job(job_id)
+        if not engine.cancel(job_id):
+            raise HTTPException(status_code=409, detail=f"job is {job.status}")
+        return {"status": "cancelling", "job_id": job_id}
+
+    @app.post("/jobs/{job_id}/pause")
+    async def pause_job(job_id: str):
+        job = find_job(job_id)
+        if not engine.pause(job_id):
+            raise HTTPException(status_code=409, detail=f"job is {job.status}")
+        return {"status": "pausing", "job_id": job_id}
+
+    @app.post("/jobs/{job_id}/resume")
+    async def resume_job(job_id: str):
+        job = find_job(job_id)
+        if not engine.resume(job_id):
+            raise HTTPException(status_code=409, detail=f"job is {job.status}")
+        return {"status": "queued", "job_id": job_id}
+
+    @app.post("/jobs/{job_id}/retry")
+    async def retry_job(job_id: str):
+        """Queues a failed job again with a fresh set of automatic retries."""
+        if not await asyncio.to_thread(engine.retry, job_id):
+            job = engine.get_job(job_id)
+            if job is None:
+                raise HTTPException(status_code=404, detail="no such job")
+            raise HTTPException(status_code=409, detail=f"job is {job.status}")
+        return {"status": "queued", "job_id": job_id}
+
+    @app.post("/jobs/{job_id}/limit")
+    async def limit_job(job_id: str, request: Request):
+        """Sets a job's own limit in KiB/s ({"rate_limit": 512}); 0 or null removes it."""
+        job = find_job(job_id)
+        rate_limit = rate_limit_of(await request.json())
+        if not engine.set_rate_limit(job_id, rate_limit):
+            raise HTTPException(status_code=409, detail=f"job is {job.status}")
+        return {"status": "ok", "job_id": job_id, "rate_limit": rate_limit or None}
+
+    @app.get("/bandwidth")
+    async def bandwidth():
+        """The global limit in force right now and each running job's share, in bytes/s."""
+        return {"limit": engine.bandwidth.ceiling(), "jobs": engine.bandwidth.allocations()}
+
+    @app.get("/disk")
+    async def disk():
+        """Free space in download_dir, each running job's reservation and download speed, and jobs waiting for space."""
+        return await asyncio.to_thread(engine.disk_status)
+
+    @app.get("/tuning")
+    async def tuning():
+        """Median speed per host with the static aria2c setting and with tuning, from recorded downloads."""
+        return {"hosts": await asyncio.to_thread(engine.tuner.report, engine.connections_per_job())}
+
+    @app.get("/metrics")
+    async def metrics():
+        """Counters, gauges and histograms in the Prometheus text format, for scraping."""
+        return PlainTextResponse(await asyncio.to_thread(engine.metrics_text),
+                                 media_type="text/plain; version=0.0.4")
+
+    def coordinator():
+        if engine.coordinator is None:
+            raise HTTPException(status_code=404, detail="not a coordinator")
+        return engine.coordinator
+
+    async def worker_request(request):
+        data = await request.json()
+        if not isinstance(data.get("worker_id"), str) or not data["worker_id"]:
+            raise HTTPException(status_code=400, detail="worker_id is required")
+        return data
+
+    @app.post("/cluster/lease")
+    async def cluster_lease(request: Request):
+        """Leases queued jobs to a worker, up to its free slots."""
+        cluster = coordinator()
+        data = await worker_request(request)
+        items = await asyncio.to_thread(cluster.lease, data["worker_id"], data)
+        return {"jobs": items, "lease_ttl": cluster.lease_ttl}
+
+    @app.post("/cluster/heartbeat")
+    async def cluster_heartbeat(request: Request):
+        """Renews a worker's leases and takes its progress; lists the jobs it should stop."""
+        cluster = coordinator()
+        data = await worker_request(request)
+        cancel = await asyncio.to_thread(cluster.heartbeat, data["worker_id"], data)
+        return {"cancel": cancel, "lease_ttl": cluster.lease_ttl}
+
+    @app.post("/cluster/complete")
+    async def cluster_complete(request: Request):
+        """Takes a worker's result for a leased job; 409 when the lease has expired or moved."""
+        cluster = coordinator()
+        data = await worker_request(request)
+        if not await asyncio.to_thread(cluster.complete, data["worker_id"], data):
+            raise HTTPException(status_code=409, detail="no lease on this job")
+        return {"status": "ok"}
+
+    @app.get("/cluster")
+    async def cluster_status():
+        """Live workers, their leases and the jobs waiting for one."""
+        return coordinator().status()
+
+    @app.get("/events")
+    async def stream_events(request: Request):
+        """Server-sent events for every job. Progress is coalesced to the latest update per job."""
+        subscriber = engine.broadcaster.subscribe()
+
+        async def stream():
+            last_sent = time.monotonic()
+            try:
+                while not await request.is_disconnected():
+                    events = subscriber.drain()
+                    if events:
+                        yield "".join(_sse(msg) for msg in events)
+                        last_sent = time.monotonic()
+                    elif time.monotonic() - last_sent >= STREAM_KEEPALIVE:
+                        yield ": keep-alive\n\n"
+                        last_sent = time.monotonic()
+                    await asyncio.sleep(STREAM_INTERVAL)
+            finally:
+                engine.broadcaster.unsubscribe(subscriber)
+
+        return StreamingResponse(stream(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache"})
+
+    return app
+
+
+def run_app(app, host=API_HOST, port=API_PORT):
+    """Runs an app from create_app on the calling thread until the process is interrupted."""
+    uvicorn.run(app, host=host, port=port)
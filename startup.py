@@ -0,0 +1,45 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    """How long each part of starting up took, for the one-line report printed once the app is ready.
+
+    Phases time the same way as JobTimeline's: a phase entered twice adds up.
+    Steps that finish in the background (loading the history view, starting
+    the API server) are announced with expect() and ended with finish(); the
+    caller whose finish() returns True was the last one and prints the report.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self._lock = threading.Lock()
+        self._pending = set()
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def expect(self, *steps):
+        with self._lock:
+            self._pending.update(steps)
+
+    def finish(self, step):
+        """Marks a background step done; True if it was the last one still expected."""
+        with self._lock:
+            if step not in self._pending:
+                return False
+            self._pending.discard(step)
+            return not self._pending
+
+    def report(self):
+        with self._lock:
+            phases = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases.items())
+        return f"Started in {(time.perf_counter() - self.started) * 1000:.0f} ms ({phases})"
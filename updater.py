@@ -0,0 +1,41 @@
+import os
+import sys
+
+import requests
+
+YT_DLP_RELEASE_URL = "https://api.github.com/repos/yt-dlp/yt-dlp/releases/latest"
+
+
+def update_yt_dlp(assets_dir="assets"):
+    """Replaces the yt-dlp executable in assets_dir with the latest release and returns its path.
+
+    Imported only when an update is asked for, so requests is not loaded at startup.
+    """
+    # Determine the correct asset for the OS
+    asset_name = "yt-dlp.exe" if sys.platform == "win32" else "yt-dlp"
+
+    # Get the latest release information from GitHub API
+    response = requests.get(YT_DLP_RELEASE_URL)
+    response.raise_for_status()
+    release_data = response.json()
+
+    # Find the download URL for the correct asset
+    asset_url = None
+    for asset in release_data['assets']:
+        if asset['name'] == asset_name:
+            asset_url = asset['browser_download_url']
+            break
+
+    if not asset_url:
+        raise Exception(f"Could not find asset: {asset_name}")
+
+    # Download the new executable
+    response = requests.get(asset_url, stream=True)
+    response.raise_for_status()
+
+    # Write the new executable to the assets folder
+    yt_dlp_path = os.path.join(assets_dir, asset_name)
+    with open(yt_dlp_path, 'wb') as f:
+        for chunk in response.iter_content(chunk_size=8192):
+            f.write(chunk)
+    return yt_dlp_path
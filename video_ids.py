@@ -0,0 +1,47 @@
+import re
+from urllib.parse import urlparse, parse_qs
+
+YOUTUBE_HOSTS = ("youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com", "youtube-nocookie.com",
+                 "www.youtube-nocookie.com")
+YOUTUBE_ID_RE = re.compile(r"^[0-9A-Za-z_-]{11}$")
+
+
+def video_key(url):
+    """Returns (extractor, video_id) for url without touching the network.
+
+    YouTube watch, youtu.be, shorts, embed and live URLs for the same video map
+    to the same key. Other sites fall back to ("generic", url).
+    """
+    parsed = urlparse(url.strip())
+    host = (parsed.hostname or "").lower()
+    path_parts = [part for part in parsed.path.split("/") if part]
+
+    video_id = None
+    if host == "youtu.be" and path_parts:
+        video_id = path_parts[0]
+    elif host in YOUTUBE_HOSTS:
+        if path_parts[:1] == ["watch"]:
+            video_id = parse_qs(parsed.query).get("v", [None])[0]
+        elif len(path_parts) >= 2 and path_parts[0] in ("shorts", "embed", "live", "v"):
+            video_id = path_parts[1]
+
+    if video_id and YOUTUBE_ID_RE.match(video_id):
+        return "youtube", video_id
+    return "generic", url.strip()
+
+
+def playlist_key(url):
+    """Returns (extractor, playlist_id) for a playlist URL, or None."""
+    parsed = urlparse(url.strip())
+    host = (parsed.hostname or "").lower()
+    if host in YOUTUBE_HOSTS or host == "youtu.be":
+        playlist_id = parse_qs(parsed.query).get("list", [None])[0]
+        if playlist_id:
+            return "youtube:tab", playlist_id
+    return None
+
+
+def canonical_id(url):
+    """The "<extractor> <id>" string yt-dlp writes to --download-archive files."""
+    extractor, video_id = video_key(url)
+    return f"{extractor} {video_id}"
@@ -0,0 +1,196 @@
+import copy
+import importlib.util
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlparse
+
+from video_ids import video_key
+
+
+# Signed media URLs are treated as expired this many seconds early, so a
+# download does not start on a URL that runs out halfway through.
+URL_EXPIRY_MARGIN = 300
+
+
+class DownloadCancelledError(Exception):
+    pass
+
+
+def media_urls_fresh(info, margin=URL_EXPIRY_MARGIN):
+    """False once any signed media URL in info is about to expire.
+
+    Only URLs that say when they expire (YouTube's expire= parameter) are
+    checked; others are trusted for as long as the caller's cache TTL.
+    """
+    formats = info.get('requested_formats') or info.get('formats') or [info]
+    for f in formats:
+        expire = parse_qs(urlparse(f.get('url') or '').query).get('expire')
+        if expire and expire[0].isdigit() and int(expire[0]) - margin < time.time():
+            return False
+    return True
+
+
+class YtDlpEngine:
+    """Runs yt-dlp as a library inside this process.
+
+    One YoutubeDL instance per thread is kept for extraction, so its HTTP
+    session and extractor state survive between URLs while several threads
+    extract side by side, and each URL is extracted only once.
+    The cached info dict is reused for the title, format selection and the
+    download itself. With a metadata_cache, single-video info also survives
+    restarts for as long as its TTL allows.
+    """
+
+    def __init__(self, max_cached=256, metadata_cache=None):
+        self.max_cached = max_cached
+        self.metadata_cache = metadata_cache
+        self._local = threading.local()
+        # Guards self._cache only; extraction runs outside it.
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+
+    @staticmethod
+    def available():
+        return importlib.util.find_spec("yt_dlp") is not None
+
+    def _extractor(self):
+        # A YoutubeDL's params are changed per call, so threads do not share one.
+        ydl = getattr(self._local, "ydl", None)
+        if ydl is None:
+            import yt_dlp
+            ydl = self._local.ydl = yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True, 'skip_download': True})
+        return ydl
+
+    def extract(self, url, flat=False, noplaylist=False):
+        """Returns the unprocessed info dict for url, extracting it on first use.
+
+        With flat=True playlist entries are listed without resolving each video.
+        With noplaylist=True a video URL that also names a playlist gives just
+        the video, as the download's own noplaylist would. A single video gives
+        the same result either way, so it is cached under every key.
+        """
+        key = (url, flat, noplaylist)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and media_urls_fresh(cached):
+                self._cache.move_to_end(key)
+                return cached
+
+        info = None
+        if self.metadata_cache and not flat:
+            info = self.metadata_cache.get(video_key(url), "info")
+            if info is not None and not media_urls_fresh(info):
+                info = None
+        if info is None:
+            ydl = self._extractor()
+            ydl.params['extract_flat'] = 'in_playlist' if flat else False
+            ydl.params['noplaylist'] = noplaylist
+            info = ydl.extract_info(url, download=False, process=flat)
+            if flat or info.get('_type', 'video') == 'video':
+                # Unprocessed playlists hold lazy entry generators; leave those alone.
+                info = ydl.sanitize_info(info)
+            if self.metadata_cache and info.get('_type', 'video') == 'video':
+                self.metadata_cache.put(video_key(url), "info", info)
+                self.metadata_cache.put_info(video_key(url), info)
+
+        with self._lock:
+            self._remember(url, info, key)
+        return info
+
+    def _remember(self, url, info, key):
+        # Caller must hold self._lock.
+        if info.get('_type', 'video') == 'video':
+            for flat in (False, True):
+                for noplaylist in (False, True):
+                    self._cache[(url, flat, noplaylist)] = info
+        else:
+            self._cache[key] = info
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+    def iter_entries(self, url):
+        """Yields {id, title, url} for each playlist entry as the extractor pages through them.
+
+        A separate YoutubeDL is used so that a long listing does not hold up
+        extraction for downloads that have already started.
+        """
+        import yt_dlp
+
+        params = {'quiet': True, 'no_warnings': True, 'skip_download': True, 'extract_flat': 'in_playlist'}
+        with yt_dlp.YoutubeDL(params) as ydl:
+            info = ydl.extract_info(url, download=False, process=False)
+            for _ in range(3):
+                if info.get('_type') not in ('url', 'url_transparent'):
+                    break
+                info = ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+
+            if info.get('_type') != 'playlist':
+                info = ydl.sanitize_info(info)
+                with self._lock:
+                    self._remember(url, info, (url, True, False))
+                if self.metadata_cache:
+                    self.metadata_cache.put(video_key(url), "info", info)
+                    self.metadata_cache.put_info(video_key(url), info)
+                yield {'id': info.get('id'), 'title': info.get('title'), 'url': url}
+                return
+
+            for entry in info.get('entries') or []:
+                if entry:
+                    yield {
+                        'id': entry.get('id'),
+                        'title': entry.get('title'),
+                        'url': entry.get('url') or entry.get('webpage_url')
+                    }
+
+    def get_title(self, url, noplaylist=False):
+        if self.metadata_cache:
+            title = self.metadata_cache.get(video_key(url), "title")
+            if title:
+                return title
+        return self.extract(url, noplaylist=noplaylist).get('title')
+
+    def forget(self, url):
+        with self._lock:
+            for key in [key for key in self._cache if key[0] == url]:
+                del self._cache[key]
+        if self.metadata_cache:
+            self.metadata_cache.invalidate(video_key(url), "info")
+
+    def download(self, url, params, progress_hook=None, cancel_event=None, postprocess_hook=None, on_start=None):
+        """Selects formats from the cached info for url and downloads them.
+
+        on_start is called with the YoutubeDL before it starts. Its params are
+        read again for every chunk, so changing params['ratelimit'] there takes
+        effect on a running download.
+
+        A single video starts from the cached info; playlists and URLs that
+        redirect elsewhere are extracted again by the downloading YoutubeDL,
+        since their unprocessed info holds lazy entry generators.
+
+        Returns the processed info dict. Raises DownloadCancelledError when
+        cancel_event is set mid-download and yt_dlp.utils.DownloadError on failure.
+        """
+        import yt_dlp
+        from yt_dlp.utils import DownloadCancelled
+
+        info = self.extract(url, noplaylist=params.get('noplaylist', False))
+        info = copy.deepcopy(info) if info.get('_type', 'video') == 'video' else None
+
+        def hook(status):
+            if cancel_event is not None and cancel_event.is_set():
+                raise DownloadCancelled()
+            if progress_hook:
+                progress_hook(status)
+
+        params = dict(params, quiet=True, no_warnings=True, noprogress=True, progress_hooks=[hook],
+                      postprocessor_hooks=[postprocess_hook] if postprocess_hook else [])
+        try:
+            with yt_dlp.YoutubeDL(params) as ydl:
+                if on_start:
+                    on_start(ydl)
+                if info is None:
+                    return ydl.extract_info(url, download=True)
+                return ydl.process_ie_result(info, download=True)
+        except DownloadCancelled:
+            raise DownloadCancelledError()